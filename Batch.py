@@ -0,0 +1,149 @@
+# Batch.py - check many Fangless Python files at once
+#
+#   python Batch.py <file|dir|glob> ... [-j N] [--timeout S] [--max-tokens N] ...
+#
+# Every worker process builds one Parser and reuses it for all of its files.
+# One JSON line per file is written to stdout as soon as it is ready, and a
+# throughput summary is written to stderr at the end. The --max-* and
+# --timeout budgets stop a file that would otherwise hold a worker forever.
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_EXTENSIONS = (".py", ".fpy")
+LINE_RE = re.compile(r"line (\d+)")
+COLUMN_RE = re.compile(r"column (\d+)")
+
+_parser = None
+
+
+def collect_files(paths, extensions=DEFAULT_EXTENSIONS):
+    """Expands files, directories (recursively) and glob patterns, in order and without repeats."""
+    seen = set()
+    files = []
+
+    def add(path):
+        if path not in seen:
+            seen.add(path)
+            files.append(path)
+
+    for arg in paths:
+        matches = sorted(glob.glob(arg, recursive=True)) if glob.has_magic(arg) else [arg]
+        for path in matches:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(names):
+                        if name.endswith(extensions):
+                            add(os.path.join(root, name))
+            else:
+                add(path)
+    return files
+
+
+def _init_worker(cache_dir, limits=None):
+    global _parser
+    import Parser
+
+    _parser = Parser.Parser(cache_dir=cache_dir, limits=limits)
+    _parser.build()
+
+
+def _error_entry(msg):
+    m = LINE_RE.search(msg)
+    entry = {"line": int(m.group(1)) if m else None, "message": msg}
+    m = COLUMN_RE.search(msg)
+    if m:
+        entry["column"] = int(m.group(1))
+    return entry
+
+
+def check_source(src, tree=False):
+    """
+    Parses src with the worker's parser and returns its JSON-ready status,
+    token count and errors; with tree=True also the tree, as
+    Parser.tree_entries() rows.
+    """
+    import Parser
+
+    root = _parser.parse(src)
+    errors = [_error_entry(msg) for msg in _parser.lexer.errors + _parser.errors]
+    result = {"status": "error" if errors else "ok", "tokens": _parser.lexer.token_count, "errors": errors}
+    if _parser.stopped is not None:
+        result["stopped"] = _parser.stopped.kind
+    if tree:
+        result["tree"] = list(Parser.tree_entries(root))
+    return result
+
+
+def check_file(path):
+    """Parses one file with the worker's parser and returns its JSON-ready result."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            src = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return {"file": path, "status": "error", "tokens": 0,
+                "errors": [{"line": None, "message": str(e)}]}
+    return {"file": path, **check_source(src)}
+
+
+def run(paths, jobs=None, cache_dir=None, out=sys.stdout, chunksize=8, limits=None):
+    """Checks every file under paths and returns (files, failed, tokens, seconds)."""
+    files = collect_files(paths)
+    failed = tokens = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(cache_dir, limits)) as pool:
+        for result in pool.map(check_file, files, chunksize=chunksize):
+            tokens += result["tokens"]
+            if result["status"] != "ok":
+                failed += 1
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    return len(files), failed, tokens, time.perf_counter() - t0
+
+
+def add_limit_options(ap):
+    """The --timeout and --max-* options of Batch.py (and Service.py)."""
+    ap.add_argument("--timeout", type=float, default=None, help="seconds allowed per file")
+    ap.add_argument("--max-tokens", type=int, default=None)
+    ap.add_argument("--max-nodes", type=int, default=None)
+    ap.add_argument("--max-depth", type=int, default=None, help="nested brackets")
+    ap.add_argument("--max-indent", type=int, default=None, help="nested blocks")
+
+
+def limits_from(args):
+    """A Parser.Limits from the options of add_limit_options(), or None if none were given."""
+    import Parser
+
+    if all(v is None for v in (args.timeout, args.max_tokens, args.max_nodes, args.max_depth, args.max_indent)):
+        return None
+    return Parser.Limits(tokens=args.max_tokens, nodes=args.max_nodes, depth=args.max_depth,
+                         indent=args.max_indent, seconds=args.timeout)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check many Fangless Python files in parallel")
+    ap.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    ap.add_argument("--cache-dir", default=None, help="table cache directory")
+    add_limit_options(ap)
+    args = ap.parse_args(argv)
+
+    # build the tables once up front so workers only ever load them
+    import Parser
+    Parser.Parser(cache_dir=args.cache_dir).build()
+
+    files, failed, tokens, seconds = run(args.paths, args.jobs, args.cache_dir, limits=limits_from(args))
+    seconds = max(seconds, 1e-9)
+    print(f"{files} files ({failed} with errors), {tokens} tokens in {seconds:.2f}s: "
+          f"{files / seconds:.1f} files/sec, {tokens / seconds:.0f} tokens/sec", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1806 @@
+# Benchmark.py - small performance checks for the lexer and parser
+#
+#   python Benchmark.py startup [--runs N]
+#   python Benchmark.py threads [--files N] [--threads N]
+#   python Benchmark.py memory [--functions N]
+#   python Benchmark.py scaling [--sizes 1000,10000,100000]
+#   python Benchmark.py incremental [--functions N] [--p50-ms MS] [--p99-ms MS] [--sessions N]
+#   python Benchmark.py serialize [--functions N]
+#   python Benchmark.py tokens [--copies N]
+#   python Benchmark.py scanner [--mutations N] [--functions N]
+#   python Benchmark.py recovery [--mutations N] [--copies 1,10,100]
+#   python Benchmark.py fold [--functions N]
+#   python Benchmark.py vm [--n N] [--runs N]
+#   python Benchmark.py interp [--n N] [--runs N]
+#   python Benchmark.py symbols [--sizes 100,1000,10000]
+#   python Benchmark.py profile [--functions N] [--runs N]
+#   python Benchmark.py suite [--size N] [--seed S] [--out FILE] [--baseline FILE]
+#   python Benchmark.py bigfile [--mb N] [--cap-mb N] [--chunk-kb N]
+#   python Benchmark.py limits [--functions N] [--runs N]
+#   python Benchmark.py visitor [--copies N] [--depth N] [--runs N]
+#   python Benchmark.py structure [--mutations N] [--functions N] [--runs N]
+#   python Benchmark.py service [--clients N] [--requests N] [--workers N] [--tcp]
+import argparse
+import asyncio
+import contextlib
+import datetime
+import gc
+import json
+import os
+import re
+import shutil
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = ("Prueba.py", "Prueba3.py", "Prueba4.py")
+
+STARTUP_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import Parser
+p = Parser.Parser(cache_dir=%r)
+p.build()
+print(time.perf_counter() - t0)
+"""
+
+
+def _timed_build(cache_dir):
+    """Runs import + Parser.build() in a fresh interpreter and returns its seconds."""
+    out = subprocess.run([sys.executable, "-c", STARTUP_SNIPPET % cache_dir], cwd=HERE,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _report(name, samples):
+    print(f"{name:8} mean={statistics.mean(samples) * 1000:8.2f} ms  "
+          f"min={min(samples) * 1000:8.2f} ms  runs={len(samples)}")
+
+
+def bench_startup(args):
+    """Cold start (empty table cache) against warm start (cached tables)."""
+    cold, warm = [], []
+    for _ in range(args.runs):
+        cache_dir = tempfile.mkdtemp(prefix="fangless-bench-")
+        try:
+            cold.append(_timed_build(cache_dir))
+            warm.append(_timed_build(cache_dir))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    _report("cold", cold)
+    _report("warm", warm)
+    print(f"speedup  {statistics.mean(cold) / statistics.mean(warm):.1f}x")
+
+
+def sample_corpus(n):
+    """
+    n sources built from the sample programs. Every copy renames the
+    functions so that no two files produce the same tree.
+    """
+    texts = []
+    for name in SAMPLES:
+        with open(os.path.join(HERE, name), "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    corpus = []
+    for i in range(n):
+        src = texts[i % len(texts)]
+        for fn in ("fibonacci", "random_operation", "factorial", "map_ex", "string_ex"):
+            src = src.replace(fn, f"{fn}_{i}")
+        corpus.append(src)
+    return corpus
+
+
+def _parse_all(parser, sources):
+    results = []
+    for src in sources:
+        ast = parser.parse(src)
+        results.append((repr(ast), list(parser.errors), list(parser.lexer.errors)))
+    return results
+
+
+def bench_threads(args):
+    """
+    Stress test for reentrancy: every thread owns a Parser, all of them parse
+    the corpus at once, and the results must match a serial run exactly.
+    """
+    import Parser
+
+    corpus = sample_corpus(args.files)
+    local = threading.local()
+
+    def parse_one(src):
+        if not hasattr(local, "parser"):
+            local.parser = Parser.Parser()
+            local.parser.build()
+        return _parse_all(local.parser, [src])[0]
+
+    serial_parser = Parser.Parser()
+    serial_parser.build()
+    t0 = time.perf_counter()
+    expected = _parse_all(serial_parser, corpus)
+    serial = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        got = list(pool.map(parse_one, corpus))
+    threaded = time.perf_counter() - t0
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, got)) if a != b]
+    print(f"files={len(corpus)} threads={args.threads} serial={serial:.3f}s threaded={threaded:.3f}s")
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} results differ from the serial run (first: file {mismatches[0]})")
+        sys.exit(1)
+    print("OK: threaded ASTs and errors match the serial run")
+
+
+def synthetic_module(functions):
+    """A large generated module: many small functions plus calls to them."""
+    parts = []
+    for i in range(functions):
+        parts.append(
+            f"def func_{i}(a, b=2):\n"
+            f"    total = a * b + {i}\n"
+            f"    items = [a, b, total, \"name_{i % 50}\"]\n"
+            f"    if total > {i % 7} and a != b:\n"
+            f"        total = total - items[0]\n"
+            f"    for x in items:\n"
+            f"        print(x)\n"
+            f"    return total\n\n")
+    parts.extend(f"print(func_{i}({i}))\n" for i in range(functions))
+    return "".join(parts)
+
+
+def _retained(build):
+    """Runs build() and returns (result, bytes it still holds once it returns)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+class _DictNode:
+    """The old Node layout (instance __dict__, one list per node) for comparison."""
+
+    def __init__(self, type_, value=None, children=None, start=None, end=None):
+        self.type = type_
+        self.value = value
+        self.children = children or []
+        self.start = start
+        self.end = end
+
+
+def _as_dict_nodes(root):
+    import Parser
+
+    out = {}
+    stack = [(root, False)]
+    while stack:
+        node, done = stack.pop()
+        if not isinstance(node, Parser.Node):
+            continue
+        if done:
+            out[id(node)] = _DictNode(node.type, node.value,
+                                      [out.pop(id(c)) if isinstance(c, Parser.Node) else c for c in node.children],
+                                      node.start, node.end)
+        else:
+            stack.append((node, True))
+            stack.extend((c, False) for c in node.children)
+    return out[id(root)]
+
+
+def bench_memory(args):
+    """AST memory: old dict-based nodes, __slots__ nodes and the flat encoding, and how shared the names are."""
+    import FlatAST
+    import Parser
+
+    src = synthetic_module(args.functions)
+    parser = Parser.Parser()
+    parser.build()
+    ast, slots_bytes = _retained(lambda: parser.parse(src))
+    _, dict_bytes = _retained(lambda: _as_dict_nodes(ast))
+    flat, flat_bytes = _retained(lambda: FlatAST.FlatAST.from_node(ast))
+    assert repr(flat.to_node()) == repr(ast), "flat encoding does not round-trip"
+
+    print(f"source        {len(src.encode('utf-8')):>12,} bytes  ({len(flat):,} nodes)")
+    print(f"dict nodes    {dict_bytes:>12,} bytes")
+    print(f"slots nodes   {slots_bytes:>12,} bytes")
+    print(f"flat encoding {flat_bytes:>12,} bytes  (columns {flat.nbytes():,}, {len(flat.constants):,} constants)")
+    strings = [node.value for node in _tree_nodes(ast) if isinstance(node.value, str)]
+    print(f"string values {len(strings):>12,}        ({len({id(s) for s in strings}):,} objects, "
+          f"{len(set(strings)):,} distinct)")
+
+
+SCALING_SHAPES = {
+    "statements": lambda n: "".join(f"x_{i % 100} = {i}\n" for i in range(n)),
+    "list": lambda n: "l = [" + ", ".join(str(i) for i in range(n)) + "]\n",
+    "dict": lambda n: "d = {" + ", ".join(f"{i}: 'v'" for i in range(n)) + "}\n",
+    "set": lambda n: "s = {" + ", ".join(str(i) for i in range(n)) + "}\n",
+    "arguments": lambda n: "f(" + ", ".join(str(i) for i in range(n)) + ")\n",
+}
+
+
+def bench_scaling(args):
+    """
+    Parse time for growing sequences. Every step multiplies the size by 10,
+    so linear growth keeps the per-element time roughly flat.
+    """
+    import Parser
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    parser = Parser.Parser()
+    parser.build()
+    failed = False
+    for shape, make in SCALING_SHAPES.items():
+        per_item = []
+        for n in sizes:
+            src = make(n)
+            t0 = time.perf_counter()
+            ast = parser.parse(src)
+            elapsed = time.perf_counter() - t0
+            assert ast is not None and not parser.errors, f"{shape} x {n} did not parse"
+            per_item.append(elapsed / n)
+            print(f"{shape:10} n={n:>7}  {elapsed:8.3f}s  {elapsed / n * 1e6:7.2f} us/item")
+        growth = per_item[-1] / per_item[0]
+        if growth > args.max_growth:
+            print(f"FAIL: {shape} per-item time grew {growth:.1f}x from n={sizes[0]} to n={sizes[-1]}")
+            failed = True
+    if failed:
+        sys.exit(1)
+    print("OK: parse time grows linearly")
+
+
+def recorded_edits(src, seed=7):
+    """
+    A replayable editing session on src as (offset, deleted, inserted) edits:
+    typing new lines into function bodies and at the top level one key at a
+    time, backspacing over part of them, and a few pastes and cuts.
+    """
+    import random
+
+    rnd = random.Random(seed)
+    text = src
+    edits = []
+
+    def apply(offset, deleted, inserted):
+        nonlocal text
+        edits.append((offset, deleted, inserted))
+        text = text[:offset] + inserted + text[offset + deleted:]
+
+    for n in range(40):
+        anchor = "    return total\n" if n % 4 else "print(func_"
+        positions = [m.start() for m in re.finditer(re.escape(anchor), text)]
+        pos = rnd.choice(positions)
+        typed = "    extra = total * 2\n" if n % 4 else "result = func_1(2)\n"
+        for c in typed:
+            apply(pos, 0, c)
+            pos += 1
+        if n % 5 == 0:
+            for _ in range(6):
+                pos -= 1
+                apply(pos, 1, "")
+            apply(pos, 0, typed[-6:])
+            pos += 6
+        if n % 7 == 0:
+            apply(pos - len(typed), len(typed), "")
+    return edits, text
+
+
+# what broken_edits types: pieces that leave code half written
+BROKEN_PIECES = (":", "(", ")", "[", "]", "    ", "else:", "elif b:", "if a:", "\n", "\n    ",
+                 "x", " = ", "return 2", "def f():\n", '"', "'", "#")
+
+
+def broken_edits(src, steps, seed):
+    """
+    A random editing session on src that goes through broken states:
+    pieces of code typed anywhere and a few characters deleted here and there.
+    """
+    import random
+
+    rnd = random.Random(seed)
+    size = len(src)
+    edits = []
+    for _ in range(steps):
+        offset = rnd.randrange(size + 1)
+        if rnd.random() < 0.35 and size:
+            deleted = min(rnd.randrange(1, 6), size - offset)
+            inserted = ""
+        else:
+            deleted = 0
+            inserted = rnd.choice(BROKEN_PIECES)
+        edits.append((offset, deleted, inserted))
+        size += len(inserted) - deleted
+    return edits
+
+
+def _differs(doc, text, full_parser):
+    """How doc differs from a full parse of text ("" when it doesn't)."""
+    import Parser
+
+    full = full_parser.parse(text)
+    if full is None:
+        # yacc gave up; the incremental tree is an empty module then
+        full = Parser.Node("module", None, [])
+    if doc.text != text:
+        return "the text differs"
+    if repr(doc.tree) != repr(full):
+        return "the tree differs"
+    if sorted(doc.errors) != sorted(full_parser.lexer.errors + full_parser.errors):
+        return "the errors differ"
+    return ""
+
+
+def bench_incremental(args):
+    """
+    Replays an editing session on a ~10k line file, checks the tree against
+    a full parse every --check-every edits and at the end, and fails when
+    the p50 or p99 time per edit is over --p50-ms or --p99-ms. Then checks
+    --sessions random sessions of broken edits on Prueba3.py against a
+    full parse after every edit, and indenting the last line of a file
+    with no newline at its end.
+    """
+    import Incremental
+    import Parser
+
+    src = synthetic_module(args.functions)
+    parser = Parser.Parser(backend="scan")
+    parser.build()
+    full_parser = Parser.Parser(backend="scan")
+    full_parser.build()
+    edits, final = recorded_edits(src)
+    t0 = time.perf_counter()
+    doc = Incremental.IncrementalParser(src, parser)
+    initial = time.perf_counter() - t0
+
+    failures = []
+    times = []
+    text = src
+    for n, (offset, deleted, inserted) in enumerate(edits, 1):
+        t0 = time.perf_counter()
+        doc.edit(offset, deleted, inserted)
+        times.append(time.perf_counter() - t0)
+        text = text[:offset] + inserted + text[offset + deleted:]
+        if n % args.check_every == 0 or n == len(edits):
+            differs = _differs(doc, text, full_parser)
+            if differs:
+                failures.append(f"after edit {n} {differs} from a full parse")
+
+    t0 = time.perf_counter()
+    full_parser.parse(final)
+    full_time = time.perf_counter() - t0
+
+    p50, p99 = _percentile(times, 50), _percentile(times, 99)
+    print(f"document: {src.count(chr(10)):,} lines, {len(edits)} edits")
+    print(f"initial parse {initial * 1000:9.2f} ms   full reparse {full_time * 1000:9.2f} ms")
+    print(f"per edit: mean {statistics.mean(times) * 1000:.3f} ms  p50 {p50 * 1000:.3f} ms  "
+          f"p99 {p99 * 1000:.3f} ms  max {max(times) * 1000:.3f} ms")
+    if p50 * 1000 > args.p50_ms:
+        failures.append(f"p50 {p50 * 1000:.3f} ms is over the {args.p50_ms} ms budget")
+    if p99 * 1000 > args.p99_ms:
+        failures.append(f"p99 {p99 * 1000:.3f} ms is over the {args.p99_ms} ms budget")
+
+    with open(os.path.join(HERE, "Prueba3.py"), "r", encoding="utf-8") as f:
+        sample = f.read()
+    broken = 0
+    for seed in range(args.sessions):
+        doc = Incremental.IncrementalParser(sample, parser)
+        text = sample
+        for n, (offset, deleted, inserted) in enumerate(broken_edits(sample, args.steps, seed), 1):
+            doc.edit(offset, deleted, inserted)
+            text = text[:offset] + inserted + text[offset + deleted:]
+            differs = _differs(doc, text, full_parser)
+            if differs:
+                broken += 1
+                failures.append(f"broken session {seed}: after edit {n} {differs} from a full parse")
+                break
+    print(f"broken sessions: {args.sessions - broken} of {args.sessions} match a full parse "
+          f"after each of {args.steps} edits")
+
+    # the last line has no newline, so it is on the first line of its chunk
+    text = "if a:\n    b = 1\nc = 2"
+    doc = Incremental.IncrementalParser(text, parser)
+    doc.edit(text.index("c"), 0, "    ")
+    differs = _differs(doc, text.replace("c", "    c"), full_parser)
+    if differs:
+        failures.append(f"indenting the last line: {differs} from a full parse")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print(f"OK: incremental tree and errors match a full parse, p50/p99 within {args.p50_ms}/{args.p99_ms} ms")
+
+
+def _best(fn, runs):
+    """Best wall time of fn() over runs calls, and its last result."""
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_serialize(args):
+    """Binary AST format against pickle and against parsing again."""
+    import pickle
+
+    import BinaryAST
+    import Parser
+
+    parser = Parser.Parser()
+    parser.build()
+    with open(os.path.join(HERE, "Prueba3.py"), "r", encoding="utf-8") as f:
+        sample = parser.parse(f.read())
+    assert repr(BinaryAST.loads(BinaryAST.dumps(sample))) == repr(sample), "Prueba3.py does not round-trip"
+    assert BinaryAST.loads(BinaryAST.dumps(None)) is None
+
+    src = synthetic_module(args.functions)
+    parse_time, ast = _best(lambda: parser.parse(src), 1)
+    dump_time, blob = _best(lambda: BinaryAST.dumps(ast), args.runs)
+    load_time, loaded = _best(lambda: BinaryAST.loads(blob), args.runs)
+    assert repr(loaded) == repr(ast), "synthetic module does not round-trip"
+    pdump_time, pblob = _best(lambda: pickle.dumps(ast, pickle.HIGHEST_PROTOCOL), args.runs)
+    pload_time, _ = _best(lambda: pickle.loads(pblob), args.runs)
+
+    with tempfile.NamedTemporaryFile(suffix=".ast", delete=False) as f:
+        f.write(blob)
+    try:
+        with BinaryAST.MappedAST(f.name) as mapped:
+            walk_time, visited = _best(lambda: sum(1 for _ in mapped.walk()), args.runs)
+    finally:
+        os.remove(f.name)
+
+    print(f"source          {len(src.encode('utf-8')):>11,} bytes   parse {parse_time * 1000:9.1f} ms")
+    print(f"binary AST      {len(blob):>11,} bytes   dump {dump_time * 1000:9.1f} ms   load {load_time * 1000:9.1f} ms")
+    print(f"pickle          {len(pblob):>11,} bytes   dump {pdump_time * 1000:9.1f} ms   load {pload_time * 1000:9.1f} ms")
+    print(f"mmap walk       {visited:>11,} nodes   {walk_time * 1000:9.1f} ms")
+    print(f"load is {parse_time / load_time:.1f}x faster than parsing again")
+
+
+def noisy_source(copies):
+    """The mangled Prueba.py sample repeated, with illegal characters sprinkled in."""
+    with open(os.path.join(HERE, "Prueba.py"), "r", encoding="utf-8") as f:
+        text = f.read()
+    noisy = text.replace("(", "$(").replace(" = ", " @= ").replace("return", "`return")
+    return (noisy + "\n") * copies
+
+
+def bench_tokens(args):
+    """
+    Tokens/sec of the quiet stream() API against the old verbose path, which
+    printed every diagnostic and dumped every token before parsing.
+    """
+    import Lexer
+
+    src = noisy_source(args.copies)
+    quiet = Lexer.IndentLexer()
+    quiet_time, count = _best(lambda: sum(1 for _ in quiet.stream(src)), args.runs)
+
+    def verbose_run():
+        lexer = Lexer.IndentLexer(diagnostics=print)
+        n = 0
+        for tok in lexer.stream(src):
+            print(f"{tok.lineno:3} {tok.type:12} {repr(tok.value)}")
+            n += 1
+        return n
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        verbose_time, _ = _best(verbose_run, args.runs)
+
+    print(f"{count:,} tokens, {len(quiet.errors):,} diagnostics")
+    print(f"quiet    {count / quiet_time:12,.0f} tokens/sec")
+    print(f"verbose  {count / verbose_time:12,.0f} tokens/sec")
+    print(f"quiet path is {verbose_time / quiet_time:.1f}x faster")
+
+
+def mutated_sources(n, seed=11):
+    """n copies of Prueba3.py with random characters inserted, deleted or replaced."""
+    import random
+
+    rnd = random.Random(seed)
+    with open(os.path.join(HERE, "Prueba3.py"), "r", encoding="utf-8") as f:
+        base = f.read()
+    alphabet = " \t\n:()[]{}#'\"=+-*/<>!,.$@0123456789abcxyz"
+    out = []
+    for _ in range(n):
+        text = list(base)
+        for _ in range(rnd.randint(1, 8)):
+            i = rnd.randrange(len(text))
+            op = rnd.randrange(3)
+            if op == 0:
+                text.insert(i, rnd.choice(alphabet))
+            elif op == 1:
+                del text[i]
+            else:
+                text[i] = rnd.choice(alphabet)
+        out.append("".join(text))
+    return out
+
+
+def _token_tuples(lexer, src):
+    return [(t.type, t.value, t.lineno, t.lexpos, t.endlexpos) for t in lexer.stream(src)], list(lexer.errors)
+
+
+def bench_scanner(args):
+    """Differential check of Scanner.ScanLexer against the PLY lexer, then tokens/sec of both."""
+    import Lexer
+    import Scanner
+
+    ply_lexer = Lexer.IndentLexer()
+    scan_lexer = Scanner.ScanLexer()
+
+    corpus = []
+    for name in SAMPLES:
+        with open(os.path.join(HERE, name), "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+    corpus += [synthetic_module(50), noisy_source(3), "", "x", "a\r\nb"]
+    corpus += [make(200) for make in SCALING_SHAPES.values()]
+    corpus += mutated_sources(args.mutations)
+    mismatches = [i for i, src in enumerate(corpus)
+                  if _token_tuples(ply_lexer, src) != _token_tuples(scan_lexer, src)]
+    print(f"differential: {len(corpus)} sources, {len(mismatches)} mismatches")
+
+    src = synthetic_module(args.functions)
+    ply_time, count = _best(lambda: sum(1 for _ in ply_lexer.stream(src)), args.runs)
+    scan_time, _ = _best(lambda: sum(1 for _ in scan_lexer.stream(src)), args.runs)
+    print(f"ply      {count / ply_time:12,.0f} tokens/sec")
+    print(f"scan     {count / scan_time:12,.0f} tokens/sec   ({ply_time / scan_time:.1f}x)")
+    if mismatches:
+        print(f"FAIL: first mismatch in corpus entry {mismatches[0]}")
+        sys.exit(1)
+
+
+def bench_recovery(args):
+    """
+    Error recovery on broken input: mutated copies of Prueba3.py (errors
+    found, statements kept, time against the clean file), then the mangled
+    Prueba.py repeated more and more times, where the time per error must
+    stay flat.
+    """
+    import FlatAST
+    import Parser
+
+    parser = Parser.Parser()
+    parser.build()
+    with open(os.path.join(HERE, "Prueba3.py"), "r", encoding="utf-8") as f:
+        clean = f.read()
+    clean_time, tree = _best(lambda: parser.parse(clean), args.runs)
+    clean_nodes = len(FlatAST.FlatAST.from_node(tree))
+
+    errors = kept = no_tree = 0
+    worst = 0.0
+    for src in mutated_sources(args.mutations):
+        t0 = time.perf_counter()
+        tree = parser.parse(src)
+        worst = max(worst, time.perf_counter() - t0)
+        errors += len(parser.errors)
+        if tree is None:
+            no_tree += 1
+        else:
+            kept += len(FlatAST.FlatAST.from_node(tree))
+    print(f"mutated Prueba3.py  {args.mutations} sources, {errors} syntax errors, "
+          f"{no_tree} without a tree, {kept / max(args.mutations, 1):.0f} of {clean_nodes} nodes kept on average")
+    print(f"slowest parse       {worst * 1e3:.2f} ms ({worst / clean_time:.1f}x the clean file)")
+
+    with open(os.path.join(HERE, "Prueba.py"), "r", encoding="utf-8") as f:
+        broken = f.read() + "\n"
+    per_error = []
+    for copies in [int(n) for n in args.copies.split(",")]:
+        src = broken * copies
+        elapsed, tree = _best(lambda: parser.parse(src), args.runs)
+        n = len(parser.errors) + len(parser.lexer.errors)
+        per_error.append(elapsed / max(n, 1))
+        print(f"Prueba.py x{copies:<5} {n:6} errors  {elapsed * 1e3:9.2f} ms  "
+              f"{per_error[-1] * 1e6:7.1f} us/error  tree: {tree is not None}")
+    growth = per_error[-1] / per_error[0]
+    if growth > args.max_growth:
+        print(f"FAIL: time per error grew {growth:.1f}x")
+        sys.exit(1)
+    print("OK: time per error stays bounded")
+
+
+# expressions that must fold to the value Python gives them, and ones that
+# must stay as they are (they raise at runtime, or are over the size limits)
+FOLDS = (
+    "2 * 3 + 1", "7 // 2 - 7 % 3", "2 ** 10", "-(-5)", "1.5 * 4", "10 / 4",
+    '"profe"[2:4]', '"profe"[1]', '"profe"[-1]', '"ab" * 3', '"a" + "b"', '"abc"[:2] + "abc"[2:]',
+    "[1, 2] + [3]", "(1, 2) * 2", "[0] * 3", "[1, 2, 3][1]", "3 in (1, 2, 3)", '"b" in "abc"',
+    "1 < 2", "2 >= 3", '"a" == "a"', "[1] != [1]", "not []", "not 0", "True and 0", "0 or 5",
+    "None or [1]", "False and 1 / 0",
+)
+KEEPS = (
+    "1 / 0", "5 // 0", "5 % 0", '"a" + 1', "[1][5]", '"abc"[10]', '1 < "a"', "-[1]",
+    "2 ** 1000", '"a" * 100000', "x * 1", "x + 0",
+)
+
+
+def bench_fold(args):
+    """
+    Checks Optimizer.fold_constants against Python on FOLDS and KEEPS and on
+    the samples (a second pass must find nothing left), then times it.
+    """
+    import FlatAST
+    import Optimizer
+    import Parser
+
+    parser = Parser.Parser()
+    parser.build()
+    failures = []
+    for expr in FOLDS + KEEPS:
+        tree = parser.parse(f"r = {expr}\n")
+        original = tree.children[0].children[0]
+        tree, _ = Optimizer.fold_constants(tree)
+        result = tree.children[0].children[0]
+        if expr in KEEPS:
+            if result is not original:
+                failures.append(f"{expr}: folded, should be kept")
+            continue
+        value, expected = Optimizer._const(result), eval(expr, {})
+        if type(value) is not type(expected) or value != expected:
+            failures.append(f"{expr}: folded to {value!r}, Python gives {expected!r}")
+
+    for name in SAMPLES:
+        with open(os.path.join(HERE, name), "r", encoding="utf-8") as f:
+            src = f.read()
+        tree = parser.parse(src)
+        before = len(FlatAST.FlatAST.from_node(tree))
+        tree, folded = Optimizer.fold_constants(tree)
+        after = len(FlatAST.FlatAST.from_node(tree))
+        _, again = Optimizer.fold_constants(tree)
+        print(f"{name:12} {folded:4} folds  {before:5} -> {after:5} nodes")
+        if again:
+            failures.append(f"{name}: a second pass folded {again} more nodes")
+
+    src = synthetic_module(args.functions)
+    tree = parser.parse(src)
+    nodes = len(FlatAST.FlatAST.from_node(tree))
+    t0 = time.perf_counter()
+    _, folded = Optimizer.fold_constants(tree)
+    elapsed = time.perf_counter() - t0
+    print(f"synthetic    {folded:4} folds  {nodes / elapsed:,.0f} nodes/sec")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print(f"OK: {len(FOLDS) + len(KEEPS)} expressions match Python")
+
+
+# runs in the VM and in CPython, printed output must match
+VM_PROGRAM = """
+def make(n):
+    def add(x):
+        return x + n
+    def twice(y):
+        return add(add(y))
+    return twice
+
+def count(items, seen=None):
+    total = 0
+    for item in items:
+        if item in [1, 3] or not item:
+            total = total + 1
+        elif item == 'b':
+            total = total - 1
+    return total
+
+f = make(10)
+print(f(1), count([0, 1, 2, 3, 'b']), count('abc'))
+print(-3 ** 2, 2 ** 3 ** 2, 7 // 2, -7 % 3, 1 / 4, 2 > 1 and 'y' or 'n')
+print({'a': [1, 2][1:], 'b': (1,)}, {3, 3}, 'abcdef'[1:-1], len('x' * 5))
+for k in {'x': 1, 'y': 2}.keys():
+    print(k)
+"""
+
+
+def _captured(fn):
+    """What fn() prints to stdout."""
+    import io
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        fn()
+    return out.getvalue()
+
+
+def bench_vm(args):
+    """
+    Runs Prueba3.py and VM_PROGRAM in the VM and checks the output against
+    CPython, then times fibonacci and fibonacci_d from Prueba3.py.
+    """
+    import Bytecode
+    import Parser
+    import VM
+
+    parser = Parser.Parser()
+    parser.build()
+    failures = []
+    path = os.path.join(HERE, "Prueba3.py")
+    with open(path, "r", encoding="utf-8") as f:
+        prueba3 = f.read()
+    for name, src in (("Prueba3.py", prueba3), ("VM_PROGRAM", VM_PROGRAM)):
+        expected = subprocess.run([sys.executable, "-c", src], capture_output=True, text=True).stdout
+        t0 = time.perf_counter()
+        code = Bytecode.compile_tree(parser.parse(src))
+        compile_time = time.perf_counter() - t0
+        got = _captured(lambda: VM.run(code))
+        print(f"{name:12} parsed and compiled in {compile_time * 1000:.2f} ms, {len(got.splitlines())} lines of output")
+        if got != expected:
+            failures.append(f"{name}: VM output differs from CPython")
+
+    # equal constants share a slot, but 0.0 and -0.0 (or 1 and True) aren't the same
+    compiler = Bytecode.Compiler()
+    compiler.code, compiler._consts = Bytecode.Code("<consts>"), {}
+    slots = [compiler.const(v) for v in (0.0, -0.0, 1, True, 1.0, 0.0)]
+    if slots != [0, 1, 2, 3, 4, 0]:
+        failures.append(f"constants 0.0, -0.0, 1, True, 1.0, 0.0 got slots {slots}")
+
+    vm_globals = {}
+    _captured(lambda: VM.run(Bytecode.compile_tree(parser.parse(prueba3)), vm_globals))
+    py_globals = {}
+    _captured(lambda: exec(compile(prueba3, path, "exec"), py_globals))
+    # fibonacci_d is a short loop even for big n, so it gets a big n and repeats
+    for fname, n, repeat in (("fibonacci", args.n, 1), ("fibonacci_d", 10 ** 100, 1000)):
+        vm_f, py_f = vm_globals[fname], py_globals[fname]
+        vm_time, vm_result = _best(lambda: [vm_f(n) for _ in range(repeat)][-1], args.runs)
+        py_time, py_result = _best(lambda: [py_f(n) for _ in range(repeat)][-1], args.runs)
+        if vm_result != py_result:
+            failures.append(f"{fname}: VM gives {vm_result}, CPython {py_result}")
+        label = f"{fname}({args.n})" if repeat == 1 else f"{fname}(10**100) x{repeat}"
+        print(f"{label:24} VM {vm_time * 1000:9.2f} ms   CPython {py_time * 1000:8.2f} ms   "
+              f"({vm_time / py_time:.1f}x)")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: VM output matches CPython")
+
+
+class _Return(Exception):
+    pass
+
+
+class NaiveWalker(object):
+    """
+    The baseline for bench_interp: evaluates nodes by looking up a method
+    named after node.type on every visit, with dict environments. Enough
+    of the language for fibonacci; define() only runs the defs of a module.
+    """
+
+    def __init__(self):
+        import Interpreter
+        import VM
+
+        self.globals = {}
+        self.binary = Interpreter.BINARY
+        self.comparison = Interpreter.COMPARISON
+        self.builtins = VM.BUILTINS
+
+    def define(self, tree):
+        for stmt in tree.children:
+            if getattr(stmt, "type", None) == "function_def":
+                self.s_function_def(stmt, None)
+
+    def exec_block(self, suite, env):
+        for stmt in suite.children:
+            if not isinstance(stmt, str):
+                getattr(self, "s_" + stmt.type)(stmt, env)
+
+    def eval(self, node, env):
+        return getattr(self, "e_" + node.type)(node, env)
+
+    def s_function_def(self, node, env):
+        params, body = node.children
+
+        def function(*args):
+            try:
+                self.exec_block(body, dict(zip([p.value for p in params.children], args)))
+            except _Return as r:
+                return r.args[0]
+        self.globals[node.value] = function
+
+    def s_if(self, node, env):
+        clauses = [(node.children[0], node.children[1])]
+        orelse = None
+        for extra in node.children[2:]:
+            if isinstance(extra, list):
+                clauses.extend((e.children[0], e.children[1]) for e in extra)
+            else:
+                orelse = extra
+        for cond, body in clauses:
+            if self.eval(cond, env):
+                return self.exec_block(body, env)
+        if orelse is not None:
+            self.exec_block(orelse, env)
+
+    def s_return(self, node, env):
+        raise _Return(self.eval(node.children[0], env) if node.children else None)
+
+    def s_expression_stmt(self, node, env):
+        self.eval(node.children[0], env)
+
+    def e_identifier(self, node, env):
+        if env is not None and node.value in env:
+            return env[node.value]
+        if node.value in self.globals:
+            return self.globals[node.value]
+        return self.builtins[node.value]
+
+    def e_number(self, node, env):
+        return node.value
+
+    def e_binary_op(self, node, env):
+        return self.binary[node.value](self.eval(node.children[0], env), self.eval(node.children[1], env))
+
+    def e_comparison(self, node, env):
+        return self.comparison[node.value](self.eval(node.children[0], env), self.eval(node.children[1], env))
+
+    def e_boolean_op(self, node, env):
+        left = self.eval(node.children[0], env)
+        if node.value.lower() == "and":
+            return left and self.eval(node.children[1], env)
+        return left or self.eval(node.children[1], env)
+
+    def e_call(self, node, env):
+        return self.e_identifier(node, env)(*[self.eval(a, env) for a in node.children])
+
+
+def bench_interp(args):
+    """
+    Closure interpreter against a naive string-dispatch walker, the VM and
+    CPython on Prueba3.py's recursive fibonacci, after checking that the
+    interpreter prints the same as CPython.
+    """
+    import Bytecode
+    import Interpreter
+    import Parser
+    import VM
+
+    parser = Parser.Parser()
+    parser.build()
+    failures = []
+    path = os.path.join(HERE, "Prueba3.py")
+    with open(path, "r", encoding="utf-8") as f:
+        prueba3 = f.read()
+    for name, src in (("Prueba3.py", prueba3), ("VM_PROGRAM", VM_PROGRAM)):
+        expected = subprocess.run([sys.executable, "-c", src], capture_output=True, text=True).stdout
+        if _captured(lambda: Interpreter.run(parser.parse(src))) != expected:
+            failures.append(f"{name}: interpreter output differs from CPython")
+
+    tree = parser.parse(prueba3)
+    walker = NaiveWalker()
+    walker.define(tree)
+    interp_globals = {}
+    _captured(lambda: Interpreter.run(tree, interp_globals))
+    vm_globals = {}
+    _captured(lambda: VM.run(Bytecode.compile_tree(tree), vm_globals))
+    py_globals = {}
+    _captured(lambda: exec(compile(prueba3, path, "exec"), py_globals))
+
+    n = args.n
+    times = {}
+    results = set()
+    for label, g in (("naive walker", walker.globals), ("closures", interp_globals),
+                     ("bytecode VM", vm_globals), ("CPython", py_globals)):
+        times[label], result = _best(lambda: g["fibonacci"](n), args.runs)
+        results.add(result)
+    if len(results) != 1:
+        failures.append(f"fibonacci({n}) results differ: {sorted(results)}")
+    for label, seconds in times.items():
+        print(f"fibonacci({n}) {label:13} {seconds * 1000:9.2f} ms   "
+              f"{times['naive walker'] / seconds:5.1f}x the naive walker")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: interpreter output matches CPython")
+
+
+def bench_symbols(args):
+    """
+    Checks Symbols.analyze against Bytecode's scope analysis (same locals,
+    cells and free names in every function) and that its time per node stays flat as
+    the module grows.
+    """
+    import Bytecode
+    import FlatAST
+    import Parser
+    import Symbols
+
+    parser = Parser.Parser()
+    parser.build()
+    failures = []
+    with open(os.path.join(HERE, "Prueba3.py"), "r", encoding="utf-8") as f:
+        sources = [("Prueba3.py", f.read()), ("VM_PROGRAM", VM_PROGRAM), ("synthetic", synthetic_module(50))]
+    for name, src in sources:
+        tree = parser.parse(src)
+        table = Symbols.analyze(tree)
+        expected = Bytecode._scan_scopes(tree)
+        Bytecode._resolve(expected)
+        work = list(expected.children)
+        while work:
+            scope = work.pop()
+            work.extend(scope.children)
+            got = table.scope_of(scope.node)
+            if (set(got.slots) != set(scope.params) | scope.assigned or got.cells != scope.cells
+                    or got.frees != scope.frees):
+                failures.append(f"{name}: scope {scope.node.value} differs from Bytecode's")
+        if table.errors:
+            failures.append(f"{name}: {table.errors[0]}")
+        print(f"{name:12} {len(table.scopes):4} scopes  {len(table.refs):5} names resolved  "
+              f"{len(table.warnings)} warnings")
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    per_node = []
+    for n in sizes:
+        tree = parser.parse(synthetic_module(n))
+        nodes = len(FlatAST.FlatAST.from_node(tree))
+        seconds, table = _best(lambda: Symbols.analyze(tree), 3)
+        per_node.append(seconds / nodes)
+        print(f"functions={n:>6}  {nodes:8,} nodes  {seconds * 1000:8.2f} ms  {nodes / seconds:12,.0f} nodes/sec")
+    growth = per_node[-1] / per_node[0]
+    if growth > args.max_growth:
+        failures.append(f"time per node grew {growth:.1f}x from {sizes[0]} to {sizes[-1]} functions")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: scopes match Bytecode's and the pass is linear")
+
+
+def bench_profile(args):
+    """
+    Parse time with profiling off against calling yacc directly (the cost
+    of the switch), and with profiling on, whose report is printed.
+    """
+    import Parser
+
+    src = synthetic_module(args.functions)
+    plain = Parser.Parser()
+    plain.build()
+    profiled = Parser.Parser(profile=True)
+    profiled.build()
+
+    def direct():
+        plain.errors = []
+        plain._pending = []
+        plain._closed = False
+        plain.lexer.input(src)
+        return plain.parser.parse(lexer=plain.lexer, tokenfunc=plain._token)
+
+    # interleaved so drift hits both alike
+    direct_time = off_time = float("inf")
+    for _ in range(args.runs):
+        direct_time = min(direct_time, _best(direct, 1)[0])
+        off_time = min(off_time, _best(lambda: plain.parse(src), 1)[0])
+    on_time, _ = _best(lambda: profiled.parse(src), 1)
+    overhead = off_time / direct_time - 1
+    print(f"yacc directly      {direct_time * 1000:9.2f} ms")
+    print(f"profiling off      {off_time * 1000:9.2f} ms   ({overhead * 100:+.1f}%)")
+    print(f"profiling on       {on_time * 1000:9.2f} ms   ({on_time / direct_time:.2f}x)")
+    print()
+    sys.stdout.write(profiled.profile.report(top=10))
+    if overhead > args.max_overhead:
+        print(f"FAIL: profiling off costs {overhead * 100:.1f}%")
+        sys.exit(1)
+    print("OK: no cost with profiling off")
+
+
+# metric -> True when bigger is better; what --baseline compares
+SUITE_METRICS = {"lex_ply_tokens_per_sec": True, "lex_scan_tokens_per_sec": True,
+                 "parse_tokens_per_sec": True, "parse_bytes_per_sec": True, "peak_memory_bytes": False}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def _count(iterator):
+    n = 0
+    for _ in iterator:
+        n += 1
+    return n
+
+
+def run_suite(size, seed, runs, startup_runs):
+    """Every Corpus shape through both lexers and the parser, plus Parser.build() startup."""
+    import Corpus
+    import Lexer
+    import Parser
+    import Scanner
+
+    parser = Parser.Parser()
+    parser.build()
+    ply, scan = Lexer.IndentLexer(), Scanner.ScanLexer()
+    results = {
+        "meta": {"commit": _git_commit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "size": size, "seed": seed, "runs": runs},
+        "shapes": {},
+    }
+    for shape, src in Corpus.corpus(size, seed).items():
+        tree = parser.parse(src)
+        if tree is None or parser.errors or parser.lexer.errors:
+            raise SystemExit(f"FAIL: generated {shape} program does not parse: "
+                             f"{(parser.lexer.errors + parser.errors)[:1]}")
+        tokens = _count(ply.stream(src))
+        ply_time, _ = _best(lambda: _count(ply.stream(src)), runs)
+        scan_time, _ = _best(lambda: _count(scan.stream(src)), runs)
+        parse_time, _ = _best(lambda: parser.parse(src), runs)
+        gc.collect()
+        tracemalloc.start()
+        parser.parse(src)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        nbytes = len(src.encode("utf-8"))
+        results["shapes"][shape] = {
+            "bytes": nbytes, "tokens": tokens,
+            "lex_ply_tokens_per_sec": tokens / ply_time,
+            "lex_scan_tokens_per_sec": tokens / scan_time,
+            "parse_tokens_per_sec": tokens / parse_time,
+            "parse_bytes_per_sec": nbytes / parse_time,
+            "peak_memory_bytes": peak,
+        }
+    cold, warm = [], []
+    for _ in range(startup_runs):
+        cache_dir = tempfile.mkdtemp(prefix="fangless-bench-")
+        try:
+            cold.append(_timed_build(cache_dir))
+            warm.append(_timed_build(cache_dir))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    results["startup"] = {"cold_ms": min(cold) * 1000, "warm_ms": min(warm) * 1000}
+    return results
+
+
+def compare_results(old, new, tolerance):
+    """Lines describing every metric of new against old, and the ones that got worse than tolerance."""
+    lines, regressions = [], []
+    pairs = [(f"{shape}.{metric}", old["shapes"].get(shape, {}).get(metric), values[metric], better)
+             for shape, values in new["shapes"].items() for metric, better in SUITE_METRICS.items()]
+    pairs += [(f"startup.{key}", old.get("startup", {}).get(key), value, False)
+              for key, value in new["startup"].items()]
+    for name, before, after, bigger_is_better in pairs:
+        if not before:
+            continue
+        change = after / before - 1
+        worse = -change if bigger_is_better else change
+        line = f"{name:42} {before:14,.1f} -> {after:14,.1f}  {change * 100:+6.1f}%"
+        lines.append(line)
+        if worse > tolerance:
+            regressions.append(line)
+    return lines, regressions
+
+
+def bench_suite(args):
+    """
+    Lex and parse throughput and peak parse memory on every Corpus shape,
+    and Parser.build() startup, saved as JSON. With --baseline, compares
+    against an earlier run (on the same machine) and fails on regressions.
+    """
+    results = run_suite(args.size, args.seed, args.runs, args.startup_runs)
+    print(f"{'shape':10} {'bytes':>9} {'tokens':>8} {'lex ply':>10} {'lex scan':>10} {'parse':>10} {'peak mem':>12}")
+    for shape, r in results["shapes"].items():
+        print(f"{shape:10} {r['bytes']:9,} {r['tokens']:8,} {r['lex_ply_tokens_per_sec']:10,.0f} "
+              f"{r['lex_scan_tokens_per_sec']:10,.0f} {r['parse_tokens_per_sec']:10,.0f} "
+              f"{r['peak_memory_bytes']:12,}")
+    print("(lex and parse in tokens/sec, peak memory in bytes)")
+    startup = results["startup"]
+    print(f"startup    cold {startup['cold_ms']:.1f} ms   warm {startup['warm_ms']:.1f} ms")
+
+    out = args.out or f"bench-{results['meta']['commit'] or 'results'}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print(f"saved {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if (old["meta"]["size"], old["meta"]["seed"]) != (args.size, args.seed):
+            print("WARNING: the baseline used another --size or --seed, so the inputs differ")
+        lines, regressions = compare_results(old, results, args.tolerance)
+        print()
+        print(f"against {args.baseline} (commit {old['meta'].get('commit')}):")
+        for line in lines:
+            print("  " + line)
+        if regressions:
+            print(f"FAIL: {len(regressions)} metrics worse by more than {args.tolerance * 100:.0f}%")
+            sys.exit(1)
+        print("OK: no regressions")
+
+
+def bench_bigfile(args):
+    """
+    Lexes a generated file bigger than --cap-mb with ScanLexer.input_file()
+    and checks that the peak memory stays under the cap. Tokens and trees
+    of a smaller file are first checked against lexing and parsing it as
+    one string, with chunks small enough to cut it almost everywhere.
+    """
+    import io
+    import Corpus
+    import Parser
+    import Scanner
+
+    pieces = list(Corpus.corpus(2000, args.seed).values())
+    tmp = tempfile.mkdtemp(prefix="bigfile-")
+    try:
+        small = os.path.join(tmp, "small.py")
+        src = "".join(pieces) + "if x:\n    y = 1 $ 2\n\n\n  z = 3"
+        with open(small, "w", encoding="utf-8") as f:
+            f.write(src)
+        lexer = Scanner.ScanLexer()
+        expected = _token_tuples(lexer, src)
+        mismatches = []
+        for chunk_size in (1, 7, 4096, args.chunk_kb * 1024):
+            lexer.input_file(small, chunk_size=chunk_size)
+            got = [(t.type, t.value, t.lineno, t.lexpos, t.endlexpos) for t in iter(lexer.token, None)]
+            if (got, list(lexer.errors)) != expected:
+                mismatches.append(chunk_size)
+
+        parser = Parser.Parser(backend="scan")
+        parser.build()
+        whole, chunked = io.StringIO(), io.StringIO()
+        Parser.dump_jsonl(parser.parse(src), whole)
+        errors = parser.lexer.errors + parser.errors
+        Parser.dump_jsonl(parser.parse_file(small, chunk_size=4096), chunked)
+        if whole.getvalue() != chunked.getvalue() or errors != parser.lexer.errors + parser.errors:
+            mismatches.append("parse_file")
+        print(f"chunked vs whole: {len(src):,} chars, chunk sizes 1, 7, 4096 and {args.chunk_kb * 1024}: "
+              f"{len(mismatches)} mismatches")
+
+        big = os.path.join(tmp, "big.py")
+        size = 0
+        with open(big, "w", encoding="utf-8") as f:
+            while size < args.mb * 1024 * 1024:
+                for piece in pieces:
+                    f.write(piece)
+                    size += len(piece)
+        cap = args.cap_mb * 1024 * 1024
+        t0 = time.perf_counter()
+        tracemalloc.start()
+        try:
+            lexer.input_file(big, chunk_size=args.chunk_kb * 1024)
+            count = _count(iter(lexer.token, None))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        seconds = time.perf_counter() - t0
+        print(f"big file: {size / 2 ** 20:.1f} MB, {count:,} tokens in {seconds:.1f} s (traced), "
+              f"peak {peak / 2 ** 20:.2f} MB (cap {args.cap_mb} MB)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if mismatches:
+        print(f"FAIL: chunked input differs with {mismatches[0]}")
+        sys.exit(1)
+    if size <= cap or peak >= cap:
+        print("FAIL: " + ("the file fits in the cap" if size <= cap else "peak memory is over the cap"))
+        sys.exit(1)
+    print("OK: same tokens in chunks, and memory stays under the cap")
+
+
+def bench_limits(args):
+    """
+    Hostile inputs must stop on the right budget, quickly and with the
+    statements before them kept; then parse time with generous limits on
+    against no limits (the cost of leaving them on).
+    """
+    import Parser
+
+    n = args.hostile
+    prefix = "a = 1\nb = 2\n"
+    hostile = [
+        ("tokens", Parser.Limits(tokens=10000), "x = " + " + ".join(["a"] * n) + "\n"),
+        ("depth", Parser.Limits(depth=100), "x = " + "(" * n + "1" + ")" * n + "\n"),
+        ("depth", Parser.Limits(depth=100), "x = " + "[" * n + "]" * n + "\n"),
+        ("nodes", Parser.Limits(nodes=10000), "x = [" + ", ".join(["1"] * n) + "]\n"),
+        ("indent", Parser.Limits(indent=50),
+         "".join("    " * i + "if a:\n" for i in range(200)) + "    " * 200 + "pass\n"),
+        ("seconds", Parser.Limits(seconds=0.1), "x = a + b * 2\n" * (n * 10)),
+    ]
+    failures = []
+    print(f"{'budget':8} {'source':>10} {'stopped':>8} {'ms':>8} {'kept':>5}")
+    for kind, limits, src in hostile:
+        src = prefix + src
+        parser = Parser.Parser(limits=limits)
+        parser.build()
+        t0 = time.perf_counter()
+        tree = parser.parse(src)
+        ms = (time.perf_counter() - t0) * 1000
+        stopped = parser.stopped.kind if parser.stopped is not None else None
+        kept = len(tree.children) if tree is not None else None
+        print(f"{kind:8} {len(src):10,} {stopped or '-':>8} {ms:8.1f} {kept if kept is not None else '-':>5}")
+        if stopped != kind or kept is None or kept < 2:
+            failures.append(f"{kind}: stopped on {stopped}, {kept} statements kept")
+        elif kind == "seconds" and ms > limits.seconds * 1000 * 2 + 50:
+            failures.append(f"seconds: stopped after {ms:.0f} ms")
+
+    src = synthetic_module(args.functions)
+    plain = Parser.Parser()
+    plain.build()
+    limited = Parser.Parser(limits=Parser.Limits(tokens=10 ** 9, nodes=10 ** 9, depth=1000, indent=1000,
+                                                 seconds=3600))
+    limited.build()
+    # interleaved, and each after a collection, so drift and GC hit both alike
+    off_time = on_time = float("inf")
+    for _ in range(args.runs):
+        gc.collect()
+        off_time = min(off_time, _best(lambda: plain.parse(src), 1)[0])
+        gc.collect()
+        on_time = min(on_time, _best(lambda: limited.parse(src), 1)[0])
+    if limited.stopped is not None or limited.errors:
+        failures.append("the generous limits stopped a normal parse")
+    # the difference of two whole parses is within their noise, so the
+    # checks are also timed alone, on the same tokens
+    toks = list(plain.lexer.stream(src))
+    bare_time, _ = _best(lambda: _count(iter(iter(toks).__next__, None)), args.runs)
+    limited._reset()
+    check_time, _ = _best(lambda: _count(iter(limited._limited(iter(toks).__next__), None)), args.runs)
+    overhead = (check_time - bare_time) / off_time
+    print()
+    print(f"no limits        {off_time * 1000:9.2f} ms")
+    print(f"all limits on    {on_time * 1000:9.2f} ms   ({(on_time / off_time - 1) * 100:+.1f}%)")
+    print(f"the checks alone {(check_time - bare_time) * 1000:9.2f} ms   "
+          f"({(check_time - bare_time) / len(toks) * 1e9:.0f} ns/token, {overhead * 100:+.1f}% of a parse)")
+    if overhead > args.max_overhead:
+        failures.append(f"limits cost {overhead * 100:.1f}%")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: every budget stops its input, and the checks are cheap")
+
+
+def _tree_nodes(tree):
+    """Every Node of tree, without recursion."""
+    import Parser
+
+    work = [tree]
+    while work:
+        item = work.pop()
+        if isinstance(item, Parser.Node):
+            yield item
+            work.extend(item.children)
+        elif isinstance(item, list):
+            work.extend(item)
+
+
+class NaiveVisitor(object):
+    """The baseline for bench_visitor: recursion and a getattr for every node, like ast.NodeVisitor."""
+
+    def __init__(self):
+        import Parser
+
+        self.node_class = Parser.Node
+
+    def visit(self, node):
+        return getattr(self, "visit_" + node.type, self.generic_visit)(node)
+
+    def generic_visit(self, node):
+        Node = self.node_class
+        for child in node.children:
+            if isinstance(child, Node):
+                self.visit(child)
+            elif isinstance(child, list):
+                for item in child:
+                    if isinstance(item, Node):
+                        self.visit(item)
+
+
+class _NaiveCounter(NaiveVisitor):
+    def __init__(self):
+        super().__init__()
+        self.names = self.calls = self.functions = 0
+
+    def visit_identifier(self, node):
+        self.names += 1
+
+    def visit_call(self, node):
+        self.calls += 1
+        self.generic_visit(node)
+
+    def visit_function_def(self, node):
+        self.generic_visit(node)
+        self.functions += 1
+
+
+def _counter_class():
+    import Visitor
+
+    class Counter(Visitor.NodeVisitor):
+        def __init__(self):
+            self.names = self.calls = self.functions = 0
+
+        def visit_identifier(self, node):
+            self.names += 1
+
+        def visit_call(self, node):
+            self.calls += 1
+
+        def leave_function_def(self, node):
+            self.functions += 1
+    return Counter
+
+
+def bench_visitor(args):
+    """
+    NodeVisitor against a recursive getattr visitor (same counts, then
+    nodes/sec), a tree too deep for recursion, and NodeTransformer renaming
+    every name and dropping statements.
+    """
+    import Parser
+    import Visitor
+
+    parser = Parser.Parser()
+    parser.build()
+    failures = []
+    Counter = _counter_class()
+
+    tree = parser.parse(synthetic_module(args.copies))
+    nodes = _count(_tree_nodes(tree))
+    naive, fast = _NaiveCounter(), Counter()
+    naive.visit(tree)
+    fast.visit(tree)
+    got, expected = (fast.names, fast.calls, fast.functions), (naive.names, naive.calls, naive.functions)
+    if got != expected:
+        failures.append(f"counts {got} != {expected}")
+    # interleaved so drift hits both alike
+    naive_time = fast_time = float("inf")
+    for _ in range(args.runs):
+        naive_time = min(naive_time, _best(lambda: _NaiveCounter().visit(tree), 1)[0])
+        fast_time = min(fast_time, _best(lambda: Counter().visit(tree), 1)[0])
+    print(f"{nodes:,} nodes: {expected[0]:,} names, {expected[1]:,} calls, {expected[2]:,} functions")
+    print(f"naive getattr  {nodes / naive_time:12,.0f} nodes/sec")
+    print(f"NodeVisitor    {nodes / fast_time:12,.0f} nodes/sec   ({naive_time / fast_time:.1f}x)")
+
+    deep = parser.parse("x = " + "-(" * args.depth + "y" + ")" * args.depth + "\n")
+    try:
+        _NaiveCounter().visit(deep)
+        naive_deep = "ok"
+    except RecursionError:
+        naive_deep = "RecursionError"
+    counter = Counter()
+    counter.visit(deep)
+    print(f"depth {args.depth:,}: naive {naive_deep}, NodeVisitor {counter.names} name(s)")
+    if counter.names != 1:
+        failures.append("the deep tree was not walked")
+
+    class Rename(Visitor.NodeTransformer):
+        def __init__(self):
+            self.removed = 0
+
+        def leave_identifier(self, node):
+            return Parser.Node("identifier", "v_" + node.value, start=node.start, end=node.end)
+
+        def visit_pass(self, node):
+            self.removed += 1
+            return Visitor.REMOVE
+
+    tree = parser.parse(synthetic_module(args.copies) + "pass\n" * 10)
+    rename = Rename()
+    t0 = time.perf_counter()
+    tree = rename.visit(tree)
+    transform_time = time.perf_counter() - t0
+    left = _NaiveCounter()
+    left.visit(tree)
+    renamed = all(n.value.startswith("v_") for n in _tree_nodes(tree) if n.type == "identifier")
+    passes = sum(1 for n in _tree_nodes(tree) if n.type == "pass")
+    print(f"NodeTransformer {nodes / transform_time:11,.0f} nodes/sec, {rename.removed} pass removed, "
+          f"{passes} left")
+    if not renamed or passes or left.names != expected[0]:
+        failures.append("the transformer missed nodes")
+
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: same results as the recursive visitor, at any depth")
+
+
+def _naive_brackets(tokens):
+    """(pairs, unmatched openers, bad closers) from a plain stack, as the old Lexer2.py did."""
+    import Structure
+
+    stack, pairs, bad = [], [], []
+    for tok in tokens:
+        if tok.type in Structure.OPENERS:
+            stack.append(tok)
+        elif tok.type in Structure.CLOSERS:
+            if not stack:
+                bad.append(tok.lexpos)
+                continue
+            opener = stack.pop()
+            if opener.type == Structure.CLOSERS[tok.type][0]:
+                pairs.append((opener.lexpos, tok.lexpos))
+            else:
+                bad.append(tok.lexpos)
+    return pairs, [tok.lexpos for tok in stack], bad
+
+
+def bench_structure(args):
+    """
+    The structural index against what a second pass finds (a bracket stack,
+    LineIndex, INDENT/DEDENT pairs) with both lexers, then the cost of
+    building it while lexing.
+    """
+    import Lexer
+    import Scanner
+    import Structure
+
+    corpus = []
+    for name in SAMPLES:
+        with open(os.path.join(HERE, name), "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+    corpus += [synthetic_module(50), "", "x = (1, [2)\ny = 3)\nz = {\n"]
+    import Corpus
+    corpus += list(Corpus.corpus(500, 3).values())
+    corpus += mutated_sources(args.mutations)
+
+    failures = []
+    for n, src in enumerate(corpus):
+        found = []
+        for lexer in (Lexer.IndentLexer(), Scanner.ScanLexer()):
+            index = lexer.structure = Structure.StructureIndex()
+            tokens = list(lexer.stream(src))
+            pairs, unclosed, bad = _naive_brackets(tokens)
+            blocks, open_blocks = [], []
+            for tok in tokens:
+                if tok.type == "INDENT":
+                    open_blocks.append(tok.lexpos)
+                elif tok.type == "DEDENT" and open_blocks:
+                    blocks.append((open_blocks.pop(), tok.lexpos))
+            if list(index.line_starts) != list(lexer.lines.starts):
+                failures.append(f"source {n}: line starts differ")
+            if sorted((o, index.match(o)) for o, c in pairs) != sorted(pairs):
+                failures.append(f"source {n}: bracket pairs differ")
+            if any(index.match(c) != o for o, c in pairs):
+                failures.append(f"source {n}: closers don't match back")
+            if len(index.errors) != len(unclosed) + len(bad):
+                failures.append(f"source {n}: {len(index.errors)} bracket errors, expected {len(unclosed) + len(bad)}")
+            if sorted(zip(index.block_start, index.block_end)) != sorted(blocks):
+                failures.append(f"source {n}: blocks differ")
+            found.append((list(index.opens), list(index.closes), list(index.block_header),
+                          list(index.block_start), list(index.block_end), index.errors))
+        if found[0] != found[1]:
+            failures.append(f"source {n}: the two lexers give different indexes")
+    print(f"checked: {len(corpus)} sources, both lexers, {len(failures)} failures")
+
+    src = synthetic_module(args.functions)
+    lexer = Scanner.ScanLexer()
+    plain_time, count = _best(lambda: _count(lexer.stream(src)), args.runs)
+    lexer.structure = Structure.StructureIndex()
+    indexed_time, _ = _best(lambda: _count(lexer.stream(src)), args.runs)
+    index = lexer.structure
+    print(f"{count:,} tokens, {len(index.opens):,} brackets, {len(index.block_start):,} blocks")
+    print(f"lex               {count / plain_time:12,.0f} tokens/sec")
+    print(f"lex + index       {count / indexed_time:12,.0f} tokens/sec   "
+          f"({(indexed_time / plain_time - 1) * 100:+.0f}%, a second lex would be +100%)")
+    for failure in failures[:10]:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: the index matches a second pass")
+
+
+def _percentile(values, p):
+    """The p-th percentile (0-100) of values, nearest rank."""
+    ordered = sorted(values)
+    return ordered[max(-(-len(ordered) * p // 100) - 1, 0)]
+
+
+async def _service_checks(service, connect, failures):
+    """Answers against Service._work run here, sharing, cancelling, bad messages and back-pressure."""
+    import Batch
+    import Corpus
+    import Service
+
+    Batch._init_worker(None)
+    client = await connect()
+    sources = list(Corpus.corpus(100, 5).values()) + mutated_sources(5)
+    for n, src in enumerate(sources):
+        for method in Service.METHODS:
+            got = await client.call(method, text=src)
+            if got != json.loads(Service._work(method, src)[0]):
+                failures.append(f"{method} of source {n}: the answer differs from a direct call")
+
+    src = synthetic_module(200)
+    before = service.stats()
+    await asyncio.gather(*(client.call("check", text=src) for _ in range(3)))
+    await client.call("check", text=src)
+    after = service.stats()
+    jobs = after["jobs"] - before["jobs"]
+    reused = after["hits"] + after["shared"] - before["hits"] - before["shared"]
+    if (jobs, reused) != (1, 3):
+        failures.append(f"4 identical requests ran {jobs} jobs and reused {reused} results (expected 1 and 3)")
+
+    # a parse that ran out of its budget (here workers with a tight one, like
+    # a time budget under load) mustn't be the answer kept for that text
+    from concurrent.futures import ProcessPoolExecutor
+    import Parser
+    src = synthetic_module(50)
+    tight = ProcessPoolExecutor(1, initializer=Batch._init_worker, initargs=(None, Parser.Limits(tokens=50)))
+    pool, service.pool = service.pool, tight
+    try:
+        stopped = await client.call("check", text=src)
+    finally:
+        service.pool = pool
+        tight.shutdown()
+    again = await client.call("check", text=src)
+    if "stopped" not in stopped:
+        failures.append("the tight budget didn't stop the parse")
+    elif "stopped" in again:
+        failures.append("the same text sent again got the stopped result back")
+
+    edits = [client.send("parse", text=synthetic_module(100 + i), uri="edited.py")[1] for i in range(5)]
+    answers = await asyncio.gather(*edits, return_exceptions=True)
+    codes = [a.code if isinstance(a, Service.RPCError) else "ok" for a in answers]
+    if codes != [Service.REQUEST_CANCELLED] * 4 + ["ok"]:
+        failures.append(f"5 quick edits of one document were answered {codes}")
+
+    id_, future = client.send("parse", text=synthetic_module(3000))
+    client.cancel(id_)
+    try:
+        await future
+        failures.append("$/cancelRequest didn't cancel")
+    except Service.RPCError as e:
+        if e.code != Service.REQUEST_CANCELLED:
+            failures.append(f"$/cancelRequest gave error {e.code}")
+
+    raw = await connect()
+    raw.writer.write(b"not json\n")
+    bad = [{"jsonrpc": "2.0", "id": "a", "method": "nope"},
+           {"jsonrpc": "2.0", "id": "b", "method": "check", "params": {"text": 1}},
+           {"jsonrpc": "2.0", "id": ["c"], "method": "check"}]
+    answers = [raw.send(msg["method"], **msg.get("params", {}))[1] for msg in bad[:2]]
+    raw.writer.write((json.dumps(bad[2]) + "\n").encode())
+    codes = []
+    for future in answers:
+        try:
+            await future
+            codes.append("ok")
+        except Service.RPCError as e:
+            codes.append(e.code)
+    if codes != [Service.METHOD_NOT_FOUND, Service.INVALID_PARAMS]:
+        failures.append(f"bad requests were answered {codes}")
+    await raw.close()
+
+    flood = [client.send("check", text=f"x_{i} = {i}\n")[1] for i in range(20 * service.max_pending)]
+    answers = await asyncio.gather(*flood, return_exceptions=True)
+    if any(not isinstance(a, dict) for a in answers):
+        failures.append("a flood of requests wasn't answered")
+    if service.peak_pending > service.max_pending:
+        failures.append(f"{service.peak_pending} requests pending at once, over the limit of {service.max_pending}")
+    await client.close()
+
+
+async def _service_load(connect, docs, clients, requests, seed):
+    """Every client sends requests one after another; the latency of each one."""
+    import random
+
+    weights = (("check", 6), ("parse", 3), ("tokenize", 1))
+    methods = [m for m, w in weights for _ in range(w)]
+
+    async def one(i):
+        rng = random.Random(seed + i)
+        client = await connect()
+        latencies = []
+        for _ in range(requests):
+            method, src = rng.choice(methods), rng.choice(docs)
+            t0 = time.perf_counter()
+            await client.call(method, text=src)
+            latencies.append(time.perf_counter() - t0)
+        await client.close()
+        return latencies
+
+    t0 = time.perf_counter()
+    per_client = await asyncio.gather(*(one(i) for i in range(clients)))
+    return [x for latencies in per_client for x in latencies], time.perf_counter() - t0
+
+
+def bench_service(args):
+    """
+    Service.py over a local socket: protocol checks, then p50/p99 latency
+    of --clients clients each sending --requests requests, one at a time,
+    for programs picked from --documents distinct ones.
+    """
+    import Corpus
+    import Parser
+    import Service
+
+    docs = [Corpus.generate(("functions", "flat")[i % 2], args.size, i) for i in range(args.documents)]
+    parser = Parser.Parser()
+    parser.build()
+    direct, _ = _best(lambda: [parser.parse(src) for src in docs], 3)
+    failures = []
+
+    async def run():
+        service = Service.Service(args.workers, args.max_pending)
+        with tempfile.TemporaryDirectory() as tmp:
+            if args.tcp or not hasattr(asyncio, "start_unix_server"):
+                port = (await service.start(port=0))[1]
+                connect = lambda: Service.Client.connect(port=port)
+            else:
+                path = await service.start(path=os.path.join(tmp, "service.sock"))
+                connect = lambda: Service.Client.connect(path=path)
+            try:
+                await _service_checks(service, connect, failures)
+                before = service.stats()
+                latencies, seconds = await _service_load(connect, docs, args.clients, args.requests, args.seed)
+                after = service.stats()
+            finally:
+                service.close()
+        return latencies, seconds, {k: after[k] - before[k] for k in ("requests", "jobs", "hits", "shared")}, after
+
+    latencies, seconds, counts, stats = asyncio.run(run())
+    print(f"{args.clients} clients x {args.requests} requests, {stats['workers']} worker(s), "
+          f"at most {args.max_pending or 4 * stats['workers']} pending")
+    print(f"{len(latencies)} answered in {seconds:.2f}s: {len(latencies) / seconds:,.0f} requests/sec")
+    print(f"latency   p50 {_percentile(latencies, 50) * 1000:7.2f} ms   p99 {_percentile(latencies, 99) * 1000:7.2f} ms"
+          f"   max {max(latencies) * 1000:7.2f} ms")
+    print(f"one parse in-process: {direct / len(docs) * 1000:.2f} ms on average")
+    print(f"{counts['jobs']} jobs ran for {counts['requests']} requests "
+          f"({counts['hits']} kept results, {counts['shared']} shared jobs); peak pending {stats['peak_pending']}")
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("OK: answers, sharing, cancelling and back-pressure")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Fangless Python lexer and parser")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    startup = sub.add_parser("startup", help="Parser.build() with a cold and a warm table cache")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    threads = sub.add_parser("threads", help="parse in many threads and compare with a serial run")
+    threads.add_argument("--files", type=int, default=300)
+    threads.add_argument("--threads", type=int, default=8)
+    threads.set_defaults(func=bench_threads)
+
+    memory = sub.add_parser("memory", help="AST memory on a large synthetic module")
+    memory.add_argument("--functions", type=int, default=2000)
+    memory.set_defaults(func=bench_memory)
+
+    scaling = sub.add_parser("scaling", help="parse time for 1k, 10k and 100k statements and elements")
+    scaling.add_argument("--sizes", default="1000,10000,100000")
+    scaling.add_argument("--max-growth", type=float, default=3.0,
+                         help="largest accepted growth of the per-item time")
+    scaling.set_defaults(func=bench_scaling)
+
+    incremental = sub.add_parser("incremental", help="replay an editing session with incremental reparsing")
+    incremental.add_argument("--functions", type=int, default=1100)
+    incremental.add_argument("--check-every", type=int, default=50, help="compare with a full parse every N edits")
+    incremental.add_argument("--p50-ms", type=float, default=1.0)
+    incremental.add_argument("--p99-ms", type=float, default=4.0)
+    incremental.add_argument("--sessions", type=int, default=20, help="random sessions of broken edits")
+    incremental.add_argument("--steps", type=int, default=40, help="edits per broken session")
+    incremental.set_defaults(func=bench_incremental)
+
+    serialize = sub.add_parser("serialize", help="binary AST format against pickle and re-parsing")
+    serialize.add_argument("--functions", type=int, default=2000)
+    serialize.add_argument("--runs", type=int, default=3)
+    serialize.set_defaults(func=bench_serialize)
+
+    tokens = sub.add_parser("tokens", help="quiet token stream against the verbose printing path")
+    tokens.add_argument("--copies", type=int, default=200)
+    tokens.add_argument("--runs", type=int, default=3)
+    tokens.set_defaults(func=bench_tokens)
+
+    scanner = sub.add_parser("scanner", help="single-pass scanner against the PLY lexer")
+    scanner.add_argument("--mutations", type=int, default=300)
+    scanner.add_argument("--functions", type=int, default=1000)
+    scanner.add_argument("--runs", type=int, default=3)
+    scanner.set_defaults(func=bench_scanner)
+
+    recovery = sub.add_parser("recovery", help="error recovery on mutated and mangled sources")
+    recovery.add_argument("--mutations", type=int, default=300)
+    recovery.add_argument("--copies", default="1,10,100")
+    recovery.add_argument("--runs", type=int, default=3)
+    recovery.add_argument("--max-growth", type=float, default=3.0,
+                          help="largest accepted growth of the time per error")
+    recovery.set_defaults(func=bench_recovery)
+
+    fold = sub.add_parser("fold", help="constant folding: checks against Python and nodes/sec")
+    fold.add_argument("--functions", type=int, default=1000)
+    fold.set_defaults(func=bench_fold)
+
+    vm = sub.add_parser("vm", help="bytecode VM: output against CPython and fibonacci timings")
+    vm.add_argument("--n", type=int, default=22, help="argument of the recursive fibonacci")
+    vm.add_argument("--runs", type=int, default=3)
+    vm.set_defaults(func=bench_vm)
+
+    interp = sub.add_parser("interp", help="closure interpreter against a naive tree walker")
+    interp.add_argument("--n", type=int, default=22, help="argument of the recursive fibonacci")
+    interp.add_argument("--runs", type=int, default=3)
+    interp.set_defaults(func=bench_interp)
+
+    symbols = sub.add_parser("symbols", help="symbol table: checks against Bytecode and linear time")
+    symbols.add_argument("--sizes", default="100,1000,10000")
+    symbols.add_argument("--max-growth", type=float, default=3.0,
+                         help="largest accepted growth of the time per node")
+    symbols.set_defaults(func=bench_symbols)
+
+    profile = sub.add_parser("profile", help="cost of the profiling mode, on and off")
+    profile.add_argument("--functions", type=int, default=1000)
+    profile.add_argument("--runs", type=int, default=5)
+    profile.add_argument("--max-overhead", type=float, default=0.03,
+                         help="largest accepted cost with profiling off (0.03 is 3%%)")
+    profile.set_defaults(func=bench_profile)
+
+    suite = sub.add_parser("suite", help="throughput, memory and startup on the generated corpus, as JSON")
+    suite.add_argument("--size", type=int, default=2000, help="statements (or items) per generated program")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--runs", type=int, default=3)
+    suite.add_argument("--startup-runs", type=int, default=3)
+    suite.add_argument("--out", default=None, help="JSON file to write (default: bench-<commit>.json)")
+    suite.add_argument("--baseline", default=None, help="earlier JSON results to compare with")
+    suite.add_argument("--tolerance", type=float, default=0.15,
+                       help="largest accepted slowdown or memory growth (0.15 is 15%%)")
+    suite.set_defaults(func=bench_suite)
+
+    bigfile = sub.add_parser("bigfile", help="chunked file input: same tokens, and memory under a cap")
+    bigfile.add_argument("--mb", type=int, default=3, help="size of the generated file")
+    bigfile.add_argument("--cap-mb", type=int, default=2, help="largest accepted peak memory while lexing it")
+    bigfile.add_argument("--chunk-kb", type=int, default=64)
+    bigfile.add_argument("--seed", type=int, default=0)
+    bigfile.set_defaults(func=bench_bigfile)
+
+    limits = sub.add_parser("limits", help="parse budgets: hostile inputs, and their cost when left on")
+    limits.add_argument("--functions", type=int, default=300)
+    limits.add_argument("--runs", type=int, default=15)
+    limits.add_argument("--hostile", type=int, default=50000, help="size of the hostile inputs")
+    limits.add_argument("--max-overhead", type=float, default=0.05,
+                        help="largest accepted cost of the checks (0.05 is 5%%)")
+    limits.set_defaults(func=bench_limits)
+
+    visitor = sub.add_parser("visitor", help="NodeVisitor/NodeTransformer against a recursive getattr visitor")
+    visitor.add_argument("--copies", type=int, default=1000, help="functions in the synthetic module")
+    visitor.add_argument("--depth", type=int, default=20000, help="nesting of the deep tree")
+    visitor.add_argument("--runs", type=int, default=15)
+    visitor.set_defaults(func=bench_visitor)
+
+    structure = sub.add_parser("structure", help="bracket/line/block index: checks and the cost of building it")
+    structure.add_argument("--mutations", type=int, default=200)
+    structure.add_argument("--functions", type=int, default=1000)
+    structure.add_argument("--runs", type=int, default=5)
+    structure.set_defaults(func=bench_structure)
+
+    service = sub.add_parser("service", help="Service.py latency under concurrent clients, and protocol checks")
+    service.add_argument("--clients", type=int, default=16)
+    service.add_argument("--requests", type=int, default=25, help="per client")
+    service.add_argument("--documents", type=int, default=100, help="distinct programs the clients pick from")
+    service.add_argument("--size", type=int, default=150, help="statements per program")
+    service.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    service.add_argument("--max-pending", type=int, default=None)
+    service.add_argument("--seed", type=int, default=0)
+    service.add_argument("--tcp", action="store_true", help="a localhost port instead of a Unix socket")
+    service.set_defaults(func=bench_service)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
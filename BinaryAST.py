@@ -0,0 +1,303 @@
+# BinaryAST.py - compact binary save/load for Parser.Node trees
+#
+# Layout (all integers are unsigned LEB128 varints unless noted):
+#
+#   b"FAST"  version
+#   constant count, then every constant as a tag byte and its payload:
+#       0 str (byte length + UTF-8)   1 int (zigzag varint)
+#       2 float (8 bytes, little endian)   3 None   4 True   5 False
+#   node count, then every node in pre-order as
+#       kind   0 = plain value child, 1 = list child, k + 2 = constants[k] is the node type
+#       value  0 = None, v + 1 = constants[v]   (for a plain value: the constant index)
+#       number of children                     (not written for plain values)
+#       span   0 = none, else zigzag(start - start of the previous node with
+#              a span) + 1, then end - start   (only for nodes)
+import gc
+import mmap
+import struct
+import sys
+
+from Parser import Node
+
+MAGIC = b"FAST"
+VERSION = 2
+
+RAW = 0
+LIST = 1
+KIND_BASE = 2
+
+_STR, _INT, _FLOAT, _NONE, _TRUE, _FALSE = range(6)
+_DOUBLE = struct.Struct("<d")
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data, pos):
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = b & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        b = data[pos]
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos + 1
+        shift += 7
+
+
+def dumps(root):
+    """Encodes a Node tree (or None) without recursion and returns the bytes."""
+    constants = {}
+    table = bytearray()
+    body = bytearray()
+
+    def intern(v):
+        key = (type(v), v)
+        i = constants.get(key)
+        if i is None:
+            i = constants[key] = len(constants)
+            if v is None:
+                table.append(_NONE)
+            elif v is True:
+                table.append(_TRUE)
+            elif v is False:
+                table.append(_FALSE)
+            elif isinstance(v, str):
+                raw = v.encode("utf-8")
+                table.append(_STR)
+                _varint(table, len(raw))
+                table.extend(raw)
+            elif isinstance(v, int):
+                table.append(_INT)
+                _varint(table, v << 1 if v >= 0 else ((-v) << 1) - 1)
+            elif isinstance(v, float):
+                table.append(_FLOAT)
+                table.extend(_DOUBLE.pack(v))
+            else:
+                raise TypeError(f"cannot store {type(v).__name__} values in a binary AST")
+        return i
+
+    count = 0
+    last_start = 0
+    stack = [] if root is None else [root]
+    while stack:
+        item = stack.pop()
+        count += 1
+        if isinstance(item, Node):
+            children = item.children
+            _varint(body, intern(item.type) + KIND_BASE)
+            _varint(body, 0 if item.value is None else intern(item.value) + 1)
+            _varint(body, len(children))
+            start = item.start
+            if start is None:
+                body.append(0)
+            else:
+                # pre-order starts rarely go backwards, so the deltas stay small
+                d = start - last_start
+                _varint(body, (d << 1 if d >= 0 else ((-d) << 1) - 1) + 1)
+                _varint(body, item.end - start)
+                last_start = start
+        elif isinstance(item, list):
+            children = item
+            body.append(LIST)
+            body.append(0)
+            _varint(body, len(children))
+        else:
+            body.append(RAW)
+            _varint(body, intern(item))
+            continue
+        stack.extend(reversed(children))
+
+    out = bytearray(MAGIC)
+    _varint(out, VERSION)
+    _varint(out, len(constants))
+    out += table
+    _varint(out, count)
+    out += body
+    return bytes(out)
+
+
+def dump(root, f):
+    f.write(dumps(root))
+
+
+def _read_header(data):
+    """Returns (constants, node count, offset of the first node)."""
+    if bytes(data[:4]) != MAGIC:
+        raise FormatError("not a binary AST")
+    version, pos = _read_varint(data, 4)
+    if version != VERSION:
+        raise FormatError(f"unsupported binary AST version {version}")
+    n, pos = _read_varint(data, pos)
+    constants = []
+    append = constants.append
+    for _ in range(n):
+        tag = data[pos]
+        pos += 1
+        if tag == _STR:
+            size, pos = _read_varint(data, pos)
+            # interned like the parser's own strings, so node types and names
+            # are shared with every other tree
+            append(sys.intern(str(data[pos:pos + size], "utf-8")))
+            pos += size
+        elif tag == _INT:
+            z, pos = _read_varint(data, pos)
+            append(z >> 1 if not z & 1 else -((z + 1) >> 1))
+        elif tag == _FLOAT:
+            append(_DOUBLE.unpack_from(data, pos)[0])
+            pos += 8
+        elif tag == _NONE:
+            append(None)
+        elif tag == _TRUE:
+            append(True)
+        elif tag == _FALSE:
+            append(False)
+        else:
+            raise FormatError(f"unknown constant tag {tag}")
+    count, pos = _read_varint(data, pos)
+    return constants, count, pos
+
+
+def loads(data):
+    """Decodes bytes written by dumps() back into a Node tree."""
+    # the tree is acyclic; collecting while thousands of nodes are created
+    # only costs time
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        constants, count, pos = _read_header(data)
+        if not count:
+            return None
+        # every open node: [type, value, children, children still to read, start, end]
+        root = []
+        stack = [[None, None, root, 1, None, None]]
+        last_start = 0
+        for _ in range(count):
+            kind = data[pos]
+            if kind >= 0x80:
+                kind, pos = _read_varint(data, pos)
+            else:
+                pos += 1
+            v = data[pos]
+            if v >= 0x80:
+                v, pos = _read_varint(data, pos)
+            else:
+                pos += 1
+            if kind == RAW:
+                item = constants[v]
+                n = 0
+            else:
+                n = data[pos]
+                if n >= 0x80:
+                    n, pos = _read_varint(data, pos)
+                else:
+                    pos += 1
+                start = end = None
+                if kind != LIST:
+                    z = data[pos]
+                    if z >= 0x80:
+                        z, pos = _read_varint(data, pos)
+                    else:
+                        pos += 1
+                    if z:
+                        z -= 1
+                        start = last_start = last_start + (z >> 1 if not z & 1 else -((z + 1) >> 1))
+                        end = data[pos]
+                        if end >= 0x80:
+                            end, pos = _read_varint(data, pos)
+                        else:
+                            pos += 1
+                        end += start
+                if n:
+                    stack.append([kind, v, [], n, start, end])
+                    continue
+                item = [] if kind == LIST else Node(constants[kind - KIND_BASE], constants[v - 1] if v else None,
+                                                    None, start, end)
+            # close every parent whose last child this was
+            while True:
+                top = stack[-1]
+                top[2].append(item)
+                top[3] -= 1
+                if top[3] or len(stack) == 1:
+                    break
+                stack.pop()
+                kind, v, children = top[0], top[1], top[2]
+                item = children if kind == LIST else Node(constants[kind - KIND_BASE], constants[v - 1] if v else None,
+                                                          children, top[4], top[5])
+        return root[0]
+    except IndexError:
+        raise FormatError("truncated binary AST") from None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def load(f):
+    return loads(f.read())
+
+
+class MappedAST:
+    """
+    Reads a binary AST file through mmap. walk() visits the nodes in
+    pre-order without building the tree; to_node() builds it.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.constants, self.count, self._start = _read_header(self._map)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def walk(self):
+        """
+        Yields (depth, type, value) for every item in pre-order. Lists are
+        reported with type "[list]" and plain values with type None.
+        """
+        data, constants = self._map, self.constants
+        pos = self._start
+        remaining = [1]  # children still to read at every open level
+        for _ in range(self.count):
+            depth = len(remaining) - 1
+            kind, pos = _read_varint(data, pos)
+            v, pos = _read_varint(data, pos)
+            remaining[-1] -= 1
+            if kind == RAW:
+                yield depth, None, constants[v]
+            else:
+                n, pos = _read_varint(data, pos)
+                if kind != LIST:
+                    # skip the span: one varint, or two when it is not 0
+                    fields = 1 if data[pos] else 0
+                    while fields >= 0:
+                        while data[pos] >= 0x80:
+                            pos += 1
+                        pos += 1
+                        fields -= 1
+                yield depth, "[list]" if kind == LIST else constants[kind - KIND_BASE], constants[v - 1] if v else None
+                if n:
+                    remaining.append(n)
+                    continue
+            while len(remaining) > 1 and not remaining[-1]:
+                remaining.pop()
+
+    def to_node(self):
+        return loads(self._map)
@@ -0,0 +1,452 @@
+# Bytecode.py - compile Parser.Node trees into bytecode for VM.py
+#
+# Every function (and the module itself) becomes a Code object: its
+# instructions are (opcode, argument) pairs in one array("i"), and the
+# arguments index its constant, name and variable tables.
+#
+# Names follow Python's rules: a name assigned anywhere in a function (or
+# one of its parameters) is local to it and lives in a numbered slot;
+# locals that a nested function uses are kept in cells; every other name
+# is a global (or a builtin).
+import ast
+from array import array
+
+from Parser import Node
+
+OPNAMES = (
+    "LOAD_CONST", "LOAD_FAST", "STORE_FAST", "LOAD_GLOBAL", "STORE_GLOBAL",
+    "LOAD_DEREF", "STORE_DEREF", "LOAD_CLOSURE", "BINARY", "COMPARE",
+    "UNARY_NEG", "UNARY_NOT", "JUMP", "POP_JUMP_IF_FALSE", "JUMP_IF_FALSE_OR_POP",
+    "JUMP_IF_TRUE_OR_POP", "CALL", "RETURN", "POP", "BUILD_LIST", "BUILD_TUPLE",
+    "BUILD_SET", "BUILD_DICT", "SUBSCR", "BUILD_SLICE", "LOAD_ATTR", "GET_ITER",
+    "FOR_ITER", "UNPACK", "MAKE_FUNCTION",
+)
+(LOAD_CONST, LOAD_FAST, STORE_FAST, LOAD_GLOBAL, STORE_GLOBAL,
+ LOAD_DEREF, STORE_DEREF, LOAD_CLOSURE, BINARY, COMPARE,
+ UNARY_NEG, UNARY_NOT, JUMP, POP_JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP,
+ JUMP_IF_TRUE_OR_POP, CALL, RETURN, POP, BUILD_LIST, BUILD_TUPLE,
+ BUILD_SET, BUILD_DICT, SUBSCR, BUILD_SLICE, LOAD_ATTR, GET_ITER,
+ FOR_ITER, UNPACK, MAKE_FUNCTION) = range(len(OPNAMES))
+
+# the argument of BINARY / COMPARE is an index into these
+BINARY_OPS = ("+", "-", "*", "/", "//", "%", "**")
+COMPARE_OPS = ("==", "!=", "<", ">", "<=", ">=", "in", "is")
+
+
+class CompileError(Exception):
+    pass
+
+
+class Code(object):
+    """
+    A compiled function or module. varnames are the local slots (the
+    parameters first); cellvars are locals captured by nested functions
+    and freevars the captured locals of enclosing ones, and LOAD_DEREF /
+    STORE_DEREF index cellvars + freevars. cell_args[i] is the parameter
+    slot that cellvars[i] starts from, or -1. program is code as a list,
+    filled in when the function is compiled (the VM indexes it faster).
+    """
+    __slots__ = ("name", "code", "consts", "names", "varnames", "cellvars", "freevars",
+                 "cell_args", "argcount", "ndefaults", "program")
+
+    def __init__(self, name):
+        self.name = name
+        self.code = array("i")
+        self.consts = []
+        self.names = []
+        self.varnames = []
+        self.cellvars = []
+        self.freevars = []
+        self.cell_args = []
+        self.argcount = 0
+        self.ndefaults = 0
+        self.program = None
+
+    def __repr__(self):
+        return f"<code {self.name}, {len(self.code) // 2} instructions>"
+
+
+def disassemble(code, out=None):
+    """One line per instruction: offset, opcode name, argument and what it refers to."""
+    lines = []
+    ins = code.code
+    for pc in range(0, len(ins), 2):
+        op, arg = ins[pc], ins[pc + 1]
+        note = ""
+        if op == LOAD_CONST or op == MAKE_FUNCTION:
+            note = repr(code.consts[arg])
+        elif op in (LOAD_GLOBAL, STORE_GLOBAL, LOAD_ATTR):
+            note = code.names[arg]
+        elif op in (LOAD_FAST, STORE_FAST):
+            note = code.varnames[arg]
+        elif op in (LOAD_DEREF, STORE_DEREF, LOAD_CLOSURE):
+            note = (code.cellvars + code.freevars)[arg]
+        elif op == BINARY:
+            note = BINARY_OPS[arg]
+        elif op == COMPARE:
+            note = COMPARE_OPS[arg]
+        lines.append(f"{pc:5} {OPNAMES[op]:22} {arg:5}  {note}".rstrip())
+    text = "\n".join(lines) + "\n"
+    if out is not None:
+        out.write(text)
+    return text
+
+
+class _Scope(object):
+    """Names of one function: its locals, which of them are cells, and its free names."""
+
+    def __init__(self, node, parent):
+        self.node = node
+        self.parent = parent
+        self.params = []
+        self.assigned = set()
+        self.used = set()
+        self.children = []
+        self.cells = set()
+        self.frees = set()
+
+    def is_function(self):
+        return self.node.type == "function_def"
+
+
+def _statements(suite):
+    """The statement nodes of a suite or a module (newline placeholders skipped)."""
+    return [s for s in suite.children if isinstance(s, Node)]
+
+
+def _scan_scopes(root):
+    """Builds the scope tree: what every function assigns and reads."""
+    module = _Scope(root, None)
+    work = [(root, module)]
+    while work:
+        node, scope = work.pop()
+        if node is None or not isinstance(node, (Node, list)):
+            continue
+        if isinstance(node, list):
+            work.extend((item, scope) for item in node)
+            continue
+        t = node.type
+        if t == "function_def" and node is not scope.node:
+            scope.assigned.add(node.value)
+            params, body = node.children
+            inner = _Scope(node, scope)
+            scope.children.append(inner)
+            for param in params.children:
+                inner.params.append(param.value)
+                # defaults are evaluated in the enclosing scope
+                work.extend((c, scope) for c in param.children)
+            work.append((body, inner))
+            continue
+        if t == "assignment":
+            scope.assigned.add(node.value)
+        elif t == "identifier":
+            scope.used.add(node.value)
+        elif t == "call" and node.value is not None:
+            scope.used.add(node.value)
+        elif t == "for":
+            for name in _target_names(node.children[0]):
+                scope.assigned.add(name)
+        work.extend((c, scope) for c in node.children)
+    return module
+
+
+def _target_names(target):
+    if target.type == "identifier":
+        return [target.value]
+    if target.type in ("tuple", "list"):
+        names = []
+        for item in target.children:
+            names.extend(_target_names(item))
+        return names
+    raise CompileError(f"cannot assign to {target.type}")
+
+
+def _resolve(module):
+    """Marks the locals captured by nested functions as cells, and the free names on the way."""
+    work = list(module.children)
+    while work:
+        scope = work.pop()
+        work.extend(scope.children)
+        local = set(scope.params) | scope.assigned
+        for name in scope.used - local:
+            owner = scope.parent
+            path = [scope]
+            while owner is not None and owner.is_function():
+                if name in owner.params or name in owner.assigned:
+                    owner.cells.add(name)
+                    for s in path:
+                        s.frees.add(name)
+                    break
+                path.append(owner)
+                owner = owner.parent
+
+
+class Compiler(object):
+    """compile_module(tree) -> Code. Use one Compiler per tree."""
+
+    def __init__(self):
+        self.scopes = {}
+
+    def compile_module(self, tree):
+        if tree is None:
+            raise CompileError("nothing to compile")
+        module = _scan_scopes(tree)
+        _resolve(module)
+        self._index_scopes(module)
+        try:
+            return self._compile_scope(module, "<module>")
+        except RecursionError:
+            raise CompileError("expression nested too deeply") from None
+
+    def _index_scopes(self, module):
+        work = [module]
+        while work:
+            scope = work.pop()
+            self.scopes[id(scope.node)] = scope
+            work.extend(scope.children)
+
+    # ---- scopes ----
+
+    def _compile_scope(self, scope, name):
+        code = Code(name)
+        self.code = code
+        self.scope = scope
+        self._consts = {}
+        if scope.is_function():
+            code.varnames = list(scope.params)
+            for local in sorted(scope.assigned - set(scope.params)):
+                code.varnames.append(local)
+            code.argcount = len(scope.params)
+            code.cellvars = sorted(scope.cells)
+            code.freevars = sorted(scope.frees)
+            code.cell_args = [code.varnames.index(c) if c in scope.params else -1 for c in code.cellvars]
+            body = scope.node.children[1]
+        else:
+            body = scope.node
+        self._deref = {n: i for i, n in enumerate(code.cellvars + code.freevars)}
+        self._fast = {n: i for i, n in enumerate(code.varnames)}
+        self.block(body)
+        self.emit(LOAD_CONST, self.const(None))
+        self.emit(RETURN)
+        code.program = code.code.tolist()
+        return code
+
+    # ---- emitting ----
+
+    def emit(self, op, arg=0):
+        self.code.code.append(op)
+        self.code.code.append(arg)
+        return len(self.code.code) - 2
+
+    def here(self):
+        return len(self.code.code)
+
+    def patch(self, at, target):
+        self.code.code[at + 1] = target
+
+    def const(self, value):
+        if isinstance(value, Code):
+            key = id(value)
+        elif isinstance(value, float):
+            # 0.0 == -0.0, but they aren't the same constant
+            key = (type(value), repr(value))
+        else:
+            key = (type(value), value)
+        i = self._consts.get(key)
+        if i is None:
+            i = self._consts[key] = len(self.code.consts)
+            self.code.consts.append(value)
+        return i
+
+    def name(self, name):
+        names = self.code.names
+        if name in names:
+            return names.index(name)
+        names.append(name)
+        return len(names) - 1
+
+    def load(self, name):
+        if name in self._deref:
+            self.emit(LOAD_DEREF, self._deref[name])
+        elif name in self._fast:
+            self.emit(LOAD_FAST, self._fast[name])
+        else:
+            self.emit(LOAD_GLOBAL, self.name(name))
+
+    def store(self, name):
+        if name in self._deref:
+            self.emit(STORE_DEREF, self._deref[name])
+        elif name in self._fast:
+            self.emit(STORE_FAST, self._fast[name])
+        else:
+            self.emit(STORE_GLOBAL, self.name(name))
+
+    def store_target(self, target):
+        if target.type == "identifier":
+            self.store(target.value)
+        elif target.type in ("tuple", "list"):
+            self.emit(UNPACK, len(target.children))
+            for item in target.children:
+                self.store_target(item)
+        else:
+            raise CompileError(f"cannot assign to {target.type}")
+
+    # ---- statements ----
+
+    def block(self, suite):
+        for stmt in _statements(suite):
+            self.statement(stmt)
+
+    def statement(self, node):
+        t = node.type
+        if t == "assignment":
+            self.expr(node.children[0])
+            self.store(node.value)
+        elif t == "expression_stmt":
+            self.expr(node.children[0])
+            self.emit(POP)
+        elif t == "return":
+            if node.children:
+                self.expr(node.children[0])
+            else:
+                self.emit(LOAD_CONST, self.const(None))
+            self.emit(RETURN)
+        elif t == "if":
+            self.if_statement(node)
+        elif t == "while":
+            top = self.here()
+            self.expr(node.children[0])
+            exit_jump = self.emit(POP_JUMP_IF_FALSE)
+            self.block(node.children[1])
+            self.emit(JUMP, top)
+            self.patch(exit_jump, self.here())
+        elif t == "for":
+            target, iterable, body = node.children
+            self.expr(iterable)
+            self.emit(GET_ITER)
+            top = self.emit(FOR_ITER)
+            self.store_target(target)
+            self.block(body)
+            self.emit(JUMP, top)
+            self.patch(top, self.here())
+        elif t == "function_def":
+            self.function_def(node)
+        elif t == "pass":
+            pass
+        elif t == "suite":
+            self.block(node)
+        elif t == "error":
+            raise CompileError("the program has syntax errors")
+        else:
+            # a bare expression used as a statement
+            self.expr(node)
+            self.emit(POP)
+
+    def if_statement(self, node):
+        cond, body = node.children[0], node.children[1]
+        clauses = [(cond, body)]
+        orelse = None
+        for extra in node.children[2:]:
+            if isinstance(extra, list):
+                clauses.extend((elif_.children[0], elif_.children[1]) for elif_ in extra)
+            else:
+                orelse = extra
+        end_jumps = []
+        for cond, body in clauses:
+            self.expr(cond)
+            next_jump = self.emit(POP_JUMP_IF_FALSE)
+            self.block(body)
+            end_jumps.append(self.emit(JUMP))
+            self.patch(next_jump, self.here())
+        if orelse is not None:
+            self.block(orelse)
+        for at in end_jumps:
+            self.patch(at, self.here())
+
+    def function_def(self, node):
+        params, _ = node.children
+        defaults = [p.children[0] for p in params.children if p.children]
+        for default in defaults:
+            self.expr(default)
+        outer = (self.code, self.scope, self._consts, self._deref, self._fast)
+        inner = self._compile_scope(self.scopes[id(node)], node.value)
+        inner.ndefaults = len(defaults)
+        self.code, self.scope, self._consts, self._deref, self._fast = outer
+        if inner.freevars:
+            for name in inner.freevars:
+                self.emit(LOAD_CLOSURE, self._deref[name])
+            self.emit(BUILD_TUPLE, len(inner.freevars))
+        self.emit(MAKE_FUNCTION, self.const(inner))
+        self.store(node.value)
+
+    # ---- expressions ----
+
+    def expr(self, node):
+        if not isinstance(node, Node):
+            # the missing bounds of a slice
+            self.emit(LOAD_CONST, self.const(node))
+            return
+        t = node.type
+        if t == "identifier":
+            self.load(node.value)
+        elif t == "number":
+            self.emit(LOAD_CONST, self.const(node.value))
+        elif t == "string":
+            self.emit(LOAD_CONST, self.const(ast.literal_eval(node.value)))
+        elif t == "boolean":
+            self.emit(LOAD_CONST, self.const(node.value.lower() == "true"))
+        elif t == "none":
+            self.emit(LOAD_CONST, self.const(None))
+        elif t == "binary_op":
+            self.expr(node.children[0])
+            self.expr(node.children[1])
+            self.emit(BINARY, BINARY_OPS.index(node.value))
+        elif t == "comparison":
+            self.expr(node.children[0])
+            self.expr(node.children[1])
+            self.emit(COMPARE, COMPARE_OPS.index(node.value.lower()))
+        elif t == "unary_op":
+            self.expr(node.children[0])
+            self.emit(UNARY_NEG if node.value == "-" else UNARY_NOT)
+        elif t == "boolean_op":
+            self.expr(node.children[0])
+            at = self.emit(JUMP_IF_FALSE_OR_POP if node.value.lower() == "and" else JUMP_IF_TRUE_OR_POP)
+            self.expr(node.children[1])
+            self.patch(at, self.here())
+        elif t == "call":
+            args = node.children
+            if node.value is not None:
+                self.load(node.value)
+            else:
+                self.expr(args[0])
+                args = args[1:]
+            for arg in args:
+                self.expr(arg)
+            self.emit(CALL, len(args))
+        elif t == "subscript":
+            self.expr(node.children[0])
+            self.expr(node.children[1])
+            self.emit(SUBSCR)
+        elif t == "slice":
+            self.expr(node.children[0])
+            self.expr(node.children[1])
+            self.emit(BUILD_SLICE)
+        elif t == "attribute":
+            self.expr(node.children[0])
+            self.emit(LOAD_ATTR, self.name(node.value))
+        elif t in ("list", "tuple", "set"):
+            for item in node.children:
+                self.expr(item)
+            self.emit({"list": BUILD_LIST, "tuple": BUILD_TUPLE, "set": BUILD_SET}[t], len(node.children))
+        elif t == "dict":
+            for pair in node.children:
+                self.expr(pair.children[0])
+                self.expr(pair.children[1])
+            self.emit(BUILD_DICT, len(node.children))
+        else:
+            raise CompileError(f"cannot compile {t} nodes")
+
+
+def compile_tree(tree):
+    """Compiles a module Node into the Code object VM.run() executes."""
+    return Compiler().compile_module(tree)
@@ -0,0 +1,245 @@
+# Corpus.py - seeded generator of valid Fangless Python programs
+#
+#   python Corpus.py SHAPE [--size N] [--seed S] [-o FILE]
+#
+# The same (shape, size, seed) always gives the same program, so timings
+# taken on different commits compare the same input. Programs only use
+# what the grammar accepts, and they are valid Python as well (comparisons
+# are never chained, since Fangless groups them differently).
+import argparse
+import random
+import sys
+
+SHAPES = ("functions", "flat", "nested", "literals", "chains")
+
+BINARY_OPS = ("+", "-", "*", "/", "//", "%")
+COMPARE_OPS = ("==", "!=", "<", ">", "<=", ">=")
+BUILTINS = ("len", "print", "abs", "min", "max", "str", "int")
+WORDS = ("alpha", "beta", "gamma", "delta", "total", "count", "items", "value", "name", "index",
+         "left", "right", "result", "data", "key", "node", "size", "step", "acc", "tmp")
+
+# deepest block nesting and expression nesting the generator produces
+MAX_NESTING = 40
+MAX_EXPR_DEPTH = 4
+
+
+class Generator(object):
+    """Builds the pieces of a program from one random.Random(seed)."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.functions = []     # (name, number of parameters) defined so far
+
+    def name(self):
+        return self.rng.choice(WORDS) + "_" + str(self.rng.randrange(10))
+
+    def atom(self, names):
+        r = self.rng.random()
+        if names and r < 0.4:
+            return self.rng.choice(names)
+        if r < 0.65:
+            return str(self.rng.randrange(1000))
+        if r < 0.75:
+            return f"{self.rng.randrange(100)}.{self.rng.randrange(1, 100)}"
+        if r < 0.85:
+            quote = self.rng.choice("'\"")
+            return f"{quote}{self.rng.choice(WORDS)}{quote}"
+        return self.rng.choice(("True", "False", "None"))
+
+    def expr(self, names, depth=0):
+        """A random expression over names, at most MAX_EXPR_DEPTH levels deep."""
+        rng = self.rng
+        if depth >= MAX_EXPR_DEPTH or rng.random() < 0.3:
+            return self.atom(names)
+        r = rng.random()
+        sub = depth + 1
+        if r < 0.35:
+            return f"{self.expr(names, sub)} {rng.choice(BINARY_OPS)} {self.expr(names, sub)}"
+        if r < 0.45:
+            return f"({self.expr(names, sub)} {rng.choice(COMPARE_OPS)} {self.expr(names, sub)})"
+        if r < 0.5:
+            return f"({self.expr(names, sub)} {rng.choice(('and', 'or'))} {self.expr(names, sub)})"
+        if r < 0.55:
+            return f"(not {self.expr(names, sub)})"
+        if r < 0.6:
+            return f"-({self.expr(names, sub)})"
+        if r < 0.75:
+            return self.call(names, sub)
+        if r < 0.85:
+            items = ", ".join(self.expr(names, sub) for _ in range(rng.randrange(4)))
+            return f"[{items}]"
+        if r < 0.9:
+            return f"({self.expr(names, sub)}, {self.expr(names, sub)})"
+        if r < 0.95:
+            target = rng.choice(names) if names else "'text'"
+            return f"{target}[{rng.randrange(5)}:{rng.randrange(5, 10)}]"
+        target = rng.choice(names) if names else "[1, 2, 3]"
+        return f"{target}[{rng.randrange(3)}]"
+
+    def call(self, names, depth):
+        if self.functions and self.rng.random() < 0.7:
+            func, argc = self.rng.choice(self.functions)
+        else:
+            func, argc = self.rng.choice(BUILTINS), 1
+        return f"{func}({', '.join(self.expr(names, depth) for _ in range(argc))})"
+
+    def simple(self, names):
+        """An assignment, call or return-free expression statement; may add to names."""
+        r = self.rng.random()
+        if r < 0.6 or not names:
+            target = self.name()
+            line = f"{target} = {self.expr(names)}"
+            if target not in names:
+                names.append(target)
+            return line
+        if r < 0.9:
+            return self.call(names, 1)
+        return "pass"
+
+    def block(self, out, indent, names, statements, depth):
+        """Appends about `statements` statements at `indent`, nesting compound ones up to depth."""
+        rng = self.rng
+        pad = "    " * indent
+        left = max(statements, 1)
+        while left > 0:
+            if depth > 0 and left > 2 and rng.random() < 0.35:
+                inner = rng.randrange(1, left)
+                kind = rng.random()
+                if kind < 0.5:
+                    out.append(f"{pad}if {self.expr(names)}:")
+                    self.block(out, indent + 1, names, inner, depth - 1)
+                    if rng.random() < 0.3:
+                        out.append(f"{pad}elif {self.expr(names)}:")
+                        self.block(out, indent + 1, names, 1, 0)
+                    if rng.random() < 0.4:
+                        out.append(f"{pad}else:")
+                        self.block(out, indent + 1, names, 1, 0)
+                elif kind < 0.75:
+                    out.append(f"{pad}while {self.expr(names)}:")
+                    self.block(out, indent + 1, names, inner, depth - 1)
+                else:
+                    var = self.name()
+                    out.append(f"{pad}for {var} in {self.expr(names)}:")
+                    self.block(out, indent + 1, names + [var], inner, depth - 1)
+                left -= inner + 1
+            else:
+                out.append(pad + self.simple(names))
+                left -= 1
+
+    def function(self, out, statements, depth):
+        rng = self.rng
+        name = f"func_{len(self.functions)}"
+        params = [f"p{i}" for i in range(rng.randrange(4))]
+        defaults = rng.randrange(len(params) + 1)
+        parts = params[:len(params) - defaults] + [f"{p}={self.atom([])}" for p in params[len(params) - defaults:]]
+        out.append(f"def {name}({', '.join(parts)}):")
+        names = list(params)
+        self.block(out, 1, names, statements, depth)
+        out.append(f"    return {self.expr(names)}")
+        out.append("")
+        self.functions.append((name, len(params) - defaults))
+
+
+def generate(shape, size, seed=0):
+    """The source of a `shape` program with about `size` statements (or literal items, or operators)."""
+    if shape not in SHAPES:
+        raise ValueError(f"unknown shape {shape!r} (expected one of {', '.join(SHAPES)})")
+    gen = Generator(seed)
+    rng = gen.rng
+    out = []
+    if shape == "functions":
+        while size > 0:
+            statements = rng.randrange(1, 8)
+            gen.function(out, statements, 2)
+            size -= statements + 2
+        for name, argc in gen.functions[:50]:
+            out.append(f"print({name}({', '.join(str(i) for i in range(argc))}))")
+    elif shape == "flat":
+        names = []
+        for _ in range(size):
+            out.append(gen.simple(names))
+    elif shape == "nested":
+        # functions whose blocks nest MAX_NESTING deep, until size statements are used
+        while size > 0:
+            levels = min(MAX_NESTING, max(size // 2, 1))
+            out.append(f"def func_{len(gen.functions)}(p0):")
+            names = ["p0"]
+            for level in range(levels):
+                pad = "    " * (level + 1)
+                out.append(pad + gen.simple(names))
+                header = rng.choice(("if", "while", "for"))
+                if header == "for":
+                    var = gen.name()
+                    out.append(f"{pad}for {var} in {gen.expr(names)}:")
+                    names.append(var)
+                else:
+                    out.append(f"{pad}{header} {gen.expr(names)}:")
+            out.append("    " * (levels + 1) + "return " + gen.expr(names))
+            out.append("")
+            gen.functions.append((f"func_{len(gen.functions)}", 1))
+            size -= 2 * levels + 1
+    elif shape == "literals":
+        # a few big literals sharing size items, the dict over many lines (the
+        # lexer only indents after "{", so lists stay on one line)
+        for i, kind in enumerate(("list", "dict", "set", "nested", "list")):
+            n = max(size // 5, 1)
+            items = []
+            for j in range(n):
+                if kind == "dict":
+                    items.append(f"{gen.atom([])!s}: {gen.atom([])}" if j % 2 else f"'k{j}': {j}")
+                elif kind == "nested":
+                    items.append("[" + ", ".join(gen.atom([]) for _ in range(rng.randrange(1, 5))) + "]")
+                else:
+                    items.append(str(j) if kind == "set" else gen.atom([]))
+            open_, close = ("{", "}") if kind in ("dict", "set") else ("[", "]")
+            if kind == "dict":
+                body = ",\n    ".join(items)
+                out.append(f"literal_{i} = {open_}\n    {body}\n{close}")
+            else:
+                out.append(f"literal_{i} = {open_}{', '.join(items)}{close}")
+    else:
+        # chains of up to 1000 operators per line, size operators in all
+        names = ["a", "b", "c"]
+        out.append("a = 1\nb = 2\nc = 3")
+        line = 0
+        while size > 0:
+            n = min(size, 1000)
+            kind = line % 3
+            if kind == 0:
+                terms = [gen.atom(names) if rng.random() < 0.5 else rng.choice(names) for _ in range(n + 1)]
+                ops = [rng.choice(("+", "-", "*")) for _ in range(n)]
+                expr = terms[0] + "".join(f" {op} {t}" for op, t in zip(ops, terms[1:]))
+            elif kind == 1:
+                expr = " and ".join(f"({rng.choice(names)} {rng.choice(COMPARE_OPS)} {rng.randrange(10)})"
+                                    for _ in range(n + 1))
+            else:
+                expr = "str(a)" + "".join(rng.choice((".upper()", ".lower()", ".strip()")) for _ in range(n))
+            out.append(f"chain_{line} = {expr}")
+            line += 1
+            size -= n
+    return "\n".join(out) + "\n"
+
+
+def corpus(size, seed=0):
+    """One program of every shape: {shape: source}."""
+    return {shape: generate(shape, size, seed) for shape in SHAPES}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a Fangless Python program")
+    ap.add_argument("shape", choices=SHAPES)
+    ap.add_argument("--size", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-o", "--output", default=None, help="file to write (default: stdout)")
+    args = ap.parse_args(argv)
+    src = generate(args.shape, args.size, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(src)
+    else:
+        sys.stdout.write(src)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
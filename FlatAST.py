@@ -0,0 +1,132 @@
+# FlatAST.py - compact, array-backed encoding of a Parser.Node tree
+#
+# Nodes are stored in pre-order (index 0 is the root) as parallel array
+# columns. Node kinds and values are indexes into one shared
+# string/constant table, so every repeated name is stored once.
+from array import array
+
+from Parser import Node
+
+NONE = -1
+# kinds used for children that are not Nodes: plain values (e.g. the missing
+# bounds of a slice) and nested lists (e.g. the elif clauses of an if)
+RAW = 0xFFFFFFFF
+LIST = 0xFFFFFFFE
+
+
+class FlatAST:
+    __slots__ = ("kind", "value", "first_child", "next_sibling", "start", "end", "constants")
+
+    def __init__(self):
+        self.kind = array("I")          # index into constants, RAW or LIST
+        self.value = array("i")         # index into constants, or NONE
+        self.first_child = array("i")   # node index, or NONE
+        self.next_sibling = array("i")  # node index, or NONE
+        self.start = array("q")         # source offsets of the node's span, or NONE (64-bit, like Structure)
+        self.end = array("q")
+        self.constants = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def nbytes(self):
+        """Bytes used by the columns (the constant table is not included)."""
+        return sum(col.itemsize * len(col) for col in (self.kind, self.value, self.first_child, self.next_sibling,
+                                                       self.start, self.end))
+
+    def children(self, i):
+        """Indexes of the children of node i, in order."""
+        c = self.first_child[i]
+        while c != NONE:
+            yield c
+            c = self.next_sibling[c]
+
+    @classmethod
+    def from_node(cls, root):
+        """Encodes a Node tree without recursion. A None root gives an empty FlatAST."""
+        flat = cls()
+        if root is None:
+            return flat
+        index = {}
+        constants = flat.constants
+
+        def intern(v):
+            key = (type(v), v)
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(constants)
+                constants.append(v)
+            return i
+
+        kind, value = flat.kind, flat.value
+        first_child, next_sibling = flat.first_child, flat.next_sibling
+        start, end = flat.start, flat.end
+        last_child = []
+        stack = [(root, NONE)]
+        while stack:
+            item, parent = stack.pop()
+            i = len(kind)
+            if isinstance(item, Node):
+                kind.append(intern(item.type))
+                value.append(NONE if item.value is None else intern(item.value))
+                start.append(NONE if item.start is None else item.start)
+                end.append(NONE if item.end is None else item.end)
+                stack.extend((child, i) for child in reversed(item.children))
+            elif isinstance(item, list):
+                kind.append(LIST)
+                value.append(NONE)
+                start.append(NONE)
+                end.append(NONE)
+                stack.extend((child, i) for child in reversed(item))
+            else:
+                kind.append(RAW)
+                value.append(intern(item))
+                start.append(NONE)
+                end.append(NONE)
+            first_child.append(NONE)
+            next_sibling.append(NONE)
+            last_child.append(NONE)
+            if parent != NONE:
+                if last_child[parent] == NONE:
+                    first_child[parent] = i
+                else:
+                    next_sibling[last_child[parent]] = i
+                last_child[parent] = i
+        return flat
+
+    def subtree_end(self, i):
+        """One past the last index of the subtree rooted at i."""
+        first_child, next_sibling = self.first_child, self.next_sibling
+        while first_child[i] != NONE:
+            i = first_child[i]
+            while next_sibling[i] != NONE:
+                i = next_sibling[i]
+        return i + 1
+
+    def to_node(self, i=0):
+        """Rebuilds the Node tree rooted at i without recursion."""
+        if not len(self.kind):
+            return None
+        constants, kind, value = self.constants, self.kind, self.value
+        first_child, next_sibling = self.first_child, self.next_sibling
+        end = self.subtree_end(i)
+        built = [None] * (end - i)
+        # in pre-order every child comes after its parent, so build back to front
+        for j in range(end - 1, i - 1, -1):
+            if kind[j] == RAW:
+                built[j - i] = constants[value[j]]
+                continue
+            children = []
+            c = first_child[j]
+            while c != NONE:
+                children.append(built[c - i])
+                built[c - i] = None
+                c = next_sibling[c]
+            if kind[j] == LIST:
+                built[j - i] = children
+                continue
+            v = value[j]
+            s = self.start[j]
+            built[j - i] = Node(constants[kind[j]], None if v == NONE else constants[v], children,
+                                None if s == NONE else s, None if s == NONE else self.end[j])
+        return built[0]
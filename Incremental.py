@@ -0,0 +1,342 @@
+# Incremental.py - reparse only the part of a document that an edit touches
+#
+# A document is kept as a list of chunks, one per top-level statement: a
+# chunk starts at every line that begins in column 0 (except elif/else
+# lines, which continue the statement above). At those lines the lexer's
+# indent_stack is always [0], so every chunk can be lexed and parsed on its
+# own and its statements spliced into the module node.
+#
+# Every chunk but the first is parsed the way it is read in the whole
+# module, after a statement (Parser.parse(after_statement=True)): yacc's
+# error recovery works differently at the start of the input. After a chunk
+# the parser reads a `pass` line too; if that comes out as a pass statement,
+# the parser is back between two statements there, as it would be after any
+# other statement, so the chunk below parses the same after it as on its
+# own. If it doesn't (an unclosed bracket, a block or error recovery still
+# going), the chunk is parsed together with the next one, and they're kept
+# apart only if that gives the same statements and errors; so is a chunk
+# that fails on its first line after one with errors (yacc reports nothing
+# for three tokens after an error). That way the tree and errors are always
+# those of a full parse, and the reparse only reaches as far as the parser
+# would really carry an error.
+#
+# Chunk sizes, line counts and statement counts are kept in Fenwick trees,
+# so finding the chunks an edit touches and their offsets takes O(log n);
+# they are rebuilt (O(n), but one list comprehension each) only when an
+# edit changes the number of chunks.
+import re
+from itertools import accumulate
+
+from Parser import Node, Parser
+
+# strings and comments (to skip the brackets inside them), brackets, and the
+# newline in front of every line that may start a new top-level statement
+_SCAN_RE = re.compile(
+    r"""'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|\#[^\n]*|[()\[\]{}]"""
+    r"""|\n(?=[^ \t\n])(?!(?i:elif|else)\b)""")
+_BRACKET_RE = re.compile(r"""'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|\#[^\n]*|[()\[\]{}]""")
+_LINE_RE = re.compile(r"line (\d+)")
+_AT_END = "type='ENDMARKER'"
+_AT_DEDENT = "type='DEDENT'"
+# parsed after every chunk: if it doesn't come out as a statement of its own,
+# the chunk isn't done where it ends
+_PROBE = "pass\n"
+
+
+def split_statements(text):
+    """Offsets where the lines that may start a top-level statement start; the first is always 0."""
+    return [0] + [m.end() for m in _SCAN_RE.finditer(text) if m.group() == "\n"]
+
+
+def bracket_depth(text):
+    """Brackets still open at the end of text (closing ones with nothing open are ignored)."""
+    depth = 0
+    for m in _BRACKET_RE.finditer(text):
+        c = m.group()
+        if c in "([{":
+            depth += 1
+        elif c in ")]}" and depth:
+            depth -= 1
+    return depth
+
+
+def _shift_lines(msg, delta):
+    return _LINE_RE.sub(lambda m: f"line {int(m.group(1)) + delta}", msg)
+
+
+def _on_line(errors, line):
+    return any(f"line {line}," in msg or f"line {line}:" in msg for msg in errors)
+
+
+def _follows(head, tail):
+    """
+    Whether tail may parse differently after head than on its own: head is
+    open, or head has errors and tail fails on its first line (yacc reports
+    nothing for three tokens after an error).
+    """
+    return head.open or (tail.early and bool(head.errors))
+
+
+class _Sums(object):
+    """Prefix sums over a list of counts that change in place (a Fenwick tree)."""
+    __slots__ = ("tree", "n")
+
+    def __init__(self, values=()):
+        self.rebuild(values)
+
+    def rebuild(self, values):
+        prefix = [0]
+        prefix.extend(accumulate(values))
+        # node i holds the sum of the counts from i - lowbit(i) to i - 1
+        self.tree = [total - prefix[i & (i - 1)] for i, total in enumerate(prefix)]
+        self.n = len(prefix) - 1
+
+    def add(self, i, delta):
+        tree, n = self.tree, self.n
+        i += 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Sum of the first i counts."""
+        tree = self.tree
+        total = 0
+        while i:
+            total += tree[i]
+            i &= i - 1
+        return total
+
+    def find(self, x):
+        """The largest i whose prefix(i) <= x (counts are never negative)."""
+        tree, n = self.tree, self.n
+        pos = 0
+        step = 1 << n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] <= x:
+                pos = nxt
+                x -= tree[nxt]
+            step >>= 1
+        return pos
+
+
+class _Chunk(object):
+    # line: the line the errors were made for; first: parsed at the start of
+    # the input rather than after a statement; open: the parser isn't done
+    # with it where it ends, so the next one may belong to it; early: it has
+    # errors on its first line; gave_up: yacc gave up on it (so on the whole
+    # module if it's the last chunk)
+    __slots__ = ("text", "lines", "statements", "errors", "line", "first", "open", "early", "gave_up")
+
+    def __init__(self, text, statements, errors, line, first, open_, gave_up=False):
+        self.text = text
+        self.lines = text.count("\n")
+        self.statements = statements
+        self.errors = errors
+        self.line = line
+        self.first = first
+        self.open = open_
+        self.early = _on_line(errors, line)
+        self.gave_up = gave_up
+
+    def errors_at(self, line):
+        if line == self.line:
+            return self.errors
+        return [_shift_lines(msg, line - self.line) for msg in self.errors]
+
+
+class IncrementalParser:
+    """
+    Holds a document, its AST and its errors, and keeps them up to date
+    through edit() by relexing and reparsing only the top-level statements
+    the edit touches. The module node in `tree` is updated in place.
+
+    Node spans are offsets into the statement's own chunk (so they stay
+    valid when edits above move it); chunk_start(i) gives the offset of
+    the chunk that holds the i-th top-level statement.
+
+    The parser defaults to the scan backend (the same tokens as the PLY
+    lexer, faster on small chunks).
+    """
+
+    def __init__(self, source="", parser=None):
+        if parser is None:
+            parser = Parser(backend="scan")
+            parser.build()
+        self.parser = parser
+        self.tree = Node("module")
+        self._statements = []
+        self._chunks = []
+        # per chunk: characters, newlines and statements, summed to find them
+        self._chars = _Sums()
+        self._lines = _Sums()
+        self._stmts = _Sums()
+        self._replace(0, 0, source, 1)
+
+    @property
+    def text(self):
+        return "".join(chunk.text for chunk in self._chunks)
+
+    @property
+    def errors(self):
+        out = []
+        line = 1
+        for chunk in self._chunks:
+            out.extend(chunk.errors_at(line))
+            line += chunk.lines
+        return out
+
+    def chunk_start(self, stmt):
+        """Offset in self.text of the chunk holding top-level statement number stmt."""
+        if not 0 <= stmt < self._stmts.prefix(len(self._chunks)):
+            raise IndexError("statement index out of range")
+        return self._chars.prefix(self._stmts.find(stmt))
+
+    def _parse(self, text, line, first):
+        parser = self.parser
+        ast = parser.parse(text, lineno=line, after_statement=not first)
+        if ast is None:
+            return None, parser.lexer.errors + parser.errors
+        return list(ast.children), parser.lexer.errors + parser.errors
+
+    def _parse_chunk(self, text, line, first=False):
+        """
+        Parses a chunk where it is in the document: after a statement unless
+        it is the first one, and followed by _PROBE to see whether it's done.
+        """
+        if text.endswith("\n"):
+            statements, errors = self._parse(text + _PROBE, line, first)
+            if (statements and statements[-1].type == "pass" and statements[-1].start == len(text)
+                    and bracket_depth(text) == 0
+                    and not _on_line(errors, line + text.count("\n"))
+                    and not any(_AT_END in msg or _AT_DEDENT in msg for msg in errors)):
+                statements.pop()
+                return _Chunk(text, statements, errors, line, first, False)
+        statements, errors = self._parse(text, line, first)
+        open_ = bracket_depth(text) > 0 or any(_AT_END in msg or _AT_DEDENT in msg for msg in errors)
+        if statements is None:
+            return _Chunk(text, [], errors, line, first, True, True)
+        return _Chunk(text, statements, errors, line, first, open_ or text.endswith("\n"))
+
+    def _follow(self, head, tail, line):
+        """
+        tail comes right after head, which starts at line, and
+        _follows(head, tail): the two chunks if they parse the same together
+        as apart, else the one chunk they make together.
+        """
+        joined = self._parse_chunk(head.text + tail.text, line, head.first)
+        if (joined.errors == head.errors_at(line) + tail.errors_at(line + head.lines)
+                and repr(joined.statements) == repr(head.statements + tail.statements)):
+            return [head, tail]
+        return [joined]
+
+    def _settle(self, chunks, i, line):
+        """
+        Joins the last of chunks, which start at line and replace chunks i..,
+        with the ones before it while they parse differently apart, then
+        the first one with the chunks above i the same way; returns the new
+        i and line.
+        """
+        old = self._chunks
+        while chunks:
+            if len(chunks) > 1:
+                head, at = chunks[-2], chunks[-2].line
+            elif i > 0:
+                head = old[i - 1]
+                at = line - head.lines
+            else:
+                break
+            if not _follows(head, chunks[-1]):
+                break
+            followed = self._follow(head, chunks[-1], at)
+            if len(followed) == 2:
+                break
+            if len(chunks) > 1:
+                chunks[-2:] = followed
+            else:
+                chunks[0] = followed[0]
+                i -= 1
+                line = at
+        return i, line
+
+    def _replace(self, i, k, region, line):
+        """Replaces chunks i..k-1 by the chunks of region, which starts at line; returns how many."""
+        old = self._chunks
+        chunks = []
+        bounds = split_statements(region)
+        bounds.append(len(region))
+        at = line
+        for a, b in zip(bounds, bounds[1:]):
+            if a == b:
+                continue
+            text = region[a:b]
+            chunks.append(self._parse_chunk(text, at, i == 0 and not chunks))
+            at += text.count("\n")
+            i, line = self._settle(chunks, i, line)
+        if not chunks and k < len(old):
+            # whole chunks were deleted: the ones around them meet now
+            if i > 0:
+                i -= 1
+                line -= old[i].lines
+                chunks.append(self._parse_chunk(old[i].text, line, old[i].first))
+            else:
+                chunks.append(self._parse_chunk(old[k].text, line, True))
+                k += 1
+        # the last chunk may reach into the ones below
+        while chunks and k < len(old) and _follows(chunks[-1], old[k]):
+            n = len(chunks)
+            chunks.append(old[k])
+            i, line = self._settle(chunks, i, line)
+            if len(chunks) > n:
+                chunks.pop()
+                break
+            k += 1
+
+        first = self._stmts.prefix(i)
+        last = first + sum(len(chunk.statements) for chunk in old[i:k])
+        self._statements[first:last] = [stmt for chunk in chunks for stmt in chunk.statements]
+        if len(chunks) == k - i:
+            for n, (was, now) in enumerate(zip(old[i:k], chunks), i):
+                self._chars.add(n, len(now.text) - len(was.text))
+                self._lines.add(n, now.lines - was.lines)
+                self._stmts.add(n, len(now.statements) - len(was.statements))
+            old[i:k] = chunks
+        else:
+            old[i:k] = chunks
+            self._chars.rebuild([len(chunk.text) for chunk in old])
+            self._lines.rebuild([chunk.lines for chunk in old])
+            self._stmts.rebuild([len(chunk.statements) for chunk in old])
+        # like a full parse, which has no tree at all then
+        self.tree.children = [] if old and old[-1].gave_up else self._statements
+        return len(chunks)
+
+    def edit(self, offset, deleted, inserted):
+        """
+        Applies a text edit (delete `deleted` characters at `offset`, then
+        insert `inserted` there) and returns the updated tree.
+        """
+        chunks = self._chunks
+        n = len(chunks)
+        size = self._chars.prefix(n)
+        if offset < 0 or deleted < 0 or offset + deleted > size:
+            raise ValueError(f"edit ({offset}, {deleted}) is outside the document")
+        if not n:
+            self._replace(0, 0, inserted, 1)
+            return self.tree
+
+        i = min(self._chars.find(offset), n - 1)
+        first_line = chunks[i].text.find("\n")
+        if first_line < 0:
+            first_line = len(chunks[i].text)
+        if i > 0 and offset - self._chars.prefix(i) <= first_line:
+            # an edit on the first line of chunk i may join it to the chunk
+            # above (an indented line, or one that now starts with else/elif)
+            i -= 1
+        k = min(self._chars.find(offset + deleted), n - 1) + 1
+
+        lo = self._chars.prefix(i)
+        old = "".join(chunk.text for chunk in chunks[i:k])
+        region = old[:offset - lo] + inserted + old[offset + deleted - lo:]
+        self._replace(i, k, region, 1 + self._lines.prefix(i))
+        return self.tree
@@ -0,0 +1,435 @@
+# Interpreter.py - run Parser.Node trees by compiling them into closures
+#
+#   python Interpreter.py program.py
+#
+# Every node is turned once into a Python closure that takes the frame (a
+# list of local slots) and evaluates the node, so running a program never
+# looks at node.type again. Names come resolved from Symbols.analyze():
+# locals are slot indexes, locals shared with nested functions are VM.Cell
+# objects in their slot, and everything else is a global (or a builtin).
+#
+# Fangless calls are Python calls here, so deep Fangless recursion hits
+# Python's recursion limit much sooner than VM.py does.
+import argparse
+import ast
+import operator
+import sys
+
+import Bytecode
+import Symbols
+from Parser import Node
+from VM import BUILTINS, UNBOUND, Cell
+
+BINARY = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+    "//": operator.floordiv, "%": operator.mod, "**": operator.pow,
+}
+COMPARISON = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, ">": operator.gt,
+    "<=": operator.le, ">=": operator.ge, "in": lambda a, b: a in b, "is": operator.is_,
+}
+
+
+class Function(object):
+    """A compiled Fangless function, called like a Python one."""
+    __slots__ = ("__name__", "argcount", "defaults", "extra", "cell_slots", "body")
+
+    def __init__(self, name, argcount, defaults, extra, cell_slots, body):
+        self.__name__ = name
+        self.argcount = argcount
+        self.defaults = defaults
+        self.extra = extra            # the other locals (UNBOUND) and then the closure cells
+        self.cell_slots = cell_slots
+        self.body = body
+
+    def __repr__(self):
+        return f"<function {self.__name__}>"
+
+    def __call__(self, *args):
+        if len(args) != self.argcount:
+            missing = self.argcount - len(args)
+            if missing < 0 or missing > len(self.defaults):
+                raise TypeError(f"{self.__name__}() takes {self.argcount} arguments but {len(args)} were given")
+            args += self.defaults[len(self.defaults) - missing:]
+        frame = list(args)
+        if self.extra:
+            frame.extend(self.extra)
+        for i in self.cell_slots:
+            frame[i] = Cell(frame[i])
+        result = self.body(frame)
+        return result[0] if result is not None else None
+
+
+def _unbound(name):
+    raise UnboundLocalError(f"local variable '{name}' referenced before assignment")
+
+
+class Compiler(object):
+    """
+    module(tree) -> a function that runs the module in the globals dict.
+    Statement closures return None to go on, or a 1-tuple with the value
+    of a return statement.
+    """
+
+    def __init__(self, globals):
+        self.globals = globals
+        self.symbols = None
+        self.slots = {}       # name -> slot of the function being compiled
+        self.cells = set()    # names whose slot holds a Cell
+
+    def module(self, tree):
+        if tree is None:
+            raise Bytecode.CompileError("nothing to compile")
+        self.symbols = Symbols.analyze(tree)
+        try:
+            body = self.block(tree)
+        except RecursionError:
+            raise Bytecode.CompileError("expression nested too deeply") from None
+        return lambda: body([])
+
+    # ---- names ----
+
+    def load(self, name):
+        if name in self.slots:
+            i = self.slots[name]
+            if name in self.cells:
+                def load_cell(f):
+                    value = f[i].value
+                    if value is UNBOUND:
+                        _unbound(name)
+                    return value
+                return load_cell
+
+            def load_fast(f):
+                value = f[i]
+                if value is UNBOUND:
+                    _unbound(name)
+                return value
+            return load_fast
+
+        g = self.globals
+
+        def load_global(f):
+            try:
+                return g[name]
+            except KeyError:
+                try:
+                    return BUILTINS[name]
+                except KeyError:
+                    raise NameError(f"name '{name}' is not defined") from None
+        return load_global
+
+    def store(self, name):
+        """A function(frame, value) that assigns name."""
+        if name in self.slots:
+            i = self.slots[name]
+            if name in self.cells:
+                def store_cell(f, value):
+                    f[i].value = value
+                return store_cell
+
+            def store_fast(f, value):
+                f[i] = value
+            return store_fast
+        g = self.globals
+
+        def store_global(f, value):
+            g[name] = value
+        return store_global
+
+    def store_target(self, target):
+        if target.type == "identifier":
+            return self.store(target.value)
+        if target.type in ("tuple", "list"):
+            stores = [self.store_target(item) for item in target.children]
+            n = len(stores)
+
+            def unpack(f, value):
+                items = list(value)
+                if len(items) != n:
+                    raise ValueError(f"expected {n} values to unpack, got {len(items)}")
+                for store, item in zip(stores, items):
+                    store(f, item)
+            return unpack
+        raise Bytecode.CompileError(f"cannot assign to {target.type}")
+
+    # ---- statements ----
+
+    def block(self, suite):
+        stmts = [self.statement(s) for s in Bytecode._statements(suite)]
+        stmts = [s for s in stmts if s is not None]
+        if len(stmts) == 1:
+            return stmts[0]
+
+        def run_block(f):
+            for stmt in stmts:
+                result = stmt(f)
+                if result is not None:
+                    return result
+        return run_block
+
+    def statement(self, node):
+        t = node.type
+        if t == "assignment":
+            value = self.expr(node.children[0])
+            if node.value in self.slots and node.value not in self.cells:
+                i = self.slots[node.value]
+
+                def assign_fast(f):
+                    f[i] = value(f)
+                return assign_fast
+            store = self.store(node.value)
+
+            def assign(f):
+                store(f, value(f))
+            return assign
+        if t == "expression_stmt":
+            return self.expression_statement(node.children[0])
+        if t == "return":
+            if not node.children:
+                return lambda f: (None,)
+            value = self.expr(node.children[0])
+            return lambda f: (value(f),)
+        if t == "if":
+            return self.if_statement(node)
+        if t == "while":
+            cond = self.expr(node.children[0])
+            body = self.block(node.children[1])
+
+            def while_loop(f):
+                while cond(f):
+                    result = body(f)
+                    if result is not None:
+                        return result
+            return while_loop
+        if t == "for":
+            target, iterable, body = node.children
+            store = self.store_target(target)
+            iterable = self.expr(iterable)
+            body = self.block(body)
+
+            def for_loop(f):
+                for item in iterable(f):
+                    store(f, item)
+                    result = body(f)
+                    if result is not None:
+                        return result
+            return for_loop
+        if t == "function_def":
+            return self.function_def(node)
+        if t == "pass":
+            return None
+        if t == "suite":
+            return self.block(node)
+        if t == "error":
+            raise Bytecode.CompileError("the program has syntax errors")
+        return self.expression_statement(node)
+
+    def expression_statement(self, node):
+        value = self.expr(node)
+
+        def discard(f):
+            value(f)
+        return discard
+
+    def if_statement(self, node):
+        clauses = [(node.children[0], node.children[1])]
+        orelse = None
+        for extra in node.children[2:]:
+            if isinstance(extra, list):
+                clauses.extend((elif_.children[0], elif_.children[1]) for elif_ in extra)
+            else:
+                orelse = extra
+        compiled = [(self.expr(cond), self.block(body)) for cond, body in clauses]
+        orelse = self.block(orelse) if orelse is not None else None
+        if len(compiled) == 1:
+            (cond, body), = compiled
+
+            def if_else(f):
+                if cond(f):
+                    return body(f)
+                if orelse is not None:
+                    return orelse(f)
+            return if_else
+
+        def if_chain(f):
+            for cond, body in compiled:
+                if cond(f):
+                    return body(f)
+            if orelse is not None:
+                return orelse(f)
+        return if_chain
+
+    def function_def(self, node):
+        params, _ = node.children
+        scope = self.symbols.scope_of(node)
+        defaults = [self.expr(p.children[0]) for p in params.children if p.children]
+        # the cells the new function closes over, from the frame that defines it
+        closure = [self.slots[name] for name in sorted(scope.frees)]
+        store = self.store(node.value)
+
+        outer = (self.slots, self.cells)
+        # the function's own slots, then one for each cell it closes over
+        self.slots = dict(scope.slots)
+        for name in sorted(scope.frees):
+            self.slots[name] = len(self.slots)
+        self.cells = scope.cells | scope.frees
+        cell_slots = tuple(self.slots[name] for name in sorted(scope.cells))
+        body = self.block(scope.node.children[1])
+        self.slots, self.cells = outer
+
+        name = node.value
+        argcount = len(scope.params)
+        unbound = (UNBOUND,) * (len(scope.slots) - argcount)
+
+        def define(f):
+            extra = unbound + tuple(f[i] for i in closure)
+            store(f, Function(name, argcount, tuple(d(f) for d in defaults), extra, cell_slots, body))
+        return define
+
+    # ---- expressions ----
+
+    def expr(self, node):
+        if not isinstance(node, Node):
+            # the missing bounds of a slice
+            return lambda f: node
+        t = node.type
+        if t == "identifier":
+            return self.load(node.value)
+        if t in ("number", "string", "boolean", "none"):
+            value = self.constant(node)
+            return lambda f: value
+        if t == "binary_op":
+            return self.binary(node)
+        if t == "comparison":
+            op = COMPARISON[node.value.lower()]
+            left, right = node.children
+            if right.type == "number":
+                b = right.value
+                left = self.expr(left)
+                if op is operator.eq:
+                    return lambda f: left(f) == b
+                if op is operator.lt:
+                    return lambda f: left(f) < b
+                return lambda f: op(left(f), b)
+            left, right = self.expr(left), self.expr(right)
+            return lambda f: op(left(f), right(f))
+        if t == "unary_op":
+            operand = self.expr(node.children[0])
+            if node.value == "-":
+                return lambda f: -operand(f)
+            return lambda f: not operand(f)
+        if t == "boolean_op":
+            left, right = (self.expr(c) for c in node.children)
+            if node.value.lower() == "and":
+                return lambda f: left(f) and right(f)
+            return lambda f: left(f) or right(f)
+        if t == "call":
+            return self.call(node)
+        if t == "subscript":
+            target, index = (self.expr(c) for c in node.children)
+            return lambda f: target(f)[index(f)]
+        if t == "slice":
+            lower, upper = (self.expr(c) for c in node.children)
+            return lambda f: slice(lower(f), upper(f))
+        if t == "attribute":
+            target = self.expr(node.children[0])
+            name = node.value
+            return lambda f: getattr(target(f), name)
+        if t in ("list", "tuple", "set"):
+            items = [self.expr(c) for c in node.children]
+            build = {"list": list, "tuple": tuple, "set": set}[t]
+            return lambda f: build([item(f) for item in items])
+        if t == "dict":
+            pairs = [(self.expr(p.children[0]), self.expr(p.children[1])) for p in node.children]
+            return lambda f: {k(f): v(f) for k, v in pairs}
+        raise Bytecode.CompileError(f"cannot compile {t} nodes")
+
+    def constant(self, node):
+        t = node.type
+        if t == "number":
+            return node.value
+        if t == "string":
+            return ast.literal_eval(node.value)
+        if t == "boolean":
+            return node.value.lower() == "true"
+        return None
+
+    def binary(self, node):
+        op = BINARY[node.value]
+        left, right = node.children
+        if right.type == "number":
+            # n - 1, i + 1, ...
+            b = right.value
+            left = self.expr(left)
+            if op is operator.add:
+                return lambda f: left(f) + b
+            if op is operator.sub:
+                return lambda f: left(f) - b
+            return lambda f: op(left(f), b)
+        left, right = self.expr(left), self.expr(right)
+        if op is operator.add:
+            return lambda f: left(f) + right(f)
+        if op is operator.sub:
+            return lambda f: left(f) - right(f)
+        return lambda f: op(left(f), right(f))
+
+    def call(self, node):
+        args = node.children
+        if node.value is not None:
+            func = self.load(node.value)
+        else:
+            func = self.expr(args[0])
+            args = args[1:]
+        args = [self.expr(a) for a in args]
+        if not args:
+            return lambda f: func(f)()
+        if len(args) == 1:
+            a, = args
+            return lambda f: func(f)(a(f))
+        if len(args) == 2:
+            a, b = args
+            return lambda f: func(f)(a(f), b(f))
+        return lambda f: func(f)(*[a(f) for a in args])
+
+
+def compile_tree(tree, globals=None):
+    """A function that runs the module tree in globals (a new dict by default) and returns them."""
+    if globals is None:
+        globals = {}
+    body = Compiler(globals).module(tree)
+
+    def run_module():
+        body()
+        return globals
+    return run_module
+
+
+def run(tree, globals=None):
+    """Runs a module tree and returns its globals."""
+    return compile_tree(tree, globals)()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run a Fangless Python program with the closure interpreter")
+    ap.add_argument("file")
+    args = ap.parse_args(argv)
+    with open(args.file, "r", encoding="utf-8") as f:
+        source = f.read()
+    from Parser import Parser
+    parser = Parser()
+    parser.build()
+    tree = parser.parse(source)
+    if tree is None or parser.errors or parser.lexer.errors:
+        print("; ".join(parser.lexer.errors + parser.errors) or "no tree", file=sys.stderr)
+        return 1
+    try:
+        run(tree)
+    except Bytecode.CompileError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,14 @@
 # Based on https://github.com/ThaisBarrosAlvim/mini-compiler-python/blob/master/src/lexer.py
 # and https://github.com/dabeaz/ply/blob/master/example/GardenSnake/GardenSnake.py 
+import array
+import bisect
+import functools
+import importlib.util
+import logging
+import os
 import ply.lex as lex
 import sys
-
-errors = []
-indent_stack = [0]
+import TableCache
 
 reserved = {
     'and': 'AND',
@@ -132,6 +136,8 @@ def t_NUMBER(t):
 
 def t_ID(t):
     r'[a-zA-Z_][a-zA-Z0-9_]*'
+    # one string per distinct name (and keyword), however often it appears
+    t.value = sys.intern(t.value)
     t_lower = t.value.lower()
     t.type = reserved.get(t_lower, 'ID')
     return t
@@ -142,29 +148,121 @@ def t_COMMENT(t):
     return t
 
 def t_error(t):
-    errors.append(f"Illegal character '{t.value[0]}' at line {t.lineno}")
-    print("Skip error: ", errors[-1])
+    column = line_index(t.lexer).column(t.lexpos)
+    report(t.lexer, f"Illegal character '{t.value[0]}' at line {t.lineno}, column {column}")
     t.lexer.skip(1)
 
+
+def make_sink(diagnostics):
+    """
+    Turns a diagnostics target into a function taking one message: a list
+    collects the messages, a logging.Logger gets them as warnings and any
+    other callable is called with them. None means no sink.
+    """
+    if diagnostics is None or callable(diagnostics) and not isinstance(diagnostics, logging.Logger):
+        return diagnostics
+    if isinstance(diagnostics, list):
+        return diagnostics.append
+    if isinstance(diagnostics, logging.Logger):
+        return diagnostics.warning
+    raise TypeError(f"diagnostics must be a list, a callable or a logging.Logger, not {type(diagnostics).__name__}")
+
+
+def report(lexer, msg):
+    """Records a lexer diagnostic in lexer.errors and passes it to the lexer's sink."""
+    lexer.errors.append(msg)
+    if lexer.sink is not None:
+        lexer.sink(msg)
+
+
+class LineIndex(object):
+    """
+    Offsets where the lines of a text start, built once per input, so any
+    offset (a token's lexpos, a Node's start or end) maps to its line and
+    column by binary search. Lines are numbered from first_line, columns
+    from 1.
+    """
+    __slots__ = ("starts", "first_line")
+
+    def __init__(self, text, first_line=1):
+        starts = [0]
+        find = text.find
+        i = find("\n")
+        while i != -1:
+            starts.append(i + 1)
+            i = find("\n", i + 1)
+        self.starts = starts
+        self.first_line = first_line
+
+    @classmethod
+    def from_file(cls, path, first_line=1, encoding="utf-8", chunk_size=1 << 20):
+        """The LineIndex of a file, read a chunk at a time (offsets count characters, like lexpos)."""
+        index = cls.__new__(cls)
+        starts = array.array("q", [0])
+        base = 0
+        last = ""
+        with open(path, "r", encoding=encoding) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                last = chunk[-1]
+                find = chunk.find
+                i = find("\n")
+                while i != -1:
+                    starts.append(base + i + 1)
+                    i = find("\n", i + 1)
+                base += len(chunk)
+        if last != "\n":
+            # the lexers add the missing final newline
+            starts.append(base + 1)
+        index.starts = starts
+        index.first_line = first_line
+        return index
+
+    def line(self, offset):
+        return bisect.bisect_right(self.starts, offset) - 1 + self.first_line
+
+    def column(self, offset):
+        return offset - self.starts[bisect.bisect_right(self.starts, offset) - 1] + 1
+
+    def position(self, offset):
+        """(line, column) of offset."""
+        i = bisect.bisect_right(self.starts, offset) - 1
+        return i + self.first_line, offset - self.starts[i] + 1
+
+    def offset(self, line, column=1):
+        """Inverse of position()."""
+        return self.starts[line - self.first_line] + column - 1
+
+
+def line_index(lexer):
+    """The LineIndex of the text the (PLY) lexer is reading, made on first use."""
+    lines = getattr(lexer, "lines", None)
+    if lines is None:
+        lines = lexer.lines = LineIndex(lexer.lexdata, getattr(lexer, "first_line", 1))
+    return lines
+
 # INDENT states
 NO_INDENT = 0
 MIGHT_INDENT = 1
 MUST_INDENT = 2
 
-def _new_token_manual(type, lineno=None, lexer=None):
+def _new_token_manual(type, lineno=None, lexer=None, lexpos=0):
+    # synthetic tokens are empty: they start and end where the next real token starts
     tok = lex.LexToken()
-    tok.lexpos = 0
+    tok.lexpos = tok.endlexpos = lexpos
     # poner value = type para que p.value no sea None (mejor diagnóstico)
     tok.value = type
     tok.type = type
     tok.lineno = lineno if lineno is not None else (lexer.lineno if lexer else 0)
     return tok
 
-def DEDENT(lineno):
-    return _new_token_manual("DEDENT", lineno)
+def DEDENT(lineno, lexpos=0):
+    return _new_token_manual("DEDENT", lineno, lexpos=lexpos)
 
-def INDENT(lineno):
-    return _new_token_manual("INDENT", lineno)
+def INDENT(lineno, lexpos=0):
+    return _new_token_manual("INDENT", lineno, lexpos=lexpos)
 
 def track_indent(lexer, tokens):
     """
@@ -176,6 +274,8 @@ def track_indent(lexer, tokens):
     for token in tokens:
         token.at_line_start = getattr(lexer, "at_line_start", False)
         token.must_indent = False
+        # PLY has just moved lexpos past this token
+        token.endlexpos = lexer.lexpos
 
         if token.type == "COLON" or token.type == "LKEY":
             indent_state = MIGHT_INDENT
@@ -206,9 +306,10 @@ def filter_indent(tokens, lexer):
     """
     Process tokens to handle Python-style indentation and dedentation.
     Emits INDENT/DEDENT tokens appropriately.
+    The indentation stack and the error list live on the lexer, so every
+    lexer instance keeps its own state.
     """
-    global indent_stack
-    indent_stack = [0]
+    indent_stack = lexer.indent_stack = [0]
     pending_whitespace = None
     depth = 0
     last_token_type = None
@@ -245,13 +346,11 @@ def filter_indent(tokens, lexer):
             if depth < indent_stack[-1]:
                 # Emit DEDENTs until stack matches current depth
                 while depth < indent_stack[-1]:
-                    yield DEDENT(token.lineno)
+                    yield DEDENT(token.lineno, token.lexpos)
                     indent_stack.pop()
                 # If after popping we don't match depth, it's an inconsistency:
                 if depth != indent_stack[-1]:
-                    msg = f"Inconsistent indentation at line {token.lineno}"
-                    errors.append(msg)
-                    print(msg)
+                    report(lexer, f"Inconsistent indentation at line {token.lineno}")
 
         # Handle indentation logic before yielding next real token
         if pending_whitespace is not None:
@@ -260,20 +359,18 @@ def filter_indent(tokens, lexer):
                     if depth <= indent_stack[-1]:
                         raise IndentationError("Block must be indented")
                     indent_stack.append(depth)
-                    yield INDENT(token.lineno)
+                    yield INDENT(token.lineno, token.lexpos)
                 elif token.at_line_start:
                     # Same or dedented line
                     if depth > indent_stack[-1]:
                         raise IndentationError("Unexpected indentation increase")
                     while depth < indent_stack[-1]:
-                        yield DEDENT(token.lineno)
+                        yield DEDENT(token.lineno, token.lexpos)
                         indent_stack.pop()
                     if depth != indent_stack[-1]:
                         raise IndentationError("Inconsistent indentation")
             except IndentationError as e:
-                msg = f"Indentation Error at line {token.lineno}: {str(e)}"
-                errors.append(msg)
-                print(msg)
+                report(lexer, f"Indentation Error at line {token.lineno}: {str(e)}")
             finally:
                 pending_whitespace = None
 
@@ -286,7 +383,7 @@ def filter_indent(tokens, lexer):
 
     # At EOF: emit DEDENTs for any remaining indentation
     while len(indent_stack) > 1:
-        yield DEDENT(token.lineno if token else 0)
+        yield DEDENT(token.lineno if token else 0, lexer.lexlen)
         indent_stack.pop()
 
 
@@ -299,40 +396,132 @@ def final_indent(lexer, add_endmarker=True):
         yield token
     
     if add_endmarker:
-        end_token = _new_token_manual("ENDMARKER", lexer.lineno)
+        end_token = _new_token_manual("ENDMARKER", lexer.lineno, lexpos=lexer.lexlen)
         end_token.value = ""
         yield end_token
 
+def profiled_indent(lexer, profile):
+    """final_indent without the ENDMARKER, with every stage timed by a Profile.ParseProfile."""
+    tokens = profile.timed(iter(lexer.token, None), "lex")
+    tokens = profile.timed(track_indent(lexer, tokens), "track_indent")
+    return profile.timed(filter_indent(tokens, lexer), "filter_indent")
+
+
+def lexer_key(reflags=0):
+    """
+    Hash of everything the master regex depends on: the token list, the
+    string rules, and the function rules in the order PLY adds them.
+    """
+    module = sys.modules[__name__]
+    rules = vars(module)
+    strings = sorted((k, v) for k, v in rules.items() if k.startswith("t_") and isinstance(v, str))
+    funcs = sorted((v for k, v in rules.items() if k.startswith("t_") and callable(v)),
+                   key=lambda f: f.__code__.co_firstlineno)
+    return TableCache.fingerprint(lex.__tabversion__, reflags, tokens, strings,
+                                  [(f.__name__, f.__doc__) for f in funcs])
+
+
+def _load_lextab(path):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    tab = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tab)
+    return tab
+
+
+@functools.lru_cache(maxsize=None)
+def _master_lexer(debug, reflags, cache_dir):
+    """
+    Builds (or loads from cache_dir) the PLY lexer once per process.
+    IndentLexer instances clone it instead of compiling the regex again.
+    """
+    module = sys.modules[__name__]
+    cache_dir = TableCache.resolve_cache_dir(cache_dir)
+    if not TableCache.ensure_dir(cache_dir):
+        return lex.lex(module=module, debug=debug, reflags=reflags)
+
+    final = os.path.join(cache_dir, f"lextab_{lexer_key(reflags)}.py")
+    if os.path.exists(final):
+        try:
+            return lex.lex(module=module, optimize=1, lextab=_load_lextab(final), reflags=reflags)
+        except Exception:
+            pass  # stale or unreadable table: fall through and rebuild it
+
+    lexobj = lex.lex(module=module, debug=debug, reflags=reflags)
+    tmp = TableCache.temp_path(cache_dir, "lextab_", ".py")
+    try:
+        lexobj.writetab(os.path.basename(tmp)[:-3], cache_dir)
+    except IOError:
+        pass
+    TableCache.publish(tmp, final)
+    return lexobj
+
+
 class IndentLexer(object):
-    def __init__(self, debug=0, reflags=0):
-        self._inner = lex.lex(debug=debug, reflags=reflags)
+    """
+    Indentation-aware token stream. Diagnostics are collected in self.errors
+    and, when given, also passed to `diagnostics` (see make_sink); nothing
+    is printed.
+    """
+    def __init__(self, debug=0, reflags=0, cache_dir=None, diagnostics=None):
+        self._inner = _master_lexer(debug, reflags, cache_dir).clone()
+        self._inner.sink = make_sink(diagnostics)
+        self._inner.errors = self.errors = []
+        self._inner.indent_stack = [0]
         self.token_stream = None
         self._endmarker_emitted = False
         self.add_endmarker = True
-
-    def input(self, s, add_endmarker=True):
-        global indent_stack
-        indent_stack = [0]  
+        self.token_count = 0
+        self.profile = None  # a Profile.ParseProfile to time the pipeline stages with
+        self.structure = None  # a Structure.StructureIndex to fill in while lexing
+
+    @property
+    def indent_stack(self):
+        return self._inner.indent_stack
+
+    @property
+    def lines(self):
+        """LineIndex of the current input."""
+        return line_index(self._inner)
+
+    def input(self, s, add_endmarker=True, lineno=1):
+        self._inner.errors = self.errors = []
+        self._inner.indent_stack = [0]
         if s is None:
             s = ""
         if not s.endswith("\n"):
             s = s + "\n"
         self.add_endmarker = add_endmarker
         self._endmarker_emitted = False
+        self.token_count = 0
         self._inner.input(s)
         self._inner.at_line_start = True
 
-        self._inner.lineno = 1 
-        self.token_stream = final_indent(self._inner, add_endmarker=False)
+        self._inner.lineno = self._inner.first_line = lineno
+        self._inner.lines = None
+        if self.profile is None:
+            self.token_stream = final_indent(self._inner, add_endmarker=False)
+        else:
+            self.token_stream = profiled_indent(self._inner, self.profile)
+        if self.structure is not None:
+            self.structure.first_line = lineno
+            self.token_stream = self.structure.scan(self.token_stream)
+
+    def stream(self, s, add_endmarker=True, lineno=1):
+        """Lexes s and returns an iterator over its tokens, ENDMARKER included."""
+        self.input(s, add_endmarker=add_endmarker, lineno=lineno)
+        return iter(self.token, None)
 
     def token(self):
         try:
             tok = next(self.token_stream)
+            self.token_count += 1
             return tok
         except StopIteration:
             if not self._endmarker_emitted and self.add_endmarker:
                 self._endmarker_emitted = True
-                end_tok = _new_token_manual("ENDMARKER", getattr(self._inner, "lineno", 0), lexer=self._inner)
+                end_tok = _new_token_manual("ENDMARKER", getattr(self._inner, "lineno", 0), lexer=self._inner,
+                                            lexpos=self._inner.lexlen)
+                self.token_count += 1
                 return end_tok
             return None
 
@@ -354,6 +543,7 @@ if __name__ == "__main__":
         print("Usage:\n\tpy lexer.py -f <filename>\n\tpy lexer.py -t <text>")
         sys.exit(1)
 
+    lexer = IndentLexer()
     lexer.input(data)
     while True:
         tok = lexer.token()
@@ -362,7 +552,7 @@ if __name__ == "__main__":
         print(tok)
     
     # All errors found
-    if errors:
+    if lexer.errors:
         print("\n===== Resume: ALL ERRORS FOUND =====")
-        for error in errors:
+        for error in lexer.errors:
             print(error)
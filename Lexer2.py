@@ -1,80 +1,73 @@
-# debug_tokens.py
+# Lexer2.py - token and bracket debugging for one file
+#
+#   python Lexer2.py <archivo> [--lines 45-75] [--blocks] [--backend scan]
+#
+# Lexes the file once with a Structure.StructureIndex attached: prints the
+# tokens of the chosen lines (all of them by default) with the depth of
+# brackets they're in, then the unmatched brackets, and with --blocks every
+# block with its lines.
+import argparse
 import sys
-sys.path.append('.')  # para cargar los módulos locales
+
 import Lexer
+import Scanner
+import Structure
+
 
-if len(sys.argv) < 2:
-    print("Uso: python debug_tokens.py <archivo>")
-    sys.exit(1)
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Print the tokens and the bracket nesting of a file")
+    ap.add_argument("file")
+    ap.add_argument("--lines", default=None, help="only print the tokens of these lines, e.g. 45-75")
+    ap.add_argument("--blocks", action="store_true", help="list the blocks and the lines they span")
+    ap.add_argument("--backend", choices=("ply", "scan"), default="ply", help="lexer backend")
+    args = ap.parse_args(argv)
 
-fname = sys.argv[1]
-with open(fname, "r", encoding="utf-8") as f:
-    src = f.read()
+    first, last = 1, None
+    if args.lines:
+        first, _, last = args.lines.partition("-")
+        first, last = int(first), int(last or first)
 
-lex = Lexer.IndentLexer()
-lex.input(src)
+    lexer = Lexer.IndentLexer() if args.backend == "ply" else Scanner.ScanLexer()
+    index = lexer.structure = Structure.StructureIndex()
+    if args.backend == "scan":
+        lexer.input_file(args.file)
+    else:
+        with open(args.file, "r", encoding="utf-8") as f:
+            lexer.input(f.read())
 
-paren_stack = []  # stack of (token, lineno, col approximate)
-line_positions = src.splitlines(True)
+    print("=== TOKENS (lineno, type, value) and bracket nesting ===")
+    depth = 0
+    out = sys.stdout
+    for tok in iter(lexer.token, None):
+        if tok.type in Structure.CLOSERS:
+            depth = max(depth - 1, 0)
+        if tok.lineno >= first and (last is None or tok.lineno <= last):
+            col = index.lines.column(tok.lexpos)
+            out.write(f"{tok.lineno:3} {tok.type:12} {repr(tok.value):30} col={col:<4} {'(' * depth}\n")
+        if tok.type in Structure.OPENERS:
+            depth += 1
 
-def token_pos(tok):
-    # approximate column: find tok.value in its line (best-effort)
-    try:
-        linetext = line_positions[tok.lineno - 1]
-        col = linetext.find(str(tok.value))
-        if col == -1:
-            col = 0
-    except Exception:
-        col = 0
-    return col
+    print("\n=== BRACKETS ===")
+    print(f"{len(index.opens)} opened, {len(index.close_order)} matched")
+    for msg in index.errors:
+        print(msg)
+    if not index.errors:
+        print("All brackets matched at lexer level.")
 
-print("=== TOKENS (lineno, type, value) and bracket nesting ===")
-count = 0
-while True:
-    tok = lex.token()
-    if not tok:
-        break
-    count += 1
-    col = token_pos(tok)
-    t = f"{tok.lineno:3} {tok.type:12} {repr(tok.value):30} col={col}"
-    # update stack for brackets
-    if tok.type in ('LPAREN', 'LBRACKET', 'LKEY'):
-        paren_stack.append((tok.type, tok.lineno, col))
-    elif tok.type in ('RPAREN', 'RBRACKET', 'RKEY'):
-        # map closers to openers
-        expected = None
-        if tok.type == 'RPAREN': expected = 'LPAREN'
-        if tok.type == 'RBRACKET': expected = 'LBRACKET'
-        if tok.type == 'RKEY': expected = 'LKEY'
-        if not paren_stack:
-            t += "   <<UNMATCHED_CLOSER>>"
-        else:
-            opener, olineno, ocol = paren_stack[-1]
-            if opener != expected:
-                t += f"   <<MISMATCH opener={opener} at line {olineno}>>"
-                paren_stack.pop()
-            else:
-                paren_stack.pop()
-    print(t)
-    # stop early if many tokens
-    if count > 2000:
-        print("... too many tokens, stopped")
-        break
+    if args.blocks:
+        print("\n=== BLOCKS (lines, header first) ===")
+        for b, (start, end) in enumerate(index.folds()):
+            depth = 0
+            parent = index.block_parent[b]
+            while parent >= 0:
+                depth += 1
+                parent = index.block_parent[parent]
+            print(f"{'  ' * depth}{start}-{end}")
 
-print("\n=== STACK AFTER TOKENIZATION ===")
-if paren_stack:
-    for opener, lineno, col in paren_stack:
-        print(f"UNMATCHED opener {opener} at line {lineno} col={col}")
-else:
-    print("All brackets matched at lexer level.")
+    for msg in lexer.errors:
+        print(msg)
+    return 1 if index.errors or lexer.errors else 0
 
-# Also re-run lexer but print tokens around the problematic area (line ~50-70)
-print("\n=== TOKENS AROUND LINES 45-75 (for quick inspection) ===")
-lex.input(src)
-tok = lex.token()
-while tok:
-    if 45 <= tok.lineno <= 75:
-        print(f"{tok.lineno:3} {tok.type:12} {repr(tok.value)}")
-    tok = lex.token()
 
-print("\nDone.")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# Optimizer.py - constant folding over Parser.Node trees
+#
+# fold_constants(tree) evaluates the parts of expressions that only depend
+# on literals (arithmetic, comparisons, not/and/or, string/list/tuple
+# concatenation, repetition, indexing and slicing) and applies a few
+# algebraic identities. Anything that would raise at runtime (1 / 0,
+# "a" + 1, [1][5]) is left alone so it still raises when the program runs.
+import ast
+import math
+import operator
+
+from Parser import Node
+from Visitor import NodeTransformer
+
+# results bigger than this are not folded (the same limits CPython's own
+# folding uses), so a tiny expression like "a" * 10**9 stays tiny
+MAX_INT_BITS = 128
+MAX_STR_SIZE = 4096
+MAX_COLLECTION_SIZE = 256
+
+_NO = object()  # "not a constant"
+
+BINARY = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+    "//": operator.floordiv, "%": operator.mod, "**": operator.pow,
+}
+COMPARISON = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, ">": operator.gt,
+    "<=": operator.le, ">=": operator.ge, "in": lambda a, b: a in b,
+}
+
+
+def _const(node):
+    """The Python value of a literal node (lists and tuples of literals too), or _NO."""
+    if not isinstance(node, Node):
+        return _NO
+    t = node.type
+    if t == "number":
+        return node.value
+    if t == "string":
+        try:
+            return ast.literal_eval(node.value)
+        except (ValueError, SyntaxError):
+            return _NO
+    if t == "boolean":
+        return node.value.lower() == "true"
+    if t == "none":
+        return None
+    if t == "list" or t == "tuple":
+        if len(node.children) > MAX_COLLECTION_SIZE:
+            return _NO
+        items = []
+        for child in node.children:
+            v = _const(child)
+            if v is _NO:
+                return _NO
+            items.append(v)
+        return items if t == "list" else tuple(items)
+    return _NO
+
+
+def _literal(value, like):
+    """A node for value with the span of `like`, or None if value has no (small enough) literal."""
+    if value is True or value is False:
+        node = Node("boolean", "True" if value else "False")
+    elif value is None:
+        node = Node("none")
+    elif isinstance(value, int):
+        if value.bit_length() > MAX_INT_BITS:
+            return None
+        node = Node("number", value)
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        node = Node("number", value)
+    elif isinstance(value, str):
+        if len(value) > MAX_STR_SIZE:
+            return None
+        node = Node("string", repr(value))
+    elif isinstance(value, (list, tuple)):
+        if len(value) > MAX_COLLECTION_SIZE:
+            return None
+        items = []
+        for v in value:
+            item = _literal(v, like)
+            if item is None:
+                return None
+            items.append(item)
+        node = Node("list" if isinstance(value, list) else "tuple", None, items)
+    else:
+        return None
+    node.start = like.start
+    node.end = like.end
+    return node
+
+
+def _too_big(op, a, b):
+    """True when a op b would build a result over the size limits."""
+    if op == "**":
+        return (type(a) is int and type(b) is int and b > 0 and a not in (-1, 0, 1)
+                and a.bit_length() * b > MAX_INT_BITS)
+    if op == "%" and isinstance(a, str):
+        # printf-style widths can ask for any size ("%0999999999d" % 1)
+        return True
+    if op == "*":
+        for seq, n in ((a, b), (b, a)):
+            if isinstance(seq, (str, list, tuple)) and type(n) is int:
+                limit = MAX_STR_SIZE if isinstance(seq, str) else MAX_COLLECTION_SIZE
+                return len(seq) * n > limit
+    return False
+
+
+def _numeric(node):
+    """
+    "int" or "float" when node always evaluates to that type, "number" when
+    it is one of the two, else None. The language has no classes, so / and
+    // can only produce numbers (or raise).
+    """
+    if node.type == "number":
+        return "float" if isinstance(node.value, float) else "int"
+    if node.type == "binary_op":
+        if node.value == "/":
+            return "float"
+        if node.value == "//":
+            return "number"
+    return None
+
+
+def _identity(node, left, right):
+    """x * 1, 1 * x, x ** 1, x - 0, x / 1 and x + 0 for operands known to be numbers."""
+    op = node.value
+    a, b = _const(left), _const(right)
+    if op == "*":
+        if type(b) is int and b == 1 and _numeric(left):
+            return left
+        if type(a) is int and a == 1 and _numeric(right):
+            return right
+    elif op == "**" or op == "-":
+        if type(b) is int and b == (1 if op == "**" else 0) and _numeric(left):
+            return left
+    elif op == "/":
+        if type(b) is int and b == 1 and _numeric(left) == "float":
+            return left
+    elif op == "+":
+        # not for floats: -0.0 + 0 is 0.0
+        if type(b) is int and b == 0 and _numeric(left) == "int":
+            return left
+        if type(a) is int and a == 0 and _numeric(right) == "int":
+            return right
+    return node
+
+
+def _fold_binary_op(node):
+    left, right = node.children
+    a, b = _const(left), _const(right)
+    if a is _NO or b is _NO:
+        return _identity(node, left, right)
+    op = BINARY.get(node.value)
+    if op is None or _too_big(node.value, a, b):
+        return node
+    try:
+        return _folded(op(a, b), node)
+    except (ArithmeticError, TypeError, ValueError):
+        return node
+
+
+def _fold_unary_op(node):
+    a = _const(node.children[0])
+    if a is _NO:
+        return node
+    try:
+        return _folded(-a if node.value.lower() == "-" else not a, node)
+    except TypeError:
+        return node
+
+
+def _fold_comparison(node):
+    a, b = _const(node.children[0]), _const(node.children[1])
+    op = COMPARISON.get(node.value.lower())
+    if a is _NO or b is _NO or op is None:
+        return node
+    try:
+        return _folded(op(a, b), node)
+    except TypeError:
+        return node
+
+
+def _fold_boolean_op(node):
+    # short-circuit on a constant left operand: the result is one of the operands
+    left, right = node.children
+    a = _const(left)
+    if a is _NO:
+        return node
+    if node.value.lower() == "and":
+        return right if a else left
+    return left if a else right
+
+
+def _fold_subscript(node):
+    target, index = node.children
+    a = _const(target)
+    if not isinstance(a, (str, list, tuple)):
+        return node
+    if isinstance(index, Node) and index.type == "slice":
+        bounds = [None if c is None else _const(c) for c in index.children]
+        if any(v is _NO or not (v is None or type(v) is int) for v in bounds):
+            return node
+        return _folded(a[bounds[0]:bounds[1]], node)
+    i = _const(index)
+    if type(i) is not int:
+        return node
+    try:
+        return _folded(a[i], node)
+    except IndexError:
+        return node
+
+
+def _folded(value, node):
+    """The literal for value in place of node, or node when value has none."""
+    folded = _literal(value, node)
+    return node if folded is None else folded
+
+
+class ConstantFolder(NodeTransformer):
+    """Folds every node after its children (post-order), counting the replacements."""
+
+    def __init__(self):
+        self.folded = 0
+
+    def _replace(self, node, new):
+        if new is node:
+            return None
+        self.folded += 1
+        return new
+
+    def leave_binary_op(self, node):
+        return self._replace(node, _fold_binary_op(node))
+
+    def leave_unary_op(self, node):
+        return self._replace(node, _fold_unary_op(node))
+
+    def leave_comparison(self, node):
+        return self._replace(node, _fold_comparison(node))
+
+    def leave_boolean_op(self, node):
+        return self._replace(node, _fold_boolean_op(node))
+
+    def leave_subscript(self, node):
+        return self._replace(node, _fold_subscript(node))
+
+
+def fold_constants(root):
+    """
+    Folds the tree in place in one post-order pass (without recursion) and
+    returns (root, number of nodes replaced). Trees shared through
+    ParseCache should be copied first.
+    """
+    folder = ConstantFolder()
+    root = folder.visit(root)
+    return root, folder.folded
@@ -0,0 +1,118 @@
+# ParseCache.py - memoized Parser.parse keyed by the content of the source
+#
+# Results are kept in a bounded in-memory LRU and, optionally, on disk in
+# <cache_dir>/ast/<version>/, where version hashes the grammar, the lexer
+# rules and the storage format. Changing the grammar changes the version,
+# so old entries are never returned (prune() deletes them).
+import hashlib
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+
+import BinaryAST
+import Lexer
+import TableCache
+from Parser import Parser
+
+FORMAT_VERSION = 4
+
+
+class ParseCache:
+    """
+    parse(source) returns the same tree as Parser.parse(source) and sets
+    self.errors to the lexer and parser errors of that source. Trees are
+    shared between hits, so treat them as read-only.
+    """
+
+    def __init__(self, parser=None, max_entries=256, persistent=False, cache_dir=None):
+        if parser is None:
+            parser = Parser(cache_dir=cache_dir)
+            parser.build()
+        self.parser = parser
+        self.max_entries = max_entries
+        self.version = TableCache.fingerprint(FORMAT_VERSION, parser.grammar_key(), Lexer.lexer_key())
+        self.root = os.path.join(TableCache.resolve_cache_dir(cache_dir), "ast")
+        self.directory = os.path.join(self.root, self.version) if persistent else None
+        if self.directory and not TableCache.ensure_dir(self.directory):
+            self.directory = None
+        self._entries = OrderedDict()
+        self.errors = []
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "evictions": self.evictions, "entries": len(self._entries)}
+
+    def key(self, source):
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def parse(self, source):
+        key = self.key(source)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            entry = self._load(key)
+            if entry is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                tree = self.parser.parse(source)
+                entry = (tree, self.parser.lexer.errors + self.parser.errors)
+                if self.parser.stopped is not None:
+                    # out of a budget (maybe time): not the tree of source
+                    self.errors = list(entry[1])
+                    return tree
+                self._store(key, entry)
+            self._remember(key, entry)
+        tree, errors = entry
+        self.errors = list(errors)
+        return tree
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".ast")
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                blob, errors = pickle.load(f)
+            return BinaryAST.loads(blob), errors
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return None
+
+    def _store(self, key, entry):
+        if self.directory is None:
+            return
+        tree, errors = entry
+        tmp = TableCache.temp_path(self.directory, key, ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump((BinaryAST.dumps(tree), errors), f, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+        TableCache.publish(tmp, self._path(key))
+
+    def clear(self):
+        """Forgets the in-memory entries (the disk tier is kept)."""
+        self._entries.clear()
+
+    def prune(self):
+        """Deletes on-disk entries written for other grammar versions."""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name != self.version:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
@@ -1,33 +1,305 @@
 # Parser.py (reemplaza completamente tu Parser.py con este contenido)
 import ply.yacc as yacc
 import Lexer
+import Profile
+import Scanner
+import TableCache
+import io
+import json
 import os
+import sys
+import time
 
 tokens = Lexer.tokens
 
+# leaves (identifier, number, string, ...) all share this instead of a new list
+NO_CHILDREN = ()
+
+# every Node type, a closed set, only there to check type names against
+# (Visitor does, for its visit_* methods).
+# They're string constants of this module, so CPython interns them and all
+# the nodes of one type share one string: node.type == "call" is a pointer
+# compare when it matches. Names, operators and string literals in the tree
+# are interned too (sys.intern in the lexers and the actions below), so a
+# name used a thousand times is stored once.
+NODE_KINDS = (
+    "module", "suite", "error", "pass", "function_def", "parameters", "parameter",
+    "if", "elif", "while", "for", "return", "assignment", "expression_stmt",
+    "binary_op", "unary_op", "comparison", "boolean_op", "call", "subscript", "attribute", "slice",
+    "identifier", "number", "string", "boolean", "none", "tuple", "list", "set", "dict", "pair",
+)
+
 class Node:
-    def __init__(self, type_, value=None, children=None):
+    # start/end: source offsets of the node's first character and one past
+    # its last one (None for nodes that cover no tokens)
+    __slots__ = ("type", "value", "children", "start", "end")
+
+    def __init__(self, type_, value=None, children=None, start=None, end=None):
         self.type = type_
         self.value = value
-        self.children = children or []
+        self.children = children or NO_CHILDREN
+        self.start = start
+        self.end = end
 
     def __repr__(self, level=0):
-        indent = "  " * level
-        s = f"{indent}{self.type}: {self.value if self.value is not None else ''}\n"
-        for child in self.children:
-            if isinstance(child, Node):
-                s += child.__repr__(level + 1)
-            else:
-                s += "  " * (level + 1) + repr(child) + "\n"
-        return s
+        out = io.StringIO()
+        write_tree(self, out, level=level)
+        return out.getvalue()
+
+
+_END = object()
+_COMMA = object()
+
+
+def _separated(items):
+    """Yields the items of a list child with a _COMMA marker between them."""
+    first = True
+    for item in items:
+        if not first:
+            yield _COMMA
+        first = False
+        yield item
+
+
+def write_tree(root, out, max_depth=None, max_nodes=None, level=0):
+    """
+    Writes the indented tree that repr(Node) returns, to any text stream,
+    without recursion. Only one iterator per open level is kept, so the
+    extra memory depends on the depth of the tree, not on its size.
+
+    Subtrees below max_depth are replaced by a "..." line, and the output
+    stops with a "..." line after max_nodes nodes.
+    """
+    write = out.write
+    count = 0
+    # (items left at this level, indent level, depth, inside a list child, text written when done)
+    stack = [(iter((root,)), level, 0, False, None)]
+    while stack:
+        items, lvl, depth, in_list, after = stack[-1]
+        item = next(items, _END)
+        if item is _END:
+            stack.pop()
+            if after:
+                write(after)
+            continue
+        if item is _COMMA:
+            write(", ")
+            continue
+
+        indent = "" if in_list and not isinstance(item, Node) else "  " * lvl
+        if isinstance(item, Node):
+            if max_nodes is not None and count >= max_nodes:
+                write(indent + "...\n")
+                return
+            count += 1
+            write(f"{indent}{item.type}: {item.value if item.value is not None else ''}\n")
+            if item.children:
+                if max_depth is not None and depth >= max_depth:
+                    write("  " * (lvl + 1) + "...\n")
+                else:
+                    stack.append((iter(item.children), lvl + 1, depth + 1, False, None))
+        elif isinstance(item, list):
+            # repr() of a list child prints every element as a tree of its own
+            write(indent + "[")
+            stack.append((_separated(item), 0, depth + 1, True, "]" if in_list else "]\n"))
+        else:
+            write(indent + repr(item) + ("" if in_list else "\n"))
+
+
+def tree_entries(root):
+    """
+    One dict per node in pre-order: its id, its parent's id and its type
+    and value. Non-Node children are {"raw": value} and list children
+    {"list": true}. Nodes with a span also get their start and end offsets.
+    Memory use depends on depth only.
+    """
+    next_id = 0
+    stack = [(iter((root,)), None)]
+    while stack:
+        items, parent = stack[-1]
+        item = next(items, _END)
+        if item is _END:
+            stack.pop()
+            continue
+        entry = {"id": next_id, "parent": parent}
+        if isinstance(item, Node):
+            entry["type"] = item.type
+            entry["value"] = item.value
+            if item.start is not None:
+                entry["start"] = item.start
+                entry["end"] = item.end
+            children = item.children
+        elif isinstance(item, list):
+            entry["list"] = True
+            children = item
+        else:
+            entry["raw"] = item
+            children = None
+        yield entry
+        if children:
+            stack.append((iter(children), next_id))
+        next_id += 1
+
+
+def dump_jsonl(root, out):
+    """Writes the tree_entries() of root, one JSON object per line."""
+    write = out.write
+    for entry in tree_entries(root):
+        write(json.dumps(entry) + "\n")
+
+
+def _with_span(action, built):
+    """
+    Wraps a grammar action so that, after it runs, the reduced symbol gets
+    the span of its right-hand side (lexpos of the first token, endlexpos of
+    the last), and so does the Node it built if it has none yet. built[0]
+    counts those new Nodes.
+    """
+    def reduce(p):
+        action(p)
+        syms = p.slice
+        i = 1
+        start = getattr(syms[1], "lexpos", None)
+        while start is None:
+            i += 1
+            if i == len(syms):
+                return
+            start = getattr(syms[i], "lexpos", None)
+        j = len(syms) - 1
+        end = getattr(syms[j], "endlexpos", None)
+        while end is None and j > i:
+            j -= 1
+            end = getattr(syms[j], "endlexpos", None)
+        if end is None:
+            end = start
+        result = syms[0]
+        result.lexpos = start
+        result.endlexpos = end
+        node = result.value
+        if type(node) is Node and node.start is None:
+            node.start = start
+            node.end = end
+            built[0] += 1
+    return reduce
+
+
+def _profiled(action, stats, profile, seen):
+    """
+    Wraps a grammar action to count its reductions, time them and count the
+    Nodes it builds; seen holds the ids of the Nodes of this parse so far.
+    """
+    clock = time.perf_counter
+
+    def reduce(p):
+        t0 = clock()
+        action(p)
+        stats[1] += clock() - t0
+        stats[0] += 1
+        profile.nodes += _new_nodes(p, seen)
+    return reduce
+
+
+def _new_nodes(p, seen):
+    """
+    Nodes under p[0] that aren't in seen, which they are added to. An action
+    can put the Nodes it was given in a new list ([func] + args), so new
+    lists are walked, but the lists it was given and the children of a Node
+    seen before are not.
+    """
+    old = {id(sym.value) for sym in p.slice[1:]}
+    count = 0
+    work = [p.slice[0].value]
+    while work:
+        item = work.pop()
+        if id(item) in old:
+            continue
+        if type(item) is Node:
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            count += 1
+            work.append(item.children)
+        elif type(item) is list:
+            work.extend(item)
+    return count
+
+
+def _track_spans(lrparser, built):
+    # empty productions cover no tokens and keep their plain action
+    for prod in lrparser.productions:
+        if prod.callable is not None and prod.len:
+            prod.callable = _with_span(prod.callable, built)
+
+
+class Limits(object):
+    """
+    Budgets for one parse; None means no limit.
+      tokens   tokens read
+      nodes    Nodes built (the ones the grammar actions return; checked
+               every 256 tokens, so a parse may go a little over)
+      depth    open (, [ and { at once
+      indent   open indented blocks at once
+      seconds  wall-clock time
+    """
+    __slots__ = ("tokens", "nodes", "depth", "indent", "seconds")
+
+    def __init__(self, tokens=None, nodes=None, depth=None, indent=None, seconds=None):
+        self.tokens = tokens
+        self.nodes = nodes
+        self.depth = depth
+        self.indent = indent
+        self.seconds = seconds
+
+    def __repr__(self):
+        return "Limits(" + ", ".join(f"{k}={getattr(self, k)}" for k in self.__slots__) + ")"
+
+
+class LimitExceeded(Exception):
+    """A parse ran out of one of its Limits: kind is the name of the budget."""
+
+    def __init__(self, kind, limit, lineno=None, lexpos=None):
+        self.kind = kind
+        self.limit = limit
+        self.lineno = lineno
+        self.lexpos = lexpos
+        what = {"tokens": "tokens", "nodes": "nodes", "depth": "nested brackets",
+                "indent": "nested blocks", "seconds": "seconds"}[kind]
+        where = f" at line {lineno}" if lineno is not None else ""
+        super().__init__(f"Parse stopped: more than {limit} {what}{where}")
+
+
+_OPENING = frozenset(("LPAREN", "LBRACKET", "LKEY"))
+_CLOSING = frozenset(("RPAREN", "RBRACKET", "RKEY"))
+
 
 class Parser:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, cache_dir=None, diagnostics=None, backend="ply", profile=False,
+                 limits=None):
         self.errors = []
+        self._pending = []  # tokens pushed back by error recovery
+        self._closed = False
+        self._built = [0]   # Nodes built by the current parse
+        # limits: a Limits; a parse that runs out of one stops early (see _stop)
+        self.limits = limits
+        self.stopped = None  # the LimitExceeded that stopped the last parse
         self.data = None
         self.debug = debug
         self.tokens = tokens
-        self.lexer = Lexer.IndentLexer(debug=self.debug)
+        self.cache_dir = TableCache.resolve_cache_dir(cache_dir)
+        # lexer and parser diagnostics both go to self.errors/lexer.errors and to this sink
+        self.sink = Lexer.make_sink(diagnostics)
+        # "ply": Lexer.IndentLexer, "scan": the single-pass Scanner.ScanLexer (same tokens, faster)
+        if backend == "ply":
+            self.lexer = Lexer.IndentLexer(debug=self.debug, cache_dir=self.cache_dir, diagnostics=self.sink)
+        elif backend == "scan":
+            self.lexer = Scanner.ScanLexer(diagnostics=self.sink)
+        else:
+            raise ValueError(f"unknown lexer backend {backend!r} (expected 'ply' or 'scan')")
+        # profile=True: every parse adds its timings to self.profile (see Profile.py)
+        self.profile = None
+        if profile:
+            self.profile = Profile.ParseProfile()
+            self.lexer.profile = self.profile
 
         # precedence (some operators grouped)
         self.precedence = (
@@ -37,35 +309,234 @@ class Parser:
             ('left', 'EQUALEQUAL', 'NOTEQUAL', 'LESS', 'GREATER', 'GREATEREQUAL', 'LESSEQUAL', 'IN', 'IS'),
             ('left', 'PLUS', 'MINUS'),
             ('left', 'MULTI', 'DIVIDE', 'MODULE', 'FDIVIDE'),
-            ('left', 'POW'),
+            # as in Python: -2 ** 2 is -(2 ** 2) and 2 ** 3 ** 2 is 2 ** (3 ** 2)
             ('right', 'UMINUS'),
+            ('right', 'POW'),
         )
 
     def p_error(self, p):
         if not p:
             msg = "Unexpected end of input"
             self.errors.append(msg)
-            print(f"Parser Error: {msg}")
+            if self.sink is not None:
+                self.sink(msg)
             return
         tok_type = getattr(p, "type", None)
         tok_val  = getattr(p, "value", None)
         lineno   = getattr(p, "lineno", getattr(p, "lineno", "?"))
-        msg = f"Syntax error on token type='{tok_type}' value={repr(tok_val)} at line {lineno}"
+        column   = self.lexer.lines.column(p.lexpos)
+        msg = f"Syntax error on token type='{tok_type}' value={repr(tok_val)} at line {lineno}, column {column}"
         self.errors.append(msg)
-        print(f"Parser Error: {msg}")
+        if self.sink is not None:
+            self.sink(msg)
+        if tok_type == "ENDMARKER":
+            return self._close_blocks(p)
+
+    def _close_blocks(self, endmarker):
+        """
+        An error at the end of the input with blocks still open: yacc would
+        give up there, so close them with one DEDENT each and try the
+        ENDMARKER again.
+        """
+        open_blocks = sum(1 for sym in self.parser.symstack if sym.type == "INDENT")
+        if not open_blocks or self._closed:
+            return None
+        self._closed = True  # only once, so a bad DEDENT can't loop forever
+        self._pending.append(endmarker)
+        for _ in range(open_blocks):
+            self._pending.append(Lexer.DEDENT(endmarker.lineno, endmarker.lexpos))
+        self.parser.errok()
+        return self._pending.pop()
+
+    def grammar_key(self):
+        """
+        Hash of everything the LALR tables depend on: the p_* docstrings in
+        the order PLY reads them, the precedence and Lexer.tokens.
+        """
+        rules = [getattr(self, name) for name in dir(self) if name.startswith('p_') and name != 'p_error']
+        rules.sort(key=lambda f: f.__code__.co_firstlineno)
+        return TableCache.fingerprint(yacc.__tabversion__, 'module', self.precedence, self.tokens,
+                                      [(f.__name__, f.__doc__) for f in rules])
 
     def build(self):
-        for f in ("parsetab.py", "parser.out"):
-            if os.path.exists(f):
-                os.remove(f)
-        self.parser = yacc.yacc(module=self, debug=self.debug, start='module', write_tables=True)
+        """
+        Loads the LALR tables from cache_dir when their grammar_key matches,
+        otherwise generates them and publishes the new table atomically.
+        """
+        if not TableCache.ensure_dir(self.cache_dir):
+            self.parser = yacc.yacc(module=self, debug=self.debug, start='module', write_tables=False)
+            _track_spans(self.parser, self._built)
+            return
+
+        final = os.path.join(self.cache_dir, f"parsetab_{self.grammar_key()}.pickle")
+        if os.path.exists(final) and not self.debug:
+            try:
+                lr = yacc.LRTable()
+                lr.read_pickle(final)
+                lr.bind_callables({name: getattr(self, name) for name in dir(self) if name.startswith('p_')})
+                self.parser = yacc.LRParser(lr, self.p_error)
+                _track_spans(self.parser, self._built)
+                return
+            except Exception:
+                pass  # stale or unreadable table: fall through and rebuild it
+
+        tmp = TableCache.temp_path(self.cache_dir, "parsetab_", ".pickle")
+        os.remove(tmp)  # yacc only generates tables when the pickle file is missing
+        self.parser = yacc.yacc(module=self, debug=self.debug, start='module',
+                                outputdir=self.cache_dir, picklefile=tmp)
+        TableCache.publish(tmp, final)
+        _track_spans(self.parser, self._built)
+
+    def position(self, offset):
+        """(line, column) of a source offset, e.g. a Node's start, in the last parsed source."""
+        return self.lexer.lines.position(offset)
+
+    def parse(self, source, debug=False, lineno=1, after_statement=False):
+        """
+        Parses source. With after_statement the parser starts where it is
+        between two top-level statements instead of at the start of the input
+        (it reads a pass statement first and drops it), which is how a piece
+        of a module parses in place (error recovery differs at the start).
+        """
+        self._reset()
+        self.lexer.input(source, lineno=lineno)
+        if after_statement:
+            self._pending = [Lexer._new_token_manual("NEWLINE", lineno),
+                             Lexer._new_token_manual("PASS", lineno)]
+        result = self._run(debug)
+        if after_statement and result is not None:
+            result.children = result.children[1:]
+        return result
 
-    def parse(self, source, debug=False):
+    def parse_file(self, path, debug=False, lineno=1, encoding="utf-8", chunk_size=Scanner.CHUNK_SIZE):
+        """
+        Parses a file. The scan backend reads it chunk_size characters at a
+        time, so only the tree has to fit in memory; PLY lexes a whole
+        string, so the ply backend reads the file at once.
+        """
+        if not isinstance(self.lexer, Scanner.ScanLexer):
+            with open(path, "r", encoding=encoding) as f:
+                return self.parse(f.read(), debug=debug, lineno=lineno)
+        self._reset()
+        self.lexer.input_file(path, lineno=lineno, encoding=encoding, chunk_size=chunk_size)
+        return self._run(debug)
+
+    def _reset(self):
         self.errors = []
-        self.lexer.input(source)
-        result = self.parser.parse(lexer=self.lexer, debug=debug)
+        self._pending = []
+        self._closed = False
+        self._built[0] = 0
+        self.stopped = None
+
+    def _run(self, debug):
+        if self.limits is None and self.profile is None:
+            return self.parser.parse(lexer=self.lexer, debug=debug, tokenfunc=self._token)
+        tokenfunc = self._token if self.limits is None else self._limited(self._token)
+        try:
+            if self.profile is not None:
+                return self._profiled_parse(debug, tokenfunc)
+            return self.parser.parse(lexer=self.lexer, debug=debug, tokenfunc=tokenfunc)
+        except LimitExceeded as e:
+            return self._stop(e)
+
+    def _limited(self, next_token):
+        """next_token with the checks of self.limits, which raise LimitExceeded."""
+        limits = self.limits
+        unlimited = float("inf")
+        max_tokens = unlimited if limits.tokens is None else limits.tokens
+        max_nodes = unlimited if limits.nodes is None else limits.nodes
+        max_depth = unlimited if limits.depth is None else limits.depth
+        max_indent = unlimited if limits.indent is None else limits.indent
+        deadline = None if limits.seconds is None else time.monotonic() + limits.seconds
+        built = self._built
+        opening, closing = _OPENING, _CLOSING
+        nesting = _OPENING | _CLOSING | {"INDENT", "DEDENT"}
+        count = depth = indent = 0
+
+        def token():
+            nonlocal count, depth, indent
+            tok = next_token()
+            if tok is None:
+                return None
+            count += 1
+            t = tok.type
+            if t in nesting:
+                if t in opening:
+                    depth += 1
+                    if depth > max_depth:
+                        raise LimitExceeded("depth", limits.depth, tok.lineno, tok.lexpos)
+                elif t in closing:
+                    depth -= 1
+                elif t == "INDENT":
+                    indent += 1
+                    if indent > max_indent:
+                        raise LimitExceeded("indent", limits.indent, tok.lineno, tok.lexpos)
+                else:
+                    indent -= 1
+            if count > max_tokens:
+                raise LimitExceeded("tokens", limits.tokens, tok.lineno, tok.lexpos)
+            # nodes and the clock every 256 tokens (a few nodes may go over)
+            if not count & 255:
+                if built[0] > max_nodes:
+                    raise LimitExceeded("nodes", limits.nodes, tok.lineno, tok.lexpos)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise LimitExceeded("seconds", limits.seconds, tok.lineno, tok.lexpos)
+            return tok
+        return token
+
+    def _stop(self, exceeded):
+        """
+        Ends a parse that ran out of a budget: the error goes to self.errors
+        (and self.stopped), and the result is a module of the top-level
+        statements finished so far.
+        """
+        self.stopped = exceeded
+        msg = str(exceeded)
+        self.errors.append(msg)
+        if self.sink is not None:
+            self.sink(msg)
+        symstack = getattr(self.parser, "symstack", ())
+        done = []
+        if len(symstack) > 1 and symstack[1].type == "statements":
+            done = list(symstack[1].value)
+        return Node("module", None, done)
+
+    def _profiled_parse(self, debug, next_token):
+        profile = self.profile
+        clock = time.perf_counter
+        counts = profile.tokens
+        lexer_time = 0.0
+
+        def token():
+            nonlocal lexer_time
+            t0 = clock()
+            tok = next_token()
+            lexer_time += clock() - t0
+            if tok is not None:
+                counts[tok.type] += 1
+            return tok
+
+        productions = self.parser.productions
+        actions = [prod.callable for prod in productions]
+        seen = set()
+        for prod in productions:
+            if prod.callable is not None:
+                prod.callable = _profiled(prod.callable, profile.rule(prod.func), profile, seen)
+        t0 = clock()
+        try:
+            result = self.parser.parse(lexer=self.lexer, debug=debug, tokenfunc=token)
+        finally:
+            total = clock() - t0
+            for prod, action in zip(productions, actions):
+                prod.callable = action
+        profile.finish(total, lexer_time)
         return result
 
+    def _token(self):
+        if self._pending:
+            return self._pending.pop()
+        return self.lexer.token()
+
     # ---- Grammar ----
 
     def p_module(self, p):
@@ -100,7 +571,8 @@ class Parser:
         if len(p) == 2:
             p[0] = [p[1]]
         else:
-            p[0] = p[1] + [p[2]]
+            p[1].append(p[2])
+            p[0] = p[1]
 
     def p_statement(self, p):
         """statement : simple_statement NEWLINE
@@ -113,6 +585,15 @@ class Parser:
         else:
             p[0] = Node("pass")
 
+    # error recovery: a broken statement is skipped up to the end of its
+    # line (keeping the indented block below it, if any) and becomes an
+    # "error" node, so parsing goes on with the next statement
+    def p_statement_error(self, p):
+        """statement : error NEWLINE
+                     | error ENDMARKER
+                     | error NEWLINE INDENT statements DEDENT"""
+        p[0] = Node("error", None, p[4] if len(p) == 6 else [])
+
     def p_simple_statement(self, p):
         """simple_statement : expression_statement
                             | assignment_statement
@@ -131,8 +612,8 @@ class Parser:
     # suite: either simple_statement NEWLINE or indented block
     def p_suite(self, p):
         """suite : simple_statement NEWLINE
-                | NEWLINE INDENT statements optional_dedents
-                | INDENT statements optional_dedents
+                | NEWLINE INDENT statements DEDENT
+                | INDENT statements DEDENT
                 | NEWLINE INDENT DEDENT"""
         if len(p) == 3 and isinstance(p[1], Node):
             p[0] = Node("suite", None, [p[1]])
@@ -143,10 +624,23 @@ class Parser:
             p[0] = Node("suite", None, [])
 
 
+    # a block header whose suite is broken keeps the header; a block that
+    # ends in the middle of a broken statement still ends at its DEDENT
+    def p_suite_error(self, p):
+        """suite : error NEWLINE
+                 | NEWLINE error NEWLINE
+                 | NEWLINE INDENT error DEDENT
+                 | NEWLINE INDENT statements error DEDENT"""
+        statements = p[3] if len(p) == 6 else []
+        p[0] = Node("suite", None, statements + [Node("error")])
+
+
     # function definition
     def p_function_def(self, p):
         """function_def : DEF ID LPAREN parameters RPAREN COLON suite"""
-        p[0] = Node("function_def", p[2], [Node("parameters", None, p[4]), p[7]])
+        # the parameters node spans the parentheses
+        params = Node("parameters", None, p[4], p.lexpos(3), p.slice[5].endlexpos)
+        p[0] = Node("function_def", p[2], [params, p[7]])
 
     def p_parameters(self, p):
         """parameters :
@@ -162,7 +656,8 @@ class Parser:
         if len(p) == 2:
             p[0] = [p[1]]
         else:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
 
     def p_parameter(self, p):
         """parameter : ID
@@ -182,7 +677,7 @@ class Parser:
                         | IF expression COLON suite elif_clauses ELSE COLON suite"""
         if len(p) == 5:
             p[0] = Node("if", None, [p[2], p[4]])
-        elif len(p) == 7:
+        elif len(p) == 6:
             # with elif_clauses
             p[0] = Node("if", None, [p[2], p[4], p[5]])
         elif len(p) == 8 and p.slice[5].type == 'ELSE':
@@ -196,7 +691,8 @@ class Parser:
         if len(p) == 2:
             p[0] = [p[1]]
         else:
-            p[0] = p[1] + [p[2]]
+            p[1].append(p[2])
+            p[0] = p[1]
 
     def p_elif_clause(self, p):
         """elif_clause : ELIF expression COLON suite"""
@@ -251,12 +747,12 @@ class Parser:
                              | expression FDIVIDE expression
                              | expression MODULE expression
                              | expression POW expression"""
-        p[0] = Node("binary_op", p[2], [p[1], p[3]])
+        p[0] = Node("binary_op", sys.intern(p[2]), [p[1], p[3]])
 
     def p_unary_expression(self, p):
         """unary_expression : MINUS expression %prec UMINUS
                             | NOT expression"""
-        p[0] = Node("unary_op", p[1], [p[2]])
+        p[0] = Node("unary_op", sys.intern(p[1]), [p[2]])
 
     def p_comparison_expression(self, p):
         """comparison_expression : expression EQUALEQUAL expression
@@ -267,12 +763,12 @@ class Parser:
                                 | expression GREATEREQUAL expression
                                 | expression IN expression
                                 | expression IS expression"""
-        p[0] = Node("comparison", p[2], [p[1], p[3]])
+        p[0] = Node("comparison", sys.intern(p[2]), [p[1], p[3]])
 
     def p_boolean_expression(self, p):
         """boolean_expression : expression AND expression
                               | expression OR expression"""
-        p[0] = Node("boolean_op", p[2], [p[1], p[3]])
+        p[0] = Node("boolean_op", sys.intern(p[2]), [p[1], p[3]])
 
     # primary: atoms, calls, indexing, attributes
     def p_primary(self, p):
@@ -286,7 +782,8 @@ class Parser:
             func_node = p[1]
             args = p[3] if p[3] is not None else []
             name = func_node.value if isinstance(func_node, Node) and func_node.type == "identifier" else None
-            p[0] = Node("call", name, args)
+            # calls of anything but a plain name (d.keys(), f(1)(2)) keep the callee as their first child
+            p[0] = Node("call", name, args if name is not None else [func_node] + args)
         elif p.slice[2].type == 'LBRACKET':
             p[0] = Node("subscript", None, [p[1], p[3]])
         else:
@@ -307,7 +804,8 @@ class Parser:
         if len(p) == 2:
             p[0] = [p[1]]
         else:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
 
     # subscript item (index or slice)
     def p_subscript_item(self, p):
@@ -348,7 +846,7 @@ class Parser:
             elif ttype in ('NUMBER', 'DECIMAL'):
                 p[0] = Node("number", p[1])
             elif ttype in ('SSTRING', 'DSTRING'):
-                p[0] = Node("string", p[1])
+                p[0] = Node("string", sys.intern(p[1]))
             elif ttype in ('TRUE', 'FALSE'):
                 p[0] = Node("boolean", p[1])
             elif ttype == 'NONE':
@@ -383,7 +881,7 @@ class Parser:
             p[0] = Node("dict", None, p[2])
         else:
             # Multilínea: { \n INDENT dict_pairs NEWLINE DEDENT }
-            p[0] = Node("dict", None, p[5])
+            p[0] = Node("dict", None, p[4])
 
     def p_dict_pairs(self, p):
         """dict_pairs : empty
@@ -401,10 +899,12 @@ class Parser:
             p[0] = p[1]
         elif len(p) == 4:
             # dict_pairs COMMA dict_pair  OR dict_pairs NEWLINE dict_pair
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
             # dict_pairs COMMA NEWLINE dict_pair
-            p[0] = p[1] + [p[4]]
+            p[1].append(p[4])
+            p[0] = p[1]
 
     def p_dict_pair(self, p):
         """dict_pair : expression COLON expression"""
@@ -417,7 +917,7 @@ class Parser:
         if len(p) == 4:
             p[0] = Node("list", None, p[2])
         else:
-            p[0] = Node("list", None, p[5])
+            p[0] = Node("list", None, p[4])
 
     def p_list_items(self, p):
         """list_items : empty
@@ -433,9 +933,11 @@ class Parser:
         elif len(p) == 3:
             p[0] = p[1]   # trailing comma
         elif len(p) == 4:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
-            p[0] = p[1] + [p[4]]
+            p[1].append(p[4])
+            p[0] = p[1]
 
 
     def p_set_literal(self, p):
@@ -444,7 +946,7 @@ class Parser:
         if len(p) == 4:
             p[0] = Node("set", None, p[2])
         else:
-            p[0] = Node("set", None, p[5])
+            p[0] = Node("set", None, p[4])
 
     def p_set_items(self, p):
         """set_items : empty
@@ -460,9 +962,11 @@ class Parser:
         elif len(p) == 3:
             p[0] = p[1]
         elif len(p) == 4:
-            p[0] = p[1] + [p[3]]
+            p[1].append(p[3])
+            p[0] = p[1]
         else:
-            p[0] = p[1] + [p[4]]
+            p[1].append(p[4])
+            p[0] = p[1]
 
 
 
@@ -490,29 +994,50 @@ def random_operation(a, b):
             print(e)
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) > 1:
-        fname = sys.argv[1]
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Parser for Fangless Python")
+    ap.add_argument("file", nargs="?", help="input file (without it a small built-in example is parsed)")
+    ap.add_argument("--format", choices=("tree", "jsonl"), default="tree",
+                    help="AST output: indented tree (default) or one JSON object per node")
+    ap.add_argument("--max-depth", type=int, default=None, help="elide tree levels below this depth")
+    ap.add_argument("--max-nodes", type=int, default=None, help="stop the tree after this many nodes")
+    ap.add_argument("--tokens", action="store_true", help="print the token stream before the AST")
+    ap.add_argument("--backend", choices=("ply", "scan"), default="ply", help="lexer backend")
+    ap.add_argument("--profile", action="store_true",
+                    help="print where the parse spent its time instead of the AST")
+    args = ap.parse_args()
+
+    if args.file:
+        fname = args.file
         with open(fname, "r", encoding="utf-8") as f:
             src = f.read()
-        parser = Parser(debug=False)
+        parser = Parser(debug=False, backend=args.backend, profile=args.profile)
         parser.build()
 
-        # print tokens for debugging
-        parser.lexer.input(src)
-        tok = parser.lexer.token()
-        while tok:
-            print(f"{tok.lineno:3} {tok.type:12} {repr(tok.value)}")
-            tok = parser.lexer.token()
-
-        # parse
-        parser.lexer.input(src)
-        ast = parser.parser.parse(lexer=parser.lexer)
-        print("\n=== AST ===")
-        print(ast)
-        if parser.errors:
+        if args.profile:
+            parser.parse(src)
+            sys.stdout.write(parser.profile.report())
+            sys.exit(0)
+
+        if args.tokens:
+            for tok in parser.lexer.stream(src):
+                print(f"{tok.lineno:3}:{parser.lexer.lines.column(tok.lexpos):<3} {tok.type:12} {repr(tok.value)}")
+            print()
+
+        ast = parser.parse(src)
+        print("=== AST ===")
+        if ast is None:
+            print(ast)
+        elif args.format == "jsonl":
+            dump_jsonl(ast, sys.stdout)
+        else:
+            write_tree(ast, sys.stdout, max_depth=args.max_depth, max_nodes=args.max_nodes)
+            print()
+        errors = parser.lexer.errors + parser.errors
+        if errors:
             print("\n=== ERRORES ===")
-            for e in parser.errors:
+            for e in errors:
                 print(e)
     else:
         test_parser()
@@ -0,0 +1,103 @@
+# Profile.py - where the time of a parse goes
+#
+# Opt-in: Parser(profile=True) (or `python Parser.py file --profile`). The
+# parser then times its token function and wraps every grammar action,
+# and IndentLexer times each stage of its token pipeline. With profiling
+# off none of this is installed, so the fast path is untouched.
+import time
+from collections import Counter
+
+# lexer pipeline stages, innermost first: each one's time includes the ones before it
+LEXER_STAGES = ("lex", "track_indent", "filter_indent")
+
+
+class ParseProfile(object):
+    """
+    Totals over every parse since the last reset():
+      phases  seconds per phase: lex (PLY's regex), track_indent and
+              filter_indent (IndentLexer only), lexer (all of it), lalr
+              (yacc's loop, and the profiling itself) and actions
+      tokens  Counter of token types
+      rules   p_* function name -> [reductions, seconds]
+      nodes   Nodes built by the actions. Every Node stays reachable from
+              the parser stack until the parse ends, so this is the peak
+              node count (error recovery can drop a few of them).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.parses = 0
+        self.total = 0.0
+        self.phases = dict.fromkeys(("lexer", "lalr", "actions"), 0.0)
+        self.tokens = Counter()
+        self.rules = {}
+        self.nodes = 0
+        self._stages = dict.fromkeys(LEXER_STAGES, 0.0)
+
+    def timed(self, iterator, stage):
+        """Yields from iterator, adding the time spent in it to stage."""
+        clock = time.perf_counter
+        stages = self._stages
+        while True:
+            t0 = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stages[stage] += clock() - t0
+                return
+            stages[stage] += clock() - t0
+            yield item
+
+    def rule(self, name):
+        """The [reductions, seconds] entry of a p_* function."""
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = [0, 0.0]
+        return stats
+
+    def finish(self, total, lexer_time):
+        """Adds one parse that took total seconds, lexer_time of them in the lexer."""
+        self.parses += 1
+        self.total += total
+        self.phases["lexer"] += lexer_time
+        actions = sum(seconds for _, seconds in self.rules.values())
+        self.phases["actions"] = actions
+        self.phases["lalr"] = self.total - self.phases["lexer"] - actions
+        inner = 0.0
+        for stage in LEXER_STAGES:
+            if self._stages[stage]:
+                self.phases[stage] = self._stages[stage] - inner
+                inner = self._stages[stage]
+
+    def as_dict(self):
+        return {
+            "parses": self.parses,
+            "total": self.total,
+            "phases": dict(self.phases),
+            "tokens": dict(self.tokens.most_common()),
+            "rules": {name: {"reductions": n, "seconds": s}
+                      for name, (n, s) in sorted(self.rules.items(), key=lambda kv: -kv[1][1])},
+            "nodes": self.nodes,
+        }
+
+    def report(self, top=15):
+        """A plain-text summary: phases, token counts and the slowest rules."""
+        total = self.total or 1e-12
+        lines = [f"{self.parses} parse(s) in {self.total * 1000:.2f} ms: "
+                 f"{sum(self.tokens.values())} tokens, {self.nodes} nodes", "",
+                 f"{'phase':16} {'ms':>9} {'%':>6}"]
+        for name in LEXER_STAGES + ("lexer", "lalr", "actions"):
+            if name in self.phases:
+                seconds = self.phases[name]
+                indent = "  " if name in LEXER_STAGES else ""
+                lines.append(f"{indent + name:16} {seconds * 1000:9.2f} {seconds / total * 100:5.1f}%")
+        lines += ["", "tokens: " + ", ".join(f"{t} {n}" for t, n in self.tokens.most_common())]
+        lines += ["", f"{'rule':28} {'reductions':>10} {'ms':>9} {'us/call':>8}"]
+        rules = sorted(self.rules.items(), key=lambda kv: -kv[1][1])
+        for name, (count, seconds) in rules[:top]:
+            lines.append(f"{name:28} {count:10} {seconds * 1000:9.2f} {seconds / max(count, 1) * 1e6:8.2f}")
+        if len(rules) > top:
+            lines.append(f"... {len(rules) - top} more rules")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,308 @@
+# Scanner.py - single-pass lexer backend for Fangless Python
+#
+# Produces the same tokens as Lexer.IndentLexer (types, values, line numbers,
+# INDENT/DEDENT/ENDMARKER and diagnostics) from one loop over the source:
+# one master regex built from the rules in Lexer.py, with the indentation of
+# every line taken straight from its leading whitespace. No WHITESPACE tokens
+# are created and no generator layers are stacked.
+#
+# input_file() reads a file in line-aligned chunks instead, so a huge file
+# is never held in memory as a whole.
+import re
+import sys
+
+import Lexer
+
+
+class Token(object):
+    # yacc sets .lexer on the token it reports to p_error
+    __slots__ = ("type", "value", "lineno", "lexpos", "endlexpos", "lexer")
+
+    def __repr__(self):
+        return f"LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})"
+
+
+def _make(type, value, lineno, lexpos):
+    tok = Token()
+    tok.type = type
+    tok.value = value
+    tok.lineno = lineno
+    tok.lexpos = tok.endlexpos = lexpos
+    return tok
+
+
+_META = re.compile(r"[][(){}*+?|^$.]")
+
+
+def _literal(regex):
+    """The text a string rule matches if it is a plain (escaped) literal, else None."""
+    text = re.sub(r"\\(.)", r"\1", regex)
+    bare = re.sub(r"\\.", "", regex)
+    return None if _META.search(bare) else text
+
+
+def _master_regex():
+    """
+    The rules of Lexer.py in the order PLY tries them: function rules by line
+    number, then string rules by decreasing regex length. Whitespace becomes
+    an optional prefix of every token, and all the fixed operators share one
+    group tried longest first (which picks the same rule PLY's order does),
+    with a dict from operator text to token type.
+    """
+    rules = vars(Lexer)
+    funcs = sorted((v for k, v in rules.items() if k.startswith("t_") and k not in ("t_error", "t_WHITESPACE")
+                    and callable(v)), key=lambda f: f.__code__.co_firstlineno)
+    strings = sorted(((k, v) for k, v in rules.items() if k.startswith("t_") and isinstance(v, str)),
+                     key=lambda kv: kv[0])
+    strings.sort(key=lambda kv: len(kv[1]), reverse=True)
+
+    parts = [f"(?P<{f.__name__[2:]}>{f.__doc__})" for f in funcs]
+    operators = {}
+    for name, regex in strings:
+        text = _literal(regex)
+        if text is None:
+            parts.append(f"(?P<{name[2:]}>{regex})")
+        else:
+            operators[text] = name[2:]
+    ops = sorted(operators, key=len, reverse=True)
+    parts.append("(?P<OP>" + "|".join(re.escape(op) for op in ops) + ")")
+    return re.compile("[ \t]*(?:" + "|".join(parts) + ")"), operators
+
+
+_MASTER, _OPERATORS = _master_regex()
+_RESERVED = Lexer.reserved
+
+CHUNK_SIZE = 1 << 20  # characters
+
+
+def line_chunks(f, chunk_size=CHUNK_SIZE):
+    """
+    Yields (offset, text) pieces of the text file f of about chunk_size
+    characters, each ending after a newline. A run of newlines is never
+    split (it is a single NEWLINE token), and no other token spans lines.
+    The last piece gets the final newline the lexers add.
+    """
+    base = 0
+    carry = ""
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        if carry:
+            data = carry + data
+        # cut after the last newline that isn't followed by another one
+        cut = data.rstrip("\n").rfind("\n") + 1
+        if cut == 0:
+            carry = data  # no line ends here yet
+            continue
+        carry = data[cut:]
+        yield base, data[:cut]
+        base += cut
+    if carry or not base:
+        yield base, carry if carry.endswith("\n") else carry + "\n"
+
+
+class ScanLexer(object):
+    """
+    Drop-in replacement for Lexer.IndentLexer: same input()/token()/stream()
+    interface, errors list, diagnostics sink, indent_stack and token_count.
+    """
+    def __init__(self, diagnostics=None, **_ply_options):
+        self.sink = Lexer.make_sink(diagnostics)
+        self.errors = []
+        self.indent_stack = [0]
+        self.token_count = 0
+        self.lineno = self.first_line = 1
+        self.lexdata = ""
+        self.path = None
+        self.encoding = "utf-8"
+        self._lines = None
+        self._next = iter(()).__next__
+        self.structure = None  # a Structure.StructureIndex to fill in while lexing
+
+    def _report(self, msg):
+        self.errors.append(msg)
+        if self.sink is not None:
+            self.sink(msg)
+
+    @property
+    def lines(self):
+        """LineIndex of the current input (for a file, read again the first time it's needed)."""
+        if self._lines is None:
+            if self.path is not None:
+                self._lines = Lexer.LineIndex.from_file(self.path, self.first_line, self.encoding)
+            else:
+                self._lines = Lexer.LineIndex(self.lexdata, self.first_line)
+        return self._lines
+
+    def input(self, s, add_endmarker=True, lineno=1):
+        self.errors = []
+        self.indent_stack = [0]
+        self.token_count = 0
+        if s is None:
+            s = ""
+        if not s.endswith("\n"):
+            s = s + "\n"
+        self.lexdata = s
+        self.path = None
+        self.first_line = lineno
+        self._lines = None
+        self._start(self._scan(((0, s),), lineno, add_endmarker), lineno)
+
+    def input_file(self, path, add_endmarker=True, lineno=1, encoding="utf-8", chunk_size=CHUNK_SIZE):
+        """
+        Like input(open(path).read()) with the same tokens and positions, but
+        the file is read chunk_size characters at a time as tokens are taken.
+        """
+        self.errors = []
+        self.indent_stack = [0]
+        self.token_count = 0
+        self.lexdata = None
+        self.path = path
+        self.encoding = encoding
+        self.first_line = lineno
+        self._lines = None
+        self._start(self._scan_file(path, encoding, chunk_size, lineno, add_endmarker), lineno)
+
+    def _start(self, tokens, lineno):
+        if self.structure is not None:
+            self.structure.first_line = lineno
+            tokens = self.structure.scan(tokens)
+        self._next = tokens.__next__
+
+    def _scan_file(self, path, encoding, chunk_size, lineno, add_endmarker):
+        with open(path, "r", encoding=encoding) as f:
+            yield from self._scan(line_chunks(f, chunk_size), lineno, add_endmarker)
+
+    def stream(self, s, add_endmarker=True, lineno=1):
+        """Lexes s and returns an iterator over its tokens, ENDMARKER included."""
+        self.input(s, add_endmarker=add_endmarker, lineno=lineno)
+        return iter(self.token, None)
+
+    def token(self):
+        try:
+            tok = self._next()
+        except StopIteration:
+            return None
+        self.token_count += 1
+        return tok
+
+    def _scan(self, chunks, lineno, add_endmarker):
+        """Tokens of the (offset, text) pieces of the input; every piece ends at the end of a line."""
+        match = _MASTER.match
+        operators = _OPERATORS
+        reserved = _RESERVED
+        intern = sys.intern
+        report = self._report
+        new = Token
+        NO_INDENT, MIGHT_INDENT, MUST_INDENT = Lexer.NO_INDENT, Lexer.MIGHT_INDENT, Lexer.MUST_INDENT
+        stack = self.indent_stack = [0]
+        at_line_start = True
+        indent_state = NO_INDENT
+        depth = 0
+        pending = False      # the current line started with whitespace
+        last_lineno = lineno
+        base = end = 0
+
+        for base, text in chunks:
+            pos = 0
+            end = len(text)
+            while pos < end:
+                m = match(text, pos)
+                if m is None:
+                    c = text[pos]
+                    if c == " " or c == "\t":
+                        # whitespace in front of an illegal character
+                        ws = pos
+                        while pos < end and text[pos] in " \t":
+                            pos += 1
+                        if at_line_start:
+                            depth = pos - ws
+                            pending = True
+                        continue
+                    report(f"Illegal character '{c}' at line {lineno}, column {self.lines.column(base + pos)}")
+                    pos += 1
+                    continue
+                kind = m.lastgroup
+                start = m.start(kind)
+                if start != pos and at_line_start:
+                    depth = start - pos
+                    pending = True
+                pos = m.end()
+
+                if kind == "NEWLINE":
+                    last_lineno = lineno
+                    tok = new()
+                    tok.type = "NEWLINE"
+                    tok.value = text[start:pos]
+                    tok.lineno = lineno
+                    tok.lexpos = base + start
+                    tok.endlexpos = base + pos
+                    yield tok
+                    lineno += pos - start
+                    at_line_start = True
+                    if indent_state != NO_INDENT:
+                        indent_state = MUST_INDENT
+                    depth = 0
+                    pending = False
+                    continue
+
+                value = text[start:pos]
+                if kind == "OP":
+                    kind = operators[value]
+                last_lineno = lineno
+                line_start = at_line_start
+                must_indent = False
+                if kind == "COLON" or kind == "LKEY":
+                    indent_state = MIGHT_INDENT
+                else:
+                    must_indent = indent_state == MUST_INDENT
+                    indent_state = NO_INDENT
+                at_line_start = False
+
+                if pending:
+                    pending = False
+                    if must_indent:
+                        if depth <= stack[-1]:
+                            report(f"Indentation Error at line {lineno}: Block must be indented")
+                        else:
+                            stack.append(depth)
+                            yield _make("INDENT", "INDENT", lineno, base + start)
+                    elif line_start:
+                        if depth > stack[-1]:
+                            report(f"Indentation Error at line {lineno}: Unexpected indentation increase")
+                        else:
+                            while depth < stack[-1]:
+                                yield _make("DEDENT", "DEDENT", lineno, base + start)
+                                stack.pop()
+                            if depth != stack[-1]:
+                                report(f"Indentation Error at line {lineno}: Inconsistent indentation")
+                elif line_start:
+                    while stack[-1] > 0:
+                        yield _make("DEDENT", "DEDENT", lineno, base + start)
+                        stack.pop()
+
+                if kind == "ID":
+                    value = intern(value)
+                    kind = reserved.get(value.lower(), "ID")
+                elif kind == "NUMBER":
+                    value = int(value)
+                elif kind == "DECIMAL":
+                    value = float(value)
+                elif kind == "COMMENT":
+                    continue
+                tok = new()
+                tok.type = kind
+                tok.value = value
+                tok.lineno = lineno
+                tok.lexpos = base + start
+                tok.endlexpos = base + pos
+                yield tok
+
+        end += base
+        while len(stack) > 1:
+            yield _make("DEDENT", "DEDENT", last_lineno, end)
+            stack.pop()
+        self.lineno = lineno
+        if add_endmarker:
+            yield _make("ENDMARKER", "ENDMARKER", lineno, end)
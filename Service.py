@@ -0,0 +1,489 @@
+# Service.py - the parser as a local JSON-RPC service
+#
+#   python Service.py [--socket PATH | --port N] [-j N] [--max-pending N] [--timeout S] ...
+#
+# Editors and build tools send JSON-RPC 2.0 requests, one JSON object per
+# line, over stdin/stdout (the default), a Unix socket or a localhost port,
+# and get one line back per request, in the order they finish:
+#
+#   {"jsonrpc": "2.0", "id": 1, "method": "check", "params": {"text": "x = (1\n", "uri": "a.py"}}
+#
+# Methods: check (status, token count and errors, as in Batch.py), parse
+# (the same plus the tree as Parser.tree_entries() rows), tokenize, stats
+# and shutdown (answered once the connection's other requests are), plus
+# the notification $/cancelRequest {"id": ...}.
+#
+# The asyncio loop only reads, schedules and writes. Parses run on a pool of
+# processes that each build one Parser up front (as in Batch.py), and come
+# back already encoded as JSON.
+# - Results are kept by a hash of the method and text, and a request for a
+#   text that is already being worked on waits for that job instead of
+#   starting another.
+# - A request with a "uri" cancels the earlier request of the same method
+#   for that uri on the same connection, which gets error -32800. A job a
+#   worker has already started runs to the end (--timeout bounds it), but
+#   nobody waits for it.
+# - At most --max-pending requests are queued or running at once. Past that
+#   the service stops reading, so a client that keeps sending blocks.
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import Batch
+
+METHODS = ("parse", "tokenize", "check")
+MAX_MESSAGE = 64 << 20   # longest message line, in bytes
+
+# JSON-RPC error codes; -32800 is the one LSP uses for cancelled requests
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+REQUEST_CANCELLED = -32800
+
+
+class RPCError(Exception):
+    """An error response, raised by Client.call(): code is one of the codes above."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{message} ({code})")
+        self.code = code
+        self.message = message
+
+
+def _work(method, text):
+    """
+    Runs in a worker: the result of method on text, encoded as JSON, and
+    whether the parse stopped on a budget.
+    """
+    if method == "tokenize":
+        lexer = Batch._parser.lexer
+        lexer.input(text)
+        tokens = [[t.type, t.value, t.lineno, t.lexpos, t.endlexpos] for t in iter(lexer.token, None)]
+        result = {"tokens": tokens, "errors": [Batch._error_entry(msg) for msg in lexer.errors]}
+    else:
+        result = Batch.check_source(text, tree=method == "parse")
+    return json.dumps(result), "stopped" in result
+
+
+def _ready():
+    return os.getpid()
+
+
+def _response(id_, result_json):
+    return '{"jsonrpc": "2.0", "id": %s, "result": %s}\n' % (json.dumps(id_), result_json)
+
+
+def _error(id_, code, message):
+    return json.dumps({"jsonrpc": "2.0", "id": id_, "error": {"code": code, "message": message}}) + "\n"
+
+
+class _StdoutWriter(object):
+    """The bits of StreamWriter the service uses, over sys.stdout (which may be a regular file)."""
+
+    def __init__(self, out):
+        self.out = out
+        self.closed = False
+
+    def write(self, data):
+        self.out.write(data)
+        self.out.flush()
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class _Connection(object):
+    __slots__ = ("writer", "lock", "answers", "requests", "documents")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.lock = asyncio.Lock()
+        self.answers = set()  # tasks that will answer the requests read so far
+        self.requests = {}    # request id -> the future of its result
+        self.documents = {}   # (method, uri) -> the future of its latest request
+
+
+class Service(object):
+    """
+    start(path=None, port=None) listens on a Unix socket, or on a localhost
+    port (0 picks a free one), and returns the address; serve_stdio() answers
+    on stdin/stdout until stdin ends. workers processes (all cores by
+    default) each build a Parser with limits; max_pending bounds the requests
+    queued or running at once (4 per worker by default) and max_entries the
+    results kept for repeated texts.
+    """
+
+    def __init__(self, workers=None, max_pending=None, max_entries=256, cache_dir=None, limits=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.limits = limits
+        self.pool = None
+        self.server = None
+        self.address = None
+        self.counts = dict.fromkeys(("requests", "jobs", "hits", "shared", "cancelled", "failed"), 0)
+        self.pending = 0
+        self.peak_pending = 0
+        self._results = OrderedDict()   # hash -> result JSON
+        self._jobs = {}                 # hash -> [future, requests waiting for it]
+        self._connections = set()
+        self._slots = None
+        self._closed = None
+
+    def stats(self):
+        return dict(self.counts, pending=self.pending, peak_pending=self.peak_pending,
+                    entries=len(self._results), workers=self.workers)
+
+    async def open(self):
+        """Starts the worker processes and waits until they have built their parsers."""
+        if self.pool is not None:
+            return
+        # build the tables once up front so workers only ever load them
+        import Parser
+        Parser.Parser(cache_dir=self.cache_dir).build()
+
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._closed = asyncio.Event()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=Batch._init_worker,
+                                        initargs=(self.cache_dir, self.limits))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _ready) for _ in range(self.workers)))
+
+    async def start(self, path=None, port=None, host="127.0.0.1"):
+        await self.open()
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._serve, path, limit=MAX_MESSAGE)
+            self.address = path
+        else:
+            self.server = await asyncio.start_server(self._serve, host, port or 0, limit=MAX_MESSAGE)
+            self.address = self.server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def serve_stdio(self, stdin=None, stdout=None):
+        await self.open()
+        stdin = stdin or sys.stdin.buffer
+        reader = asyncio.StreamReader(limit=MAX_MESSAGE)
+        try:
+            await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+        except ValueError:
+            # a regular file: there is nothing to wait for, read it all
+            reader.feed_data(stdin.read())
+            reader.feed_eof()
+        await self._serve(reader, _StdoutWriter(stdout or sys.stdout.buffer))
+
+    async def wait_closed(self):
+        await self._closed.wait()
+
+    def close(self):
+        """Stops listening, drops the connections and shuts the workers down."""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            if isinstance(self.address, str):
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+        for conn in list(self._connections):
+            for work in list(conn.requests.values()):
+                work.cancel()
+            conn.writer.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        if self._closed is not None:
+            self._closed.set()
+
+    async def _serve(self, reader, writer):
+        conn = _Connection(writer)
+        self._connections.add(conn)
+        answers = conn.answers
+        try:
+            while not self._closed.is_set():
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(conn, _error(None, INVALID_REQUEST, f"message over {MAX_MESSAGE} bytes"))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    answer = await self._dispatch(conn, line)
+                    if answer is not None:
+                        answers.add(answer)
+                        answer.add_done_callback(answers.discard)
+        except ConnectionError:
+            for work in list(conn.requests.values()):
+                work.cancel()
+        # stdin may end right after the last request: answer it before leaving
+        if answers:
+            await asyncio.wait(answers)
+        self._connections.discard(conn)
+        writer.close()
+
+    async def _dispatch(self, conn, line):
+        """Handles one message; returns the task that will answer it, if there is one."""
+        try:
+            msg = json.loads(line)
+        except ValueError as e:
+            await self._send(conn, _error(None, PARSE_ERROR, f"invalid JSON: {e}"))
+            return None
+        if not isinstance(msg, dict) or not isinstance(msg.get("method"), str):
+            await self._send(conn, _error(None, INVALID_REQUEST, "not a JSON-RPC request"))
+            return None
+        method, params, id_ = msg["method"], msg.get("params", {}), msg.get("id")
+        if id_ is not None and (type(id_) is bool or not isinstance(id_, (str, int))):
+            await self._send(conn, _error(None, INVALID_REQUEST, "id must be a string or an integer"))
+            return None
+        if not isinstance(params, dict):
+            if id_ is not None:
+                await self._send(conn, _error(id_, INVALID_PARAMS, "params must be an object"))
+            return None
+
+        if method == "$/cancelRequest":
+            work = conn.requests.get(params.get("id"))
+            if work is not None:
+                work.cancel()
+            return None
+        if id_ is None:
+            return None   # other notifications mean nothing here
+        if method == "stats":
+            await self._send(conn, _response(id_, json.dumps(self.stats())))
+            return None
+        if method == "shutdown":
+            # stop reading everywhere, answer what this connection asked for, then close
+            self._closed.set()
+            if self.server is not None:
+                self.server.close()
+            return asyncio.ensure_future(self._shutdown(conn, id_, list(conn.answers)))
+        if method not in METHODS:
+            await self._send(conn, _error(id_, METHOD_NOT_FOUND, f"unknown method {method!r}"))
+            return None
+        text, uri = params.get("text"), params.get("uri")
+        if not isinstance(text, str) or not isinstance(uri, (str, type(None))):
+            await self._send(conn, _error(id_, INVALID_PARAMS, "params.text must be a string (and uri too, if given)"))
+            return None
+
+        self.counts["requests"] += 1
+        document = (method, uri)
+        if uri is not None:
+            stale = conn.documents.get(document)
+            if stale is not None:
+                stale.cancel()
+        # stop reading while the service is full
+        await self._slots.acquire()
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+
+        work = asyncio.ensure_future(self._result(method, text))
+        conn.requests[id_] = work
+        if uri is not None:
+            conn.documents[document] = work
+
+        def forget(_):
+            if conn.requests.get(id_) is work:
+                del conn.requests[id_]
+            if conn.documents.get(document) is work:
+                del conn.documents[document]
+
+        work.add_done_callback(forget)
+        # the answer task itself is never cancelled, so it always frees its slot
+        return asyncio.ensure_future(self._answer(conn, id_, work))
+
+    async def _answer(self, conn, id_, work):
+        try:
+            try:
+                result = await work
+            except asyncio.CancelledError:
+                self.counts["cancelled"] += 1
+                message = _error(id_, REQUEST_CANCELLED, "request cancelled")
+            except Exception as e:
+                self.counts["failed"] += 1
+                message = _error(id_, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+            else:
+                message = _response(id_, result)
+            await self._send(conn, message)
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    async def _shutdown(self, conn, id_, answers):
+        if answers:
+            await asyncio.wait(answers)
+        await self._send(conn, _response(id_, "null"))
+        self.close()
+
+    async def _result(self, method, text):
+        """The result JSON of method on text: kept from before, shared with the same job, or computed."""
+        key = hashlib.sha256(f"{method}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            self.counts["hits"] += 1
+            return result
+        job = self._jobs.get(key)
+        if job is None:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, _work, method, text)
+            job = self._jobs[key] = [future, 0]
+            future.add_done_callback(lambda f: self._finished(key, f))
+            self.counts["jobs"] += 1
+        else:
+            self.counts["shared"] += 1
+        job[1] += 1
+        try:
+            result, _ = await asyncio.shield(job[0])
+            return result
+        finally:
+            job[1] -= 1
+            if not job[1] and not job[0].done():
+                job[0].cancel()   # nobody wants it any more
+
+    def _finished(self, key, future):
+        if self._jobs.get(key, (None,))[0] is future:
+            del self._jobs[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        result, stopped = future.result()
+        if not stopped:
+            # a parse that ran out of a budget (maybe time, so load) isn't the
+            # answer for this text, like in ParseCache
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    async def _send(self, conn, message):
+        if conn.writer.is_closing():
+            return   # the client went away
+        try:
+            async with conn.lock:
+                conn.writer.write(message.encode("utf-8"))
+                await conn.writer.drain()
+        except (ConnectionError, BrokenPipeError):
+            pass
+
+
+class Client(object):
+    """
+    A small client, for tests, benchmarks and scripts:
+
+        client = await Client.connect(port=service.address[1])   # or path=...
+        result = await client.call("check", text=source, uri="a.py")
+        await client.close()
+
+    call() raises RPCError for an error response. send() returns
+    (id, future) without waiting, so the request can be cancel()ed.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._next_id = 0
+        self._waiting = {}   # request id -> future of its result
+        self._reading = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, path=None, port=None, host="127.0.0.1"):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=MAX_MESSAGE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE)
+        return cls(reader, writer)
+
+    async def _read(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                future = self._waiting.pop(msg.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in msg:
+                    future.set_exception(RPCError(msg["error"]["code"], msg["error"]["message"]))
+                else:
+                    future.set_result(msg.get("result"))
+        except ConnectionError:
+            pass
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError("the service closed the connection"))
+        self._waiting.clear()
+
+    def send(self, method, **params):
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[self._next_id] = future
+        self._write({"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params})
+        return self._next_id, future
+
+    async def call(self, method, **params):
+        _, future = self.send(method, **params)
+        await self.writer.drain()
+        return await future
+
+    def notify(self, method, **params):
+        self._write({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def cancel(self, id_):
+        self.notify("$/cancelRequest", id=id_)
+
+    def _write(self, msg):
+        self.writer.write((json.dumps(msg) + "\n").encode("utf-8"))
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._reading
+
+
+async def _serve(service, args):
+    if args.socket is None and args.port is None:
+        await service.serve_stdio()
+    else:
+        address = await service.start(path=args.socket, port=args.port)
+        print(f"listening on {address}", file=sys.stderr, flush=True)
+        await service.wait_closed()
+    service.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Answer parse, tokenize and check requests as JSON-RPC")
+    where = ap.add_mutually_exclusive_group()
+    where.add_argument("--socket", default=None, help="Unix socket to listen on")
+    where.add_argument("--port", type=int, default=None, help="localhost port to listen on (0: any free one)")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    ap.add_argument("--max-pending", type=int, default=None,
+                    help="requests queued or running at once (default: 4 per worker)")
+    ap.add_argument("--max-entries", type=int, default=256, help="results kept for repeated texts")
+    ap.add_argument("--cache-dir", default=None, help="table cache directory")
+    Batch.add_limit_options(ap)
+    args = ap.parse_args(argv)
+
+    service = Service(args.jobs, args.max_pending, args.max_entries, args.cache_dir, Batch.limits_from(args))
+    try:
+        asyncio.run(_serve(service, args))
+    except KeyboardInterrupt:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
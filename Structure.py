@@ -0,0 +1,165 @@
+# Structure.py - bracket pairs, line starts and blocks of a token stream
+#
+#   lexer.structure = Structure.StructureIndex()
+#   parser.parse(source)            # or lexer.input(...) and read the tokens
+#   lexer.structure.match(offset)   # the bracket paired with the one at offset
+#
+# A lexer with a `structure` fills it in while it lexes (the same pass the
+# parser reads tokens from), so tools can jump between brackets, to the end
+# of a block, fold blocks or list unmatched brackets without lexing again.
+# Everything is kept in arrays of offsets, so the index stays small next to
+# the source.
+import bisect
+from array import array
+
+import Lexer
+
+OPENERS = {"LPAREN": "(", "LBRACKET": "[", "LKEY": "{"}
+CLOSERS = {"RPAREN": ("LPAREN", ")"), "RBRACKET": ("LBRACKET", "]"), "RKEY": ("LKEY", "}")}
+
+
+class StructureIndex(object):
+    """
+    Filled in by scan(tokens):
+      line_starts           offset of every line (NEWLINE tokens hold every newline)
+      opens / closes        offset of every opening bracket, in order, and of
+                            its closing one (-1 when it is never closed)
+      block_header          offset of the first token of the line that opens a block
+      block_start / _end    where its INDENT and DEDENT are (the body's first
+                            token, and the token after the block)
+      block_last            end offset of the body's last token
+      block_parent          the enclosing block, or -1
+      errors                unmatched and mismatched brackets, like lexer errors
+    Blocks are numbered in the order they start. Dict literals written over
+    several lines are blocks too, since the lexer indents them.
+    """
+
+    def __init__(self, first_line=1):
+        self.first_line = first_line
+        self.reset()
+
+    def reset(self):
+        self.line_starts = array("q", [0])
+        self.opens = array("q")
+        self.closes = array("q")
+        self.close_order = array("q")   # closing offsets in source order, for match()
+        self.close_opener = array("q")  # ... and the index in opens of each one's opener
+        self.block_header = array("q")
+        self.block_start = array("q")
+        self.block_end = array("q")
+        self.block_last = array("q")
+        self.block_parent = array("q")
+        self.errors = []
+        self._found = []
+        self._lines = None
+
+    def scan(self, tokens):
+        """Yields tokens unchanged, indexing them on the way."""
+        self.reset()
+        line_starts = self.line_starts
+        opens, closes = self.opens, self.closes
+        close_order, close_opener = self.close_order, self.close_opener
+        block_header, block_start = self.block_header, self.block_start
+        block_end, block_last, block_parent = self.block_end, self.block_last, self.block_parent
+        openers, closers = OPENERS, CLOSERS
+        brackets = []       # (type, index in opens) of the open brackets
+        blocks = []         # indexes of the open blocks
+        line_start = True
+        line_first = 0      # offset of the first token of the current line
+        header = 0          # ... of the line before the last NEWLINE
+        last_end = 0        # end offset of the last real token
+
+        for tok in tokens:
+            t = tok.type
+            if t == "NEWLINE":
+                start = tok.lexpos
+                line_starts.extend(range(start + 1, start + len(tok.value) + 1))
+                if not line_start:
+                    header = line_first
+                line_start = True
+            elif t == "INDENT":
+                block_header.append(header)
+                block_start.append(tok.lexpos)
+                block_end.append(-1)
+                block_last.append(-1)
+                block_parent.append(blocks[-1] if blocks else -1)
+                blocks.append(len(block_start) - 1)
+            elif t == "DEDENT":
+                if blocks:
+                    b = blocks.pop()
+                    block_end[b] = tok.lexpos
+                    block_last[b] = last_end
+            elif t != "ENDMARKER":
+                if line_start:
+                    line_first = tok.lexpos
+                    line_start = False
+                last_end = tok.endlexpos
+                if t in openers:
+                    brackets.append((t, len(opens)))
+                    opens.append(tok.lexpos)
+                    closes.append(-1)
+                elif t in closers:
+                    expected, text = closers[t]
+                    if not brackets:
+                        self._error(f"Unmatched '{text}'", tok.lexpos)
+                    else:
+                        opener, i = brackets.pop()
+                        if opener != expected:
+                            self._error(f"Mismatched '{text}'", tok.lexpos,
+                                        f" (the '{openers[opener]}' at {self._where(opens[i])} is still open)")
+                        else:
+                            closes[i] = tok.lexpos
+                            close_order.append(tok.lexpos)
+                            close_opener.append(i)
+            yield tok
+
+        for opener, i in brackets:
+            self._error(f"'{openers[opener]}' never closed", opens[i])
+        self._found.sort(key=lambda e: e[0])
+        self.errors = [msg for _, msg in self._found]
+
+    def _error(self, msg, offset, note=""):
+        # (offset, message), sorted into self.errors once the scan is done
+        self._found.append((offset, f"{msg} at {self._where(offset)}{note}"))
+
+    def _where(self, offset):
+        # line_starts is complete up to the token being scanned
+        i = bisect.bisect_right(self.line_starts, offset) - 1
+        return f"line {i + self.first_line}, column {offset - self.line_starts[i] + 1}"
+
+    @property
+    def lines(self):
+        """A Lexer.LineIndex over line_starts."""
+        if self._lines is None:
+            self._lines = Lexer.LineIndex.__new__(Lexer.LineIndex)
+            self._lines.starts = self.line_starts
+            self._lines.first_line = self.first_line
+        return self._lines
+
+    def match(self, offset):
+        """The offset of the bracket paired with the one at offset, or None."""
+        i = bisect.bisect_left(self.opens, offset)
+        if i < len(self.opens) and self.opens[i] == offset:
+            return self.closes[i] if self.closes[i] >= 0 else None
+        i = bisect.bisect_left(self.close_order, offset)
+        if i < len(self.close_order) and self.close_order[i] == offset:
+            return self.opens[self.close_opener[i]]
+        return None
+
+    def block_at(self, offset):
+        """The innermost block whose body contains offset, or -1."""
+        b = bisect.bisect_right(self.block_start, offset) - 1
+        while b >= 0 and 0 <= self.block_end[b] <= offset:
+            b = self.block_parent[b]
+        return b
+
+    def block_end_of(self, offset):
+        """Where the innermost block around offset ends (the offset after it), or None."""
+        b = self.block_at(offset)
+        return self.block_end[b] if b >= 0 else None
+
+    def folds(self):
+        """(first line, last line) of every block, header line included, in order."""
+        line = self.lines.line
+        return [(line(self.block_header[b]), line(max(self.block_last[b] - 1, self.block_start[b])))
+                for b in range(len(self.block_start))]
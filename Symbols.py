@@ -0,0 +1,271 @@
+# Symbols.py - name resolution for Parser.Node trees
+#
+#   python Symbols.py program.py
+#
+# analyze(tree) builds one Scope per function plus the module scope, gives
+# every name bound in a scope a dense slot number (parameters first, then
+# the other names in the order they are first bound) and resolves every
+# identifier and named call to a Symbol: a local or captured slot of a
+# function, a global slot of the module, a builtin, or undefined.
+#
+# Trees may be shared (ParseCache), so nothing is written on the nodes:
+# SymbolTable.lookup(node) finds the Symbol of a node instead.
+import argparse
+import builtins
+import gc
+import sys
+
+from Parser import Node
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+LOCAL, FREE, GLOBAL, BUILTIN, UNDEFINED = "local", "free", "global", "builtin", "undefined"
+
+
+class Scope(object):
+    """
+    The names of the module or of one function. slots maps every name
+    bound here to its slot; cells are the ones nested functions capture,
+    and frees the captured names of enclosing functions used here or in a
+    function nested in this one.
+    """
+    __slots__ = ("name", "node", "parent", "children", "slots", "params", "cells", "frees", "used",
+                 "_pending")
+
+    def __init__(self, name, node, parent):
+        self.name = name
+        self.node = node
+        self.parent = parent
+        self.children = []
+        self.slots = {}
+        self.params = []
+        self.cells = set()
+        self.frees = set()
+        self.used = set()
+        self._pending = []   # (name, node, scope it appears in) still to resolve
+
+    def is_function(self):
+        return self.parent is not None
+
+    def bind(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+
+    def __repr__(self):
+        return f"<scope {self.name}, {len(self.slots)} slots>"
+
+
+class Symbol(object):
+    """What a name refers to: kind is local, free, global, builtin or undefined."""
+    __slots__ = ("name", "kind", "scope", "slot")
+
+    def __init__(self, name, kind, scope=None, slot=None):
+        self.name = name
+        self.kind = kind
+        self.scope = scope   # the Scope that owns the slot (None for builtins and undefined names)
+        self.slot = slot
+
+    def __repr__(self):
+        where = f" {self.scope.name}[{self.slot}]" if self.scope is not None else ""
+        return f"<{self.kind} {self.name}{where}>"
+
+
+class SymbolTable(object):
+    """
+    The result of analyze(): the module Scope, every Scope in the order it
+    starts in the source, the Symbol of every identifier and named call,
+    undefined names and for targets that can't be assigned to (errors), and
+    unused parameters (warnings).
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.scopes = [module]
+        self.refs = {}
+        self.functions = {}   # id(function_def node) -> Scope
+        self.undefined = []   # identifier / call nodes
+        self.unused = []      # (parameter node, its function's Scope)
+        self.bad_targets = []  # for target nodes that can't be assigned to
+        self.errors = []
+        self.warnings = []
+
+    def lookup(self, node):
+        """The Symbol of an identifier or call node (None for anything else)."""
+        return self.refs.get(id(node))
+
+    def scope_of(self, function_def):
+        """The Scope of a function_def node."""
+        return self.functions.get(id(function_def))
+
+
+def _where(node, lines):
+    if lines is None or node.start is None:
+        return ""
+    line, column = lines.position(node.start)
+    return f" at line {line}, column {column}"
+
+
+def analyze(tree, lines=None):
+    """
+    Resolves the names of a module tree in one pass over it. lines (e.g.
+    parser.lexer.lines) adds positions to the messages.
+
+    A name bound anywhere in a function is local to all of it, so references
+    wait in their scope until it ends and are resolved there, or handed to
+    the enclosing scope.
+    """
+    module = Scope("<module>", tree, None)
+    table = SymbolTable(module)
+    if tree is None:
+        return table
+    # like BinaryAST.loads: collecting while a Symbol per name is created
+    # only rescans the tree
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _walk(tree, table)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    def position(node):
+        return node.start if node.start is not None else -1
+    table.undefined.sort(key=position)
+    table.unused.sort(key=lambda item: position(item[0]))
+    table.bad_targets.sort(key=position)
+    errors = [(position(node), f"Undefined name '{node.value}'{_where(node, lines)}")
+              for node in table.undefined]
+    errors.extend((position(node), f"Cannot assign to {node.type}{_where(node, lines)}")
+                  for node in table.bad_targets)
+    errors.sort(key=lambda item: item[0])
+    table.errors = [msg for _, msg in errors]
+    table.warnings = [f"Unused parameter '{param.value}' of {scope.name}{_where(param, lines)}"
+                      for param, scope in table.unused]
+    return table
+
+
+def _walk(tree, table):
+    """The pass itself: binds names as it goes and closes every scope where it ends."""
+    module = table.module
+    refs = table.refs
+    exit_ = object()
+    work = [(tree, module)]
+    while work:
+        node, scope = work.pop()
+        if node is exit_:
+            _close(scope, table)
+            continue
+        if isinstance(node, list):
+            work.extend((item, scope) for item in reversed(node))
+            continue
+        if not isinstance(node, Node):
+            continue
+        t = node.type
+        if t == "identifier":
+            scope._pending.append((node.value, node, scope))
+            continue
+        if t == "function_def" and node is not scope.node:
+            scope.bind(node.value)
+            params, body = node.children
+            inner = Scope(node.value, node, scope)
+            scope.children.append(inner)
+            table.scopes.append(inner)
+            table.functions[id(node)] = inner
+            for param in params.children:
+                inner.params.append(param)
+                inner.bind(param.value)
+            work.append((exit_, inner))
+            work.append((body, inner))
+            # defaults belong to the enclosing scope
+            work.extend((c, scope) for param in reversed(params.children) for c in param.children)
+            continue
+        if t == "assignment":
+            scope.bind(node.value)
+        elif t == "call" and node.value is not None:
+            scope._pending.append((node.value, node, scope))
+        elif t == "for":
+            bad = _bind_target(node.children[0], scope, refs)
+            table.bad_targets.extend(bad)
+            work.extend((c, scope) for c in reversed(node.children[1:]))
+            # names read in a target that can't be assigned to are still references
+            work.extend((c, scope) for c in reversed(bad))
+            continue
+        work.extend((c, scope) for c in reversed(node.children))
+    _close(module, table)
+
+
+def _bind_target(target, scope, refs):
+    """Binds the names in a for target; returns the parts of it that aren't names, tuples or lists."""
+    if target.type == "identifier":
+        scope.bind(target.value)
+        refs[id(target)] = Symbol(target.value, LOCAL if scope.is_function() else GLOBAL,
+                                  scope, scope.slots[target.value])
+        return []
+    if target.type in ("tuple", "list"):
+        bad = []
+        for item in target.children:
+            bad.extend(_bind_target(item, scope, refs))
+        return bad
+    return [target]
+
+
+def _close(scope, table):
+    """Resolves the references waiting in scope now that all its bindings are known."""
+    refs = table.refs
+    slots = scope.slots
+    if scope.is_function():
+        parent = scope.parent
+        for ref in scope._pending:
+            name, node, origin = ref
+            slot = slots.get(name)
+            if slot is None:
+                parent._pending.append(ref)
+                continue
+            scope.used.add(name)
+            if origin is scope:
+                refs[id(node)] = Symbol(name, LOCAL, scope, slot)
+            else:
+                scope.cells.add(name)
+                refs[id(node)] = Symbol(name, FREE, scope, slot)
+                while origin is not scope:
+                    origin.frees.add(name)
+                    origin = origin.parent
+        scope._pending = []
+        for param in scope.params:
+            if param.value not in scope.used:
+                table.unused.append((param, scope))
+        return
+    for name, node, origin in scope._pending:
+        slot = slots.get(name)
+        if slot is not None:
+            refs[id(node)] = Symbol(name, GLOBAL, scope, slot)
+        elif name in BUILTIN_NAMES:
+            refs[id(node)] = Symbol(name, BUILTIN)
+        else:
+            refs[id(node)] = Symbol(name, UNDEFINED)
+            table.undefined.append(node)
+    scope._pending = []
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Scopes, slots and name errors of a Fangless Python program")
+    ap.add_argument("file")
+    args = ap.parse_args(argv)
+    with open(args.file, "r", encoding="utf-8") as f:
+        source = f.read()
+    from Parser import Parser
+    parser = Parser()
+    parser.build()
+    tree = parser.parse(source)
+    table = analyze(tree, parser.lexer.lines)
+    for scope in table.scopes:
+        names = ", ".join(f"{slot}:{name}" + ("*" if name in scope.cells else "")
+                          for name, slot in scope.slots.items())
+        print(f"{scope.name}: {names}")
+    for msg in parser.lexer.errors + parser.errors + table.errors + table.warnings:
+        print(msg)
+    return 1 if table.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# Helpers shared by Lexer.py and Parser.py to keep PLY's generated tables in a
+# cache directory instead of rebuilding them on every start.
+import hashlib
+import os
+import tempfile
+
+CACHE_ENV = "FANGLESS_CACHE_DIR"
+
+
+def resolve_cache_dir(cache_dir=None):
+    """
+    Returns the directory used for cached tables: the explicit argument,
+    then $FANGLESS_CACHE_DIR, then .fangless_cache next to this file.
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_ENV)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fangless_cache")
+    return cache_dir
+
+
+def fingerprint(*parts):
+    """Stable short hash of the repr of every part."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def ensure_dir(cache_dir):
+    """Creates cache_dir if needed. Returns False when it cannot be used."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(cache_dir, os.W_OK)
+
+
+def temp_path(cache_dir, prefix, suffix):
+    """
+    Reserves a private file inside cache_dir. Every process writes its own
+    temporary file, so concurrent builders never see each other's halves.
+    """
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=cache_dir)
+    os.close(fd)
+    return path
+
+
+def publish(tmp, final):
+    """
+    Atomically moves a finished table into place. Returns False (and removes
+    the temporary file) when the table could not be written.
+    """
+    try:
+        if os.path.getsize(tmp) == 0:
+            raise OSError("empty table file")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, final)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
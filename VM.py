@@ -0,0 +1,302 @@
+# VM.py - a stack machine for the Code objects of Bytecode.py
+#
+#   python VM.py program.py [--dis]
+#
+# Fangless calls don't recurse in Python: every call pushes a frame on the
+# VM's own frame list, so deep Fangless recursion is limited by
+# sys.getrecursionlimit() frames instead of by the C stack. Values are plain
+# Python objects and builtins (print, len, iter, ...) are Python's own.
+# This runs trusted programs; it is not a sandbox.
+import argparse
+import builtins
+import operator
+import sys
+
+import Bytecode
+from Bytecode import (
+    LOAD_CONST, LOAD_FAST, STORE_FAST, LOAD_GLOBAL, STORE_GLOBAL,
+    LOAD_DEREF, STORE_DEREF, LOAD_CLOSURE, BINARY, COMPARE,
+    UNARY_NEG, UNARY_NOT, JUMP, POP_JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP, CALL, RETURN, POP, BUILD_LIST, BUILD_TUPLE,
+    BUILD_SET, BUILD_DICT, SUBSCR, BUILD_SLICE, LOAD_ATTR, GET_ITER,
+    FOR_ITER, UNPACK, MAKE_FUNCTION,
+)
+
+BUILTINS = vars(builtins)
+
+# same order as Bytecode.BINARY_OPS / COMPARE_OPS
+BINARY_FUNCS = (operator.add, operator.sub, operator.mul, operator.truediv,
+                operator.floordiv, operator.mod, operator.pow)
+COMPARE_FUNCS = (operator.eq, operator.ne, operator.lt, operator.gt, operator.le, operator.ge,
+                 lambda a, b: a in b, operator.is_)
+
+
+class _Unbound(object):
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<unbound>"
+
+
+UNBOUND = _Unbound()  # a local that hasn't been assigned yet
+
+
+class Cell(object):
+    """A local shared with nested functions."""
+    __slots__ = ("value",)
+
+    def __init__(self, value=UNBOUND):
+        self.value = value
+
+
+class Function(object):
+    """A Fangless function. Calling it from Python (e.g. from a builtin) runs it to completion."""
+    __slots__ = ("code", "defaults", "closure", "globals", "__name__")
+
+    def __init__(self, code, defaults, closure, globals):
+        self.code = code
+        self.defaults = defaults
+        self.closure = closure
+        self.globals = globals
+        self.__name__ = code.name
+
+    def __repr__(self):
+        return f"<function {self.__name__}>"
+
+    def __call__(self, *args):
+        return execute(self, args)
+
+
+def _locals(func, args):
+    """The local slots and cells of a new frame of func called with args."""
+    code = func.code
+    n = len(args)
+    if n != code.argcount:
+        missing = code.argcount - n
+        if missing < 0 or missing > code.ndefaults:
+            raise TypeError(f"{code.name}() takes {code.argcount} arguments but {n} were given")
+        args = list(args) + list(func.defaults[len(func.defaults) - missing:])
+    fast = list(args)
+    fast.extend([UNBOUND] * (len(code.varnames) - code.argcount))
+    cells = None
+    if code.cellvars or code.freevars:
+        cells = [Cell(fast[i]) if i >= 0 else Cell() for i in code.cell_args]
+        cells.extend(func.closure)
+    return fast, cells
+
+
+def execute(func, args=()):
+    """Runs func(*args) and returns its result."""
+    limit = sys.getrecursionlimit()
+    frames = []
+    code = func.code
+    ins = code.program
+    consts = code.consts
+    names = code.names
+    globals_ = func.globals
+    fast, cells = _locals(func, args)
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+
+    while True:
+        op = ins[pc]
+        arg = ins[pc + 1]
+        pc += 2
+
+        # roughly most frequent first
+        if op == LOAD_FAST:
+            value = fast[arg]
+            if value is UNBOUND:
+                raise UnboundLocalError(f"local variable '{code.varnames[arg]}' referenced before assignment")
+            push(value)
+        elif op == LOAD_CONST:
+            push(consts[arg])
+        elif op == BINARY:
+            b = pop()
+            if arg == 0:
+                stack[-1] = stack[-1] + b
+            elif arg == 1:
+                stack[-1] = stack[-1] - b
+            else:
+                stack[-1] = BINARY_FUNCS[arg](stack[-1], b)
+        elif op == STORE_FAST:
+            fast[arg] = pop()
+        elif op == COMPARE:
+            b = pop()
+            stack[-1] = COMPARE_FUNCS[arg](stack[-1], b)
+        elif op == POP_JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == LOAD_GLOBAL:
+            name = names[arg]
+            try:
+                push(globals_[name])
+            except KeyError:
+                try:
+                    push(BUILTINS[name])
+                except KeyError:
+                    raise NameError(f"name '{name}' is not defined") from None
+        elif op == CALL:
+            if arg:
+                call_args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                call_args = []
+            callee = pop()
+            if type(callee) is Function:
+                if len(frames) >= limit:
+                    raise RecursionError("maximum recursion depth exceeded")
+                frames.append((code, ins, consts, names, globals_, fast, cells, stack, pc))
+                code = callee.code
+                if len(call_args) == code.argcount and not code.cell_args and not code.freevars:
+                    # the common case, without _locals()
+                    fast = call_args
+                    if len(code.varnames) > arg:
+                        fast.extend([UNBOUND] * (len(code.varnames) - arg))
+                    cells = None
+                else:
+                    fast, cells = _locals(callee, call_args)
+                ins = code.program
+                consts = code.consts
+                names = code.names
+                globals_ = callee.globals
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            else:
+                push(callee(*call_args))
+        elif op == RETURN:
+            value = pop()
+            if not frames:
+                return value
+            code, ins, consts, names, globals_, fast, cells, stack, pc = frames.pop()
+            push = stack.append
+            pop = stack.pop
+            push(value)
+        elif op == JUMP:
+            pc = arg
+        elif op == POP:
+            pop()
+        elif op == FOR_ITER:
+            try:
+                push(next(stack[-1]))
+            except StopIteration:
+                pop()
+                pc = arg
+        elif op == GET_ITER:
+            stack[-1] = iter(stack[-1])
+        elif op == SUBSCR:
+            index = pop()
+            stack[-1] = stack[-1][index]
+        elif op == LOAD_DEREF:
+            value = cells[arg].value
+            if value is UNBOUND:
+                name = (code.cellvars + code.freevars)[arg]
+                raise NameError(f"free variable '{name}' referenced before assignment")
+            push(value)
+        elif op == STORE_DEREF:
+            cells[arg].value = pop()
+        elif op == STORE_GLOBAL:
+            globals_[names[arg]] = pop()
+        elif op == JUMP_IF_FALSE_OR_POP:
+            if not stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                pop()
+        elif op == UNARY_NEG:
+            stack[-1] = -stack[-1]
+        elif op == UNARY_NOT:
+            stack[-1] = not stack[-1]
+        elif op == LOAD_ATTR:
+            stack[-1] = getattr(stack[-1], names[arg])
+        elif op == BUILD_LIST or op == BUILD_TUPLE or op == BUILD_SET:
+            items = stack[len(stack) - arg:]
+            del stack[len(stack) - arg:]
+            push(items if op == BUILD_LIST else tuple(items) if op == BUILD_TUPLE else set(items))
+        elif op == BUILD_DICT:
+            items = stack[len(stack) - 2 * arg:]
+            del stack[len(stack) - 2 * arg:]
+            push(dict(zip(items[::2], items[1::2])))
+        elif op == BUILD_SLICE:
+            upper = pop()
+            stack[-1] = slice(stack[-1], upper)
+        elif op == UNPACK:
+            items = list(pop())
+            if len(items) != arg:
+                raise ValueError(f"expected {arg} values to unpack, got {len(items)}")
+            items.reverse()
+            stack.extend(items)
+        elif op == LOAD_CLOSURE:
+            push(cells[arg])
+        elif op == MAKE_FUNCTION:
+            inner = consts[arg]
+            closure = pop() if inner.freevars else ()
+            defaults = ()
+            if inner.ndefaults:
+                defaults = tuple(stack[-inner.ndefaults:])
+                del stack[-inner.ndefaults:]
+            push(Function(inner, defaults, closure, globals_))
+        else:
+            raise RuntimeError(f"bad opcode {op} at {pc - 2} in {code.name}")
+
+
+def run(code, globals=None):
+    """Runs a module Code object and returns its globals."""
+    if globals is None:
+        globals = {}
+    execute(Function(code, (), (), globals))
+    return globals
+
+
+def run_source(source, parser=None):
+    """Parses, compiles and runs source. Syntax errors raise Bytecode.CompileError."""
+    if parser is None:
+        from Parser import Parser
+        parser = Parser()
+        parser.build()
+    tree = parser.parse(source)
+    if tree is None or parser.errors or parser.lexer.errors:
+        raise Bytecode.CompileError("; ".join(parser.lexer.errors + parser.errors) or "no tree")
+    return run(Bytecode.compile_tree(tree))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run a Fangless Python program")
+    ap.add_argument("file")
+    ap.add_argument("--dis", action="store_true", help="print the bytecode instead of running it")
+    args = ap.parse_args(argv)
+    with open(args.file, "r", encoding="utf-8") as f:
+        source = f.read()
+    if args.dis:
+        from Parser import Parser
+        parser = Parser()
+        parser.build()
+        tree = parser.parse(source)
+        if tree is None or parser.errors or parser.lexer.errors:
+            print("; ".join(parser.lexer.errors + parser.errors) or "no tree", file=sys.stderr)
+            return 1
+        work = [Bytecode.compile_tree(tree)]
+        while work:
+            code = work.pop(0)
+            print(f"--- {code.name}")
+            Bytecode.disassemble(code, sys.stdout)
+            work.extend(c for c in code.consts if isinstance(c, Bytecode.Code))
+        return 0
+    try:
+        run_source(source)
+    except Bytecode.CompileError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# Visitor.py - walking and rewriting Parser.Node trees
+#
+# Subclass NodeVisitor (or NodeTransformer) and write visit_<type> methods,
+# called before a node's children (pre-order), and leave_<type> methods,
+# called after them (post-order). The methods are looked up once, when the
+# class is created, into a dict from node type to function, so the walk
+# does one dict lookup per node and no getattr. The walk keeps its own
+# stack, so trees of any depth work. A hook for a type that isn't in
+# Parser.NODE_KINDS (a typo) is a TypeError when the class is created.
+#
+#   class Calls(NodeVisitor):
+#       def __init__(self):
+#           self.names = []
+#
+#       def visit_call(self, node):
+#           self.names.append(node.value)
+#
+#       def visit_function_def(self, node):
+#           return SKIP   # not the calls inside functions
+#
+# Transformers change the tree in place; trees shared through ParseCache
+# should be copied first.
+from Parser import NODE_KINDS, Node
+
+
+class _Marker(object):
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+SKIP = _Marker("SKIP")      # from visit_<type>: don't walk the node's children
+REMOVE = _Marker("REMOVE")  # from a NodeTransformer hook: drop the node from its list
+
+
+def _hooks(cls, prefix):
+    """{node type: function} for every prefix<type> method of cls, inherited ones too."""
+    hooks = {name[len(prefix):]: getattr(cls, name) for name in dir(cls)
+             if name.startswith(prefix) and len(name) > len(prefix) and callable(getattr(cls, name))}
+    for kind in hooks:
+        if kind not in NODE_KINDS:
+            raise TypeError(f"{cls.__name__}.{prefix}{kind}: there are no {kind!r} nodes")
+    return hooks
+
+
+class _Leave(object):
+    __slots__ = ("hook", "node", "container", "index")
+
+    def __init__(self, hook, node, container=None, index=None):
+        self.hook = hook
+        self.node = node
+        self.container = container
+        self.index = index
+
+
+class NodeVisitor(object):
+    """
+    visit(tree) walks tree (a Node or a list of them) in source order.
+    visit_<type>(node) may return SKIP to leave the node's children out;
+    leave_<type>(node) runs once they are done. Other return values are
+    ignored. Values that aren't Nodes or lists (a missing slice bound)
+    are passed over.
+    """
+    _dispatch = {}   # node type -> (visit_ function or None, leave_ function or None)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        enter, leave = _hooks(cls, "visit_"), _hooks(cls, "leave_")
+        cls._dispatch = {t: (enter.get(t), leave.get(t)) for t in set(enter) | set(leave)}
+
+    def visit(self, tree):
+        dispatch = self._dispatch.get
+        stack = [tree]
+        pop = stack.pop
+        push = stack.append
+        extend = stack.extend
+        while stack:
+            item = pop()
+            kind = type(item)
+            if kind is Node:
+                hooks = dispatch(item.type)
+                if hooks is not None:
+                    enter, leave = hooks
+                    if enter is not None and enter(self, item) is SKIP:
+                        continue
+                    if leave is not None:
+                        push(_Leave(leave, item))
+                if item.children:
+                    extend(reversed(item.children))
+            elif kind is list:
+                extend(reversed(item))
+            elif kind is _Leave:
+                item.hook(self, item.node)
+        return tree
+
+
+class NodeTransformer(NodeVisitor):
+    """
+    A NodeVisitor whose hooks can replace nodes. visit_<type>(node) returns
+    None to keep the node, SKIP to keep it without walking its children,
+    or a replacement, whose children are walked instead. leave_<type>(node)
+    returns None to keep the node or a replacement. Either may return REMOVE
+    for an item of a list child (a statement of a block, say); it is taken
+    out of the list when the walk ends. visit(tree) returns the new root.
+    """
+
+    def visit(self, tree):
+        dispatch = self._dispatch.get
+        root = [tree]
+        shrunk = {}   # id -> list that had items removed
+        # (list or children holding the item, its index)
+        stack = [(root, 0)]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            entry = pop()
+            if type(entry) is _Leave:
+                new = entry.hook(self, entry.node)
+                if new is not None:
+                    entry.container[entry.index] = new
+                    if new is REMOVE:
+                        shrunk[id(entry.container)] = entry.container
+                continue
+            container, i = entry
+            item = container[i]
+            kind = type(item)
+            if kind is list:
+                for j in range(len(item) - 1, -1, -1):
+                    push((item, j))
+                continue
+            if kind is not Node:
+                continue
+            hooks = dispatch(item.type)
+            if hooks is not None:
+                enter, leave = hooks
+                if enter is not None:
+                    new = enter(self, item)
+                    if new is SKIP:
+                        continue
+                    if new is not None:
+                        container[i] = item = new
+                        if new is REMOVE:
+                            shrunk[id(container)] = container
+                            continue
+                        leave = (dispatch(item.type) or (None, None))[1]
+                if leave is not None:
+                    push(_Leave(leave, item, container, i))
+            children = item.children
+            if children:
+                if type(children) is not list:
+                    children = item.children = list(children)
+                for j in range(len(children) - 1, -1, -1):
+                    push((children, j))
+        shrunk.pop(id(root), None)
+        for items in shrunk.values():
+            items[:] = [item for item in items if item is not REMOVE]
+        return None if root[0] is REMOVE else root[0]